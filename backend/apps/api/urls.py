@@ -1,8 +1,9 @@
-from django.urls import path
+from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 app_name = 'api'
 
 urlpatterns = [
     # Add your API endpoints here
+    path('', include('apps.optimization.urls')),
 ]
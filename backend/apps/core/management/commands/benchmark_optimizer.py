@@ -0,0 +1,152 @@
+"""
+Management command to benchmark the route optimizer.
+"""
+import json
+from django.core.management.base import BaseCommand, CommandError
+from apps.optimization.benchmarks import (
+    compare_evaluators,
+    check_regressions,
+    measure_startup,
+    run_suite,
+    DENSITY_ZONES,
+    SUITE_SIZES,
+    WEB_MODULES,
+)
+from apps.optimization.services.route_optimizer import SOLVER_PRESETS, DEFAULT_PRESET
+
+# Defaults of the evaluators comparison, shared with the legacy flag-style CLI
+EVALUATOR_DEFAULTS = {'sizes': '50,200,500', 'vehicles': 4, 'time_limit': 5, 'seed': 0}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark RouteOptimizer on synthetic Santo Domingo / Santiago instances'
+
+    def add_arguments(self, parser):
+        # Legacy flag-style CLI (before sub-commands): alias for `evaluators`
+        parser.add_argument('--sizes', type=str, dest='legacy_sizes', help='Alias for: evaluators --sizes')
+        parser.add_argument('--vehicles', type=int, dest='legacy_vehicles', help='Alias for: evaluators --vehicles')
+        parser.add_argument('--time-limit', type=int, dest='legacy_time_limit',
+                            help='Alias for: evaluators --time-limit')
+        parser.add_argument('--seed', type=int, dest='legacy_seed', help='Alias for: evaluators --seed')
+
+        subparsers = parser.add_subparsers(dest='command', help='Sub-command help')
+
+        # Evaluators command
+        evaluators_parser = subparsers.add_parser(
+            'evaluators', help='Compare Python callbacks vs native matrix evaluators'
+        )
+        evaluators_parser.add_argument('--sizes', type=str, default=EVALUATOR_DEFAULTS['sizes'],
+                                       help='Comma-separated number of stops per instance (default: 50,200,500)')
+        evaluators_parser.add_argument('--vehicles', type=int, default=EVALUATOR_DEFAULTS['vehicles'],
+                                       help='Number of vehicles (default: 4)')
+        evaluators_parser.add_argument('--time-limit', type=int, default=EVALUATOR_DEFAULTS['time_limit'],
+                                       help='Solver time limit in seconds for each run (default: 5)')
+        evaluators_parser.add_argument('--seed', type=int, default=EVALUATOR_DEFAULTS['seed'],
+                                       help='Random seed (default: 0)')
+
+        # Suite command
+        suite_parser = subparsers.add_parser('suite', help='Run the scaling benchmark suite')
+        suite_parser.add_argument('--sizes', type=str, default=','.join(str(size) for size in SUITE_SIZES),
+                                  help='Comma-separated number of stops per case')
+        suite_parser.add_argument('--preset', type=str, default=DEFAULT_PRESET, choices=list(SOLVER_PRESETS),
+                                  help=f'Solver preset (default: {DEFAULT_PRESET})')
+        suite_parser.add_argument('--region', type=str, default='santo_domingo', choices=list(DENSITY_ZONES),
+                                  help='Synthetic demand region (default: santo_domingo)')
+        suite_parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        suite_parser.add_argument('--output', '-o', type=str, help='Write results as JSON to this file')
+        suite_parser.add_argument('--baseline', type=str,
+                                  help='Previous results JSON; exit with an error on regressions')
+
+        # Startup command
+        startup_parser = subparsers.add_parser(
+            'startup', help='Measure cold-start import time and RSS of a web worker'
+        )
+        startup_parser.add_argument('--modules', type=str, default=','.join(WEB_MODULES),
+                                    help='Comma-separated modules a web worker imports (default: API urls)')
+        startup_parser.add_argument('--repeat', type=int, default=3, help='Fresh processes to measure (default: 3)')
+
+    def handle(self, *args, **options):
+        command = options.get('command')
+
+        if command is None:
+            # Legacy invocation: `benchmark_optimizer [--sizes ...]` compares evaluators
+            legacy = {
+                key: options.get(f'legacy_{key}') if options.get(f'legacy_{key}') is not None else default
+                for key, default in EVALUATOR_DEFAULTS.items()
+            }
+            self.compare_evaluators(legacy)
+        elif command == 'evaluators':
+            self.compare_evaluators(options)
+        elif command == 'suite':
+            self.run_suite(options)
+        elif command == 'startup':
+            self.measure_startup(options)
+        else:
+            self.stdout.write(self.style.ERROR('Please specify a valid command: evaluators, suite or startup'))
+
+    def compare_evaluators(self, options):
+        """Compare search iterations reached by each evaluator mode."""
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+
+        for num_stops in sizes:
+            results = compare_evaluators(
+                num_stops,
+                num_vehicles=options['vehicles'],
+                time_limit=options['time_limit'],
+                seed=options['seed'],
+            )
+            self.stdout.write(f'{num_stops} stops, {options["time_limit"]}s limit:')
+            for mode in ('callback', 'matrix'):
+                stats = results[mode]
+                self.stdout.write(
+                    f'  - {mode:8s}: {stats["accepted_neighbors"]} accepted neighbors, '
+                    f'{stats["branches"]} branches, objective {stats["objective"]}'
+                )
+            self.stdout.write(self.style.SUCCESS(f'  Search iterations x{results["speedup"]}'))
+
+    def run_suite(self, options):
+        """Run the suite, write JSON results and gate on a baseline."""
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        results = run_suite(sizes, preset=options['preset'], seed=options['seed'], region=options['region'])
+
+        for case in results['cases']:
+            self.stdout.write(
+                f'{case["num_stops"]:5d} stops [{case["engine"]}]: '
+                f'matrix {case["matrix_seconds"]}s, solve {case["solve_seconds"]}s, '
+                f'objective {case["objective"]}, {case["routes_used"]} routes, '
+                f'peak RSS {case["peak_rss_mb"]} MB'
+            )
+
+        if options.get('output'):
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+
+        if options.get('baseline'):
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = check_regressions(results, baseline)
+            if regressions:
+                for message in regressions:
+                    self.stdout.write(self.style.ERROR(f'  - {message}'))
+                raise CommandError(f'{len(regressions)} benchmark regression(s) against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline'))
+
+    def measure_startup(self, options):
+        """Report web worker import cost and what loading the solver would add."""
+        modules = [module for module in options['modules'].split(',') if module]
+        stats = measure_startup(modules, repeat=options['repeat'])
+
+        self.stdout.write(f'django.setup(): {stats["django_setup_seconds"]}s')
+        self.stdout.write(
+            f'Web imports ({", ".join(modules)}): {stats["import_seconds"]}s, '
+            f'+{stats["web_import_rss_mb"]} MB, RSS {stats["web_rss_mb"]} MB'
+        )
+        self.stdout.write(
+            f'Loading OR-Tools (Celery workers only): +{stats["solver_import_seconds"]}s, '
+            f'RSS {stats["worker_rss_mb"]} MB'
+        )
+        if stats['solver_loaded_by_web']:
+            self.stdout.write(self.style.ERROR('Web imports load OR-Tools: every web worker pays the solver cost'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Web workers do not load OR-Tools'))
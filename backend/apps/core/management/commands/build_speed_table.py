@@ -0,0 +1,37 @@
+"""
+Management command to build the GPS-derived speed table.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.optimization.services.speed_model import build_speed_table, HISTORY_DAYS, MIN_SAMPLES, HOURS
+
+class Command(BaseCommand):
+    help = 'Aggregate LocationUpdate speeds by vehicle type, hour and geohash cell into the speed table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=HISTORY_DAYS,
+                            help=f'Days of GPS history to aggregate (default: {HISTORY_DAYS})')
+        parser.add_argument('--min-samples', type=int, default=MIN_SAMPLES,
+                            help=f'Minimum readings per cell/hour (default: {MIN_SAMPLES})')
+        parser.add_argument('--output', '-o', type=str,
+                            help='Output file (default: OPTIMIZATION_SPEED_TABLE_PATH)')
+
+    def handle(self, *args, **options):
+        table = build_speed_table(days=options['days'], min_samples=options['min_samples'])
+        if table is None:
+            self.stdout.write(self.style.WARNING('No GPS readings in the period; speed table not written'))
+            return
+
+        output = options.get('output') or settings.OPTIMIZATION_SPEED_TABLE_PATH
+        table.save(output)
+        for t, vehicle_type in enumerate(table.vehicle_types):
+            covered = int(np.count_nonzero(~np.isnan(table.cell_speeds[t])))
+            self.stdout.write(
+                f'  - {vehicle_type:10s}: {table.type_speeds[t] * 60 / 1000:.1f} km/h average, '
+                f'{covered} of {HOURS * len(table.cells)} hour/cell slots with data'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Speed table written to {output} ({len(table.cells)} cells, '
+            f'{table.global_speed * 60 / 1000:.1f} km/h overall)'
+        ))
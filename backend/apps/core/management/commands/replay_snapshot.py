@@ -0,0 +1,74 @@
+"""
+Management command to replay optimization snapshots offline.
+"""
+import cProfile
+import pstats
+from django.core.management.base import BaseCommand, CommandError
+from apps.optimization.services.snapshots import load_snapshot, replay_snapshot
+from apps.optimization.services.route_optimizer import SOLVER_PRESETS
+
+class Command(BaseCommand):
+    help = 'Replay problem-instance snapshots through RouteOptimizer, optionally under cProfile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshots', nargs='+', type=str, help='Snapshot files (.npz)')
+        parser.add_argument('--preset', type=str, choices=list(SOLVER_PRESETS),
+                            help='Override the recorded solver preset')
+        parser.add_argument('--time-limit', type=int, help='Override the solver time limit in seconds')
+        parser.add_argument('--portfolio', action='store_true', help='Solve with the strategy portfolio')
+        parser.add_argument('--profile', action='store_true', help='Run the solve under cProfile')
+        parser.add_argument('--sort', type=str, default='cumulative',
+                            help='Profile sort key (default: cumulative)')
+        parser.add_argument('--limit', type=int, default=30, help='Profile rows to print (default: 30)')
+        parser.add_argument('--profile-output', type=str,
+                            help='Write raw profile data to this file (single snapshot only)')
+
+    def handle(self, *args, **options):
+        if options.get('profile_output') and len(options['snapshots']) > 1:
+            raise CommandError('--profile-output accepts a single snapshot')
+
+        for path in options['snapshots']:
+            try:
+                snapshot = load_snapshot(path)
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'Cannot read snapshot {path}: {e}')
+            self.replay(path, snapshot, options)
+
+    def replay(self, path, snapshot, options):
+        """Solve one snapshot and report the outcome and search statistics."""
+        params = snapshot['params']
+        self.stdout.write(
+            f'{path}: {len(snapshot["distance_matrix"]) - 1} stops, {params["num_vehicles"]} vehicles, '
+            f'recorded preset {params.get("preset")}'
+        )
+
+        overrides = {
+            'preset': options.get('preset'),
+            'time_limit': options.get('time_limit'),
+            'portfolio': options.get('portfolio') or False,
+        }
+        profiler = cProfile.Profile() if options.get('profile') else None
+        if profiler:
+            profiler.enable()
+        result, stats = replay_snapshot(snapshot, **overrides)
+        if profiler:
+            profiler.disable()
+
+        if result is None:
+            self.stdout.write(self.style.ERROR('  No solution found'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'  objective {result["objective_value"]}, {len(result["routes"])} routes, '
+                f'{len(result.get("unassigned", []))} unassigned'
+            ))
+        if stats:
+            self.stdout.write(
+                f'  stop reason {stats.get("stop_reason")}, wall time {stats.get("wall_time_ms")} ms, '
+                f'{stats.get("solutions")} solutions'
+            )
+
+        if profiler:
+            if options.get('profile_output'):
+                profiler.dump_stats(options['profile_output'])
+                self.stdout.write(self.style.SUCCESS(f'  Profile written to {options["profile_output"]}'))
+            pstats.Stats(profiler, stream=self.stdout).sort_stats(options['sort']).print_stats(options['limit'])
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deliverybatch',
+            name='unassigned_deliveries',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -104,6 +104,7 @@ class DeliveryBatch(models.Model):
     total_stops = models.IntegerField(default=0)
     total_distance_km = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     estimated_duration_minutes = models.IntegerField(null=True, blank=True)
+    unassigned_deliveries = models.JSONField(default=list, blank=True)  # IDs sin ruta en una solución parcial
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -121,20 +121,21 @@ class DistanceMatrixService:
         """Matriz de distancias con OSRM"""
         # Combinar todos los puntos únicos
         all_points = []
-        points_set = set()
+        point_index = {}
         
         for point in origins + destinations:
             coord_key = (point['longitude'], point['latitude'])
-            if coord_key not in points_set:
+            if coord_key not in point_index:
+                point_index[coord_key] = len(all_points)
                 all_points.append(coord_key)
-                points_set.add(coord_key)
         
         # Construir URL para OSRM
         coordinates = ';'.join([f"{lng},{lat}" for lng, lat in all_points])
         url = f"http://router.project-osrm.org/table/v1/driving/{coordinates}"
         params = {
-            'sources': ';'.join([str(i) for i in range(len(origins))]),
-            'destinations': ';'.join([str(i) for i in range(len(origins), len(all_points))])
+            'sources': ';'.join([str(point_index[(o['longitude'], o['latitude'])]) for o in origins]),
+            'destinations': ';'.join([str(point_index[(d['longitude'], d['latitude'])]) for d in destinations]),
+            'annotations': 'distance,duration'
         }
         
         response = requests.get(url, params=params, timeout=30)
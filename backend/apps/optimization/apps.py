@@ -3,4 +3,15 @@ from django.apps import AppConfig
 class OptimizationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.optimization'
-    verbose_name = 'Route Optimization'
\ No newline at end of file
+    verbose_name = 'Route Optimization'
+
+    def ready(self):
+        # OR-Tools se importa en el proceso principal del worker, antes de crear
+        # los hijos del pool, que comparten sus páginas; los procesos web no lo cargan
+        from celery.signals import worker_init
+        worker_init.connect(_preload_solver, weak=False)
+
+
+def _preload_solver(**kwargs):
+    from .services.route_optimizer import load_solver
+    load_solver()
@@ -0,0 +1,293 @@
+"""
+Benchmarks del optimizador de rutas.
+
+Las instancias sintéticas son reproducibles (semilla fija) y reparten
+las paradas con la densidad aproximada de Gran Santo Domingo y Santiago.
+Cada caso del suite se ejecuta en un proceso nuevo para que el pico de
+memoria (RSS) medido corresponda solo a ese caso.
+"""
+import json
+import math
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+from .services.decomposition import DecompositionOptimizer, DECOMPOSITION_THRESHOLD
+from .services.route_optimizer import RouteOptimizer, build_distance_matrix, build_time_matrix, DEFAULT_PRESET
+
+# Centro aproximado de Santo Domingo
+SANTO_DOMINGO_CENTER = (18.4861, -69.9312)
+
+
+def random_coordinates(num_stops, seed=0, center=SANTO_DOMINGO_CENTER, spread_km=10):
+    """Genera depot + num_stops coordenadas aleatorias alrededor de un centro"""
+    rng = np.random.default_rng(seed)
+    spread_deg = spread_km / 111.0
+    lats = center[0] + rng.uniform(-spread_deg, spread_deg, num_stops + 1)
+    lngs = center[1] + rng.uniform(-spread_deg, spread_deg, num_stops + 1)
+    lats[0], lngs[0] = center
+    return lats, lngs
+
+
+# Zonas de demanda: (nombre, lat, lng, desviación en km, peso relativo)
+DENSITY_ZONES = {
+    'santo_domingo': [
+        ('Distrito Nacional', 18.4735, -69.9310, 2.5, 0.45),
+        ('Santo Domingo Este', 18.4880, -69.8570, 3.5, 0.25),
+        ('Santo Domingo Norte', 18.5450, -69.9000, 3.0, 0.15),
+        ('Santo Domingo Oeste', 18.4900, -69.9950, 2.5, 0.15),
+    ],
+    'santiago': [
+        ('Santiago Centro', 19.4517, -70.6970, 2.0, 0.6),
+        ('Cienfuegos', 19.4800, -70.7250, 1.5, 0.2),
+        ('Gurabo', 19.4750, -70.6650, 1.5, 0.2),
+    ],
+}
+
+# Depósito de cada región (zonas industriales)
+REGION_DEPOTS = {
+    'santo_domingo': (18.4800, -69.9700),
+    'santiago': (19.4400, -70.6800),
+}
+
+SUITE_SIZES = [10, 50, 200, 1000, 5000]
+
+# Capacidad por vehículo en el suite (igual al max_stops por defecto de Vehicle)
+SUITE_VEHICLE_CAPACITY = 30
+
+# Tolerancia relativa por métrica antes de considerar una regresión
+REGRESSION_TOLERANCES = {
+    'matrix_seconds': 0.5,
+    'solve_seconds': 0.25,
+    'objective': 0.02,
+    'peak_rss_mb': 0.2,
+}
+
+
+def synthetic_instance(num_stops, seed=0, region='santo_domingo'):
+    """
+    Genera depot + num_stops coordenadas con densidades por zona
+
+    Returns:
+        Tupla (lats, lngs) de arreglos de tamaño num_stops + 1
+    """
+    rng = np.random.default_rng(seed)
+    zones = DENSITY_ZONES[region]
+    weights = np.array([zone[4] for zone in zones])
+    zone_of = rng.choice(len(zones), size=num_stops, p=weights / weights.sum())
+
+    centers = np.array([(zone[1], zone[2]) for zone in zones])[zone_of]
+    sigma_deg = np.array([zone[3] for zone in zones])[zone_of] / 111.0
+    lats = centers[:, 0] + rng.normal(0, 1, num_stops) * sigma_deg
+    lngs = centers[:, 1] + rng.normal(0, 1, num_stops) * sigma_deg / math.cos(math.radians(centers[0, 0]))
+
+    depot_lat, depot_lng = REGION_DEPOTS[region]
+    return np.concatenate(([depot_lat], lats)), np.concatenate(([depot_lng], lngs))
+
+
+def run_case(num_stops, preset=DEFAULT_PRESET, seed=0, region='santo_domingo'):
+    """
+    Ejecuta un caso del suite en el proceso actual
+
+    Returns:
+        Dict con tiempos, objetivo, rutas usadas y pico de RSS
+    """
+    lats, lngs = synthetic_instance(num_stops, seed=seed, region=region)
+    num_vehicles = max(1, math.ceil(num_stops / (SUITE_VEHICLE_CAPACITY * 0.8)))
+    capacities = [SUITE_VEHICLE_CAPACITY] * num_vehicles
+
+    started = time.perf_counter()
+    if num_stops > DECOMPOSITION_THRESHOLD:
+        # Igual que optimize_batch_task: sin matriz completa
+        engine = 'decomposition'
+        matrix_seconds = 0.0
+        optimizer = DecompositionOptimizer(lats, lngs)
+        result = optimizer.optimize(num_vehicles, capacities, preset=preset)
+    else:
+        engine = 'route_optimizer'
+        distance_matrix = build_distance_matrix(lats, lngs)
+        time_matrix = build_time_matrix(distance_matrix)
+        matrix_seconds = time.perf_counter() - started
+        optimizer = RouteOptimizer(distance_matrix, time_matrix)
+        result = optimizer.optimize(num_vehicles, vehicle_capacities=capacities, preset=preset)
+    total_seconds = time.perf_counter() - started
+
+    return {
+        'num_stops': num_stops,
+        'region': region,
+        'seed': seed,
+        'preset': preset,
+        'engine': engine,
+        'num_vehicles': num_vehicles,
+        'matrix_seconds': round(matrix_seconds, 4),
+        'solve_seconds': round(total_seconds - matrix_seconds, 3),
+        'objective': result['objective_value'] if result else None,
+        'total_distance': result['total_distance'] if result else None,
+        'routes_used': len(result['routes']) if result else 0,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+def _peak_rss_mb():
+    """Pico de RSS del proceso o del mayor de sus hijos (p.ej. el pool de la descomposición)"""
+    # ru_maxrss está en KB en Linux
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return round(peak / 1024, 1)
+
+
+def _run_case_star(args):
+    return run_case(*args)
+
+
+def run_suite(sizes=None, preset=DEFAULT_PRESET, seed=0, region='santo_domingo'):
+    """
+    Ejecuta el suite completo, un proceso nuevo por caso
+
+    Returns:
+        Dict listo para serializar a JSON
+    """
+    context = multiprocessing.get_context('spawn')
+    cases = []
+    for num_stops in sizes or SUITE_SIZES:
+        with context.Pool(1) as pool:
+            cases.append(pool.apply(_run_case_star, ((num_stops, preset, seed, region),)))
+
+    return {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'preset': preset,
+        'seed': seed,
+        'region': region,
+        'cases': cases,
+    }
+
+
+def check_regressions(results, baseline, tolerances=None):
+    """
+    Compara resultados contra una corrida base
+
+    Un caso regresa si alguna métrica supera a la base por más de su
+    tolerancia relativa, o si deja de encontrar solución.
+
+    Returns:
+        Lista de mensajes, vacía si no hay regresiones
+    """
+    tolerances = tolerances or REGRESSION_TOLERANCES
+    baseline_cases = {(case['num_stops'], case['region']): case for case in baseline['cases']}
+    regressions = []
+
+    for case in results['cases']:
+        reference = baseline_cases.get((case['num_stops'], case['region']))
+        if reference is None:
+            continue
+        if case['objective'] is None and reference['objective'] is not None:
+            regressions.append(f"{case['num_stops']} paradas: sin solución")
+            continue
+
+        for metric, tolerance in tolerances.items():
+            current, previous = case.get(metric), reference.get(metric)
+            if current is None or not previous:
+                continue
+            if current > previous * (1 + tolerance):
+                regressions.append(
+                    f"{case['num_stops']} paradas: {metric} {current} > {previous} (+{tolerance:.0%})"
+                )
+
+    return regressions
+
+
+def compare_evaluators(num_stops, num_vehicles=2, time_limit=5, seed=0):
+    """
+    Resuelve la misma instancia con callbacks de Python y con matrices
+    nativas usando el mismo límite de tiempo
+
+    Returns:
+        Dict con estadísticas de búsqueda por modo
+    """
+    lats, lngs = random_coordinates(num_stops, seed=seed)
+    distance_matrix = build_distance_matrix(lats, lngs)
+    time_matrix = distance_matrix // 50
+
+    results = {}
+    for mode, use_matrix in (('callback', False), ('matrix', True)):
+        optimizer = RouteOptimizer(distance_matrix, time_matrix, use_matrix_evaluators=use_matrix)
+        started = time.perf_counter()
+        result = optimizer.optimize(
+            num_vehicles=num_vehicles,
+            vehicle_capacities=[num_stops] * num_vehicles,
+            time_windows=[(0, 1440)] * (num_stops + 1),
+            time_limit=time_limit,
+        )
+        results[mode] = {
+            **optimizer.search_stats,
+            'elapsed_seconds': round(time.perf_counter() - started, 3),
+            'objective': result['objective_value'] if result else None,
+        }
+
+    callback_neighbors = results['callback']['accepted_neighbors'] or 1
+    results['speedup'] = round(results['matrix']['accepted_neighbors'] / callback_neighbors, 2)
+    return results
+
+
+# Módulos que carga un worker web al resolver las URLs de la API
+WEB_MODULES = ['apps.api.urls']
+
+# Se ejecuta en un intérprete nuevo para medir un arranque en frío
+_STARTUP_SCRIPT = """
+import json, resource, sys, time
+def rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+started = time.perf_counter()
+import django
+django.setup()
+setup_seconds = time.perf_counter() - started
+base_rss = rss_mb()
+started = time.perf_counter()
+for module in sys.argv[1:]:
+    __import__(module)
+import_seconds = time.perf_counter() - started
+web_rss = rss_mb()
+solver_loaded = 'ortools' in sys.modules
+from apps.optimization.services.route_optimizer import load_solver
+started = time.perf_counter()
+load_solver()
+print(json.dumps({
+    'django_setup_seconds': round(setup_seconds, 3),
+    'import_seconds': round(import_seconds, 3),
+    'web_rss_mb': web_rss,
+    'web_import_rss_mb': round(web_rss - base_rss, 1),
+    'solver_loaded_by_web': solver_loaded,
+    'solver_import_seconds': round(time.perf_counter() - started, 3),
+    'worker_rss_mb': rss_mb(),
+}))
+"""
+
+
+def measure_startup(modules=None, repeat=3):
+    """
+    Mide el arranque en frío de un worker web en procesos nuevos
+
+    Reporta el tiempo y la memoria (RSS) de importar los módulos web y,
+    aparte, lo que añade cargar OR-Tools como hace un worker de Celery.
+
+    Returns:
+        Dict con la mediana de cada métrica en las repeticiones
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _STARTUP_SCRIPT, *(modules or WEB_MODULES)],
+            capture_output=True, text=True, check=True, env=os.environ.copy(),
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        metric: runs[0][metric] if isinstance(runs[0][metric], bool)
+        else float(np.median([run[metric] for run in runs]))
+        for metric in runs[0]
+    }
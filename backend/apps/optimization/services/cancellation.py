@@ -0,0 +1,107 @@
+"""
+Cancelación cooperativa de optimizaciones en curso.
+
+Cada corrida encolada recibe un identificador y se registra como la
+corrida activa del lote en la caché (Redis). Encolar otra corrida para el
+mismo lote o cancelarla desde la API reemplaza ese registro; el solver lo
+consulta (ver CancellationCheck) desde su callback de soluciones y, antes
+de la primera solución, desde un límite de búsqueda, y termina la
+búsqueda. La tarea vuelve a consultarlo con el lote bloqueado antes de
+guardar, y descarta el resultado en lugar de guardar rutas obsoletas.
+"""
+import logging
+import time
+import uuid
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'optimization:active_run:'
+
+# Valor del registro cuando la corrida se canceló explícitamente
+CANCELLED = 'cancelled'
+
+# Vigencia del registro de la corrida activa (segundos)
+RUN_TIMEOUT = 6 * 3600
+
+# Intervalo mínimo entre consultas a la caché desde el solver
+CHECK_INTERVAL_SECONDS = 0.2
+
+
+class OptimizationRuns:
+    """Registro de la corrida activa de cada lote"""
+
+    @staticmethod
+    def start(batch_id):
+        """
+        Registra una corrida nueva como la activa del lote; cualquier
+        corrida anterior queda reemplazada
+
+        Returns:
+            Identificador de la corrida
+        """
+        run_id = uuid.uuid4().hex
+        try:
+            cache.set(KEY_PREFIX + str(batch_id), run_id, RUN_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo registrar la corrida de optimización: {e}")
+        return run_id
+
+    @staticmethod
+    def cancel(batch_id):
+        """Cancela la corrida activa del lote"""
+        try:
+            cache.set(KEY_PREFIX + str(batch_id), CANCELLED, RUN_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo cancelar la corrida de optimización: {e}")
+
+    @staticmethod
+    def state(batch_id, run_id):
+        """
+        Estado de una corrida
+
+        Returns:
+            'active', 'cancelled' o 'superseded'; ante fallas de la caché
+            la corrida se considera activa
+        """
+        try:
+            active = cache.get(KEY_PREFIX + str(batch_id))
+        except Exception as e:
+            logger.warning(f"Registro de corridas no disponible: {e}")
+            return 'active'
+        if active is None or active == run_id:
+            return 'active'
+        return 'cancelled' if active == CANCELLED else 'superseded'
+
+    @staticmethod
+    def finish(batch_id, run_id):
+        """Libera el registro si la corrida sigue siendo la activa"""
+        try:
+            if cache.get(KEY_PREFIX + str(batch_id)) == run_id:
+                cache.delete(KEY_PREFIX + str(batch_id))
+        except Exception as e:
+            logger.warning(f"No se pudo liberar la corrida de optimización: {e}")
+
+
+class CancellationCheck:
+    """
+    Condición de parada de RouteOptimizer (stop_check) que termina la
+    búsqueda si la corrida fue cancelada o reemplazada
+
+    Es serializable, así que también sirve en los procesos del portafolio
+    y de la descomposición.
+    """
+
+    def __init__(self, batch_id, run_id, interval=CHECK_INTERVAL_SECONDS):
+        self.batch_id = str(batch_id)
+        self.run_id = run_id
+        self.interval = interval
+        self.checked_at = None
+
+    def __call__(self, best_objective, elapsed):
+        now = time.monotonic()
+        if self.checked_at is not None and now - self.checked_at < self.interval:
+            return None
+        self.checked_at = now
+        state = OptimizationRuns.state(self.batch_id, self.run_id)
+        return None if state == 'active' else state
@@ -0,0 +1,208 @@
+"""
+Grafo de arcos candidatos k-NN para instancias grandes.
+
+Una parada realista solo conecta con sus vecinas más cercanas, así que
+en lugar de costos precisos para los n² arcos se indexan las
+coordenadas en una cuadrícula y se guardan solo los k vecinos de cada
+nodo (memoria O(nk)). Los costos precisos (OSRM/Google) se piden solo
+para esos arcos; el resto recibe una estimación barata o se prohíbe
+en el solver.
+"""
+import logging
+import numpy as np
+from apps.core.services.geocoding import DistanceMatrixService
+from .route_optimizer import EARTH_RADIUS_KM, build_distance_matrix
+
+logger = logging.getLogger(__name__)
+
+# Vecinos por nodo
+DEFAULT_NEIGHBORS = 30
+
+# Lotes con más entregas que este umbral se resuelven solo con arcos candidatos
+CANDIDATE_ARCS_THRESHOLD = 300
+
+# Factor ruta/línea recta para estimar arcos no candidatos
+DETOUR_FACTOR = 1.3
+
+# Estrategia inicial recomendada al prohibir arcos no candidatos: las
+# inserciones toleran grafos dispersos mejor que PATH_CHEAPEST_ARC
+CANDIDATE_FIRST_SOLUTION = 'PARALLEL_CHEAPEST_INSERTION'
+
+# Máximo de coordenadas por petición de matriz (límite del servidor OSRM público)
+MAX_MATRIX_POINTS = 100
+
+METERS_PER_DEGREE_LAT = 110_540
+METERS_PER_DEGREE_LNG = 111_320
+
+
+def haversine_pairs(lat1, lng1, lat2, lng2):
+    """Distancias haversine (metros, int32) entre pares de puntos, vectorizado"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return (EARTH_RADIUS_KM * c * 1000).astype(np.int32)
+
+
+class GridIndex:
+    """Índice espacial de cuadrícula uniforme sobre coordenadas proyectadas"""
+
+    def __init__(self, lats, lngs, points_per_cell):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        # Proyección equirectangular local, suficiente a escala de ciudad
+        self.xy = np.column_stack((
+            lngs * np.cos(np.radians(lats.mean())) * METERS_PER_DEGREE_LNG,
+            lats * METERS_PER_DEGREE_LAT,
+        ))
+        n = len(lats)
+        extent = np.ptp(self.xy, axis=0).clip(min=1.0)
+        self.cell_size = max(float(np.sqrt(extent[0] * extent[1] * points_per_cell / max(n, 1))), 1.0)
+
+        self.cell_of = np.floor((self.xy - self.xy.min(axis=0)) / self.cell_size).astype(np.int64)
+        self.cells = {}
+        order = np.lexsort((self.cell_of[:, 1], self.cell_of[:, 0]))
+        keys = self.cell_of[order]
+        boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0), axis=1)) + 1
+        for group in np.split(order, boundaries):
+            self.cells[tuple(self.cell_of[group[0]])] = group
+
+    def ring(self, cell, radius):
+        """Puntos en el cuadrado de celdas de semiancho radius alrededor de cell"""
+        cx, cy = cell
+        groups = [
+            self.cells[(x, y)]
+            for x in range(cx - radius, cx + radius + 1)
+            for y in range(cy - radius, cy + radius + 1)
+            if (x, y) in self.cells
+        ]
+        return np.concatenate(groups) if groups else np.empty(0, dtype=np.int64)
+
+    def nearest(self, k):
+        """
+        k vecinos más cercanos de cada punto (sin incluirse a sí mismo)
+
+        Returns:
+            np.ndarray int32 de forma (n, k')
+        """
+        n = len(self.xy)
+        k = min(k, n - 1)
+        neighbors = np.empty((n, k), dtype=np.int32)
+        if k <= 0:
+            return neighbors
+
+        for cell, members in self.cells.items():
+            radius = 1
+            while True:
+                candidates = self.ring(cell, radius)
+                if len(candidates) > k:
+                    diff = self.xy[members][:, None, :] - self.xy[candidates][None, :, :]
+                    dist = np.hypot(diff[..., 0], diff[..., 1])
+                    # Excluir el propio punto
+                    dist[candidates[None, :] == members[:, None]] = np.inf
+                    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+                    kth = np.take_along_axis(dist, nearest, axis=1).max()
+                    # El cuadrado cubre al menos un radio radius*cell_size desde la celda
+                    if kth <= radius * self.cell_size or len(candidates) == n:
+                        break
+                radius += 1
+
+            rows = np.take_along_axis(dist, nearest, axis=1).argsort(axis=1)
+            neighbors[members] = candidates[np.take_along_axis(nearest, rows, axis=1)]
+
+        return neighbors
+
+
+class CandidateGraph:
+    """Arcos candidatos k-NN con costo preciso por arco"""
+
+    def __init__(self, lats, lngs, k=DEFAULT_NEIGHBORS):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.index = GridIndex(self.lats, self.lngs, points_per_cell=max(k // 2, 1))
+        self.neighbors = self.index.nearest(k)
+        sources = np.repeat(np.arange(len(self.lats)), self.neighbors.shape[1]).reshape(self.neighbors.shape)
+        self.costs = haversine_pairs(
+            self.lats[sources], self.lngs[sources],
+            self.lats[self.neighbors], self.lngs[self.neighbors],
+        )
+
+    @property
+    def nbytes(self):
+        """Memoria de los arreglos del grafo"""
+        return self.neighbors.nbytes + self.costs.nbytes
+
+    def fetch_road_costs(self):
+        """
+        Reemplaza los costos haversine de los arcos candidatos por
+        distancias de ruta de DistanceMatrixService
+
+        Las peticiones agrupan los orígenes de una misma celda y piden
+        solo la unión de sus vecinos, en lugar de la matriz completa.
+
+        Returns:
+            Número de celdas de matriz solicitadas
+        """
+        requested = 0
+        for members in self.index.cells.values():
+            for sources in self._chunk_sources(members):
+                targets = np.unique(self.neighbors[sources])
+                response = DistanceMatrixService.get_distance_matrix(
+                    self._points(sources), self._points(targets)
+                )
+                requested += len(sources) * len(targets)
+                if not response:
+                    logger.warning("Matriz de ruta no disponible, se conservan costos haversine")
+                    continue
+
+                column = {int(target): j for j, target in enumerate(targets)}
+                for i, source in enumerate(sources):
+                    for slot, target in enumerate(self.neighbors[source]):
+                        value = response['distances'][i][column[int(target)]]
+                        if value is not None and value != float('inf'):
+                            self.costs[source, slot] = int(value)
+        return requested
+
+    def _chunk_sources(self, members):
+        """Divide los orígenes de una celda respetando MAX_MATRIX_POINTS"""
+        chunk, points = [], set()
+        for source in members.tolist():
+            extended = points | {source} | set(self.neighbors[source].tolist())
+            if chunk and len(extended) > MAX_MATRIX_POINTS:
+                yield np.array(chunk)
+                chunk, extended = [], {source} | set(self.neighbors[source].tolist())
+            chunk.append(source)
+            points = extended
+        if chunk:
+            yield np.array(chunk)
+
+    def _points(self, nodes):
+        return [{'latitude': float(self.lats[i]), 'longitude': float(self.lngs[i])} for i in nodes]
+
+    def to_dense(self, detour_factor=DETOUR_FACTOR):
+        """
+        Matriz int32 para el solver: estimación haversine * detour_factor
+        en todos los arcos y costo preciso en los candidatos
+        """
+        matrix = build_distance_matrix(self.lats, self.lngs)
+        np.multiply(matrix, detour_factor, out=matrix, casting='unsafe')
+        rows = np.arange(len(self.lats))[:, None]
+        matrix[rows, self.neighbors] = self.costs
+        return matrix
+
+    def allowed_successors(self, depot_index=0):
+        """
+        Sucesores permitidos por nodo para prohibir arcos no candidatos
+
+        El conjunto es simétrico (i→j si j es vecino de i o i de j) y
+        siempre incluye el depot, para no desconectar rutas.
+        """
+        n = len(self.lats)
+        successors = [set(row) for row in self.neighbors.tolist()]
+        for source, row in enumerate(self.neighbors.tolist()):
+            for target in row:
+                successors[target].add(source)
+        for node in range(n):
+            successors[node].add(depot_index)
+            successors[node].discard(node)
+        return [sorted(successors[node]) for node in range(n)]
@@ -0,0 +1,199 @@
+"""
+Estimación de memoria y tiempo de una optimización antes de resolver.
+
+La memoria de una corrida completa crece con n²: las matrices int32 de
+MatrixStore, la copia int64 que guarda OR-Tools de cada matriz registrada
+y la lista transitoria con que se le entrega (ver _matrix_rows); ~35-40
+bytes por celda medidos en lotes de 1500 a 2500 paradas con ventanas. Con la estimación, los lotes
+que no caben en un worker normal se envían a la cola de gran memoria o
+a la descomposición en lugar de tumbar el worker por falta de memoria.
+
+Las estimaciones se corrigen con lo medido: cada corrida registra su
+pico absoluto de RSS y su duración, y un factor de corrección por métrica (media
+móvil exponencial de medido / estimado) se guarda en la caché compartida.
+"""
+import logging
+import os
+import resource
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .route_optimizer import compute_time_budget, DEFAULT_PRESET
+
+logger = logging.getLogger(__name__)
+
+# Memoria por celda de la matriz n² (bytes) y por par nodo-vehículo del modelo
+BYTES_PER_CELL = 40
+BYTES_PER_NODE_VEHICLE = 2048
+
+# Memoria fija de una corrida (MB)
+BASE_MEMORY_MB = 50
+
+# Construcción de matrices (segundos por celda)
+SECONDS_PER_CELL = 2e-8
+
+# Peso de cada medición nueva en el factor de corrección
+CORRECTION_WEIGHT = 0.2
+
+# Los factores no se alejan de la estimación base más que esto
+CORRECTION_BOUNDS = (0.25, 4.0)
+
+# Por debajo de esto (MB) la memoria la domina el propio worker y la
+# medición no dice nada de la estimación n²
+MEMORY_NOISE_FLOOR_MB = 128
+
+KEY_PREFIX = 'optimization:cost_model:'
+
+# Intervalo de muestreo del RSS durante una corrida (segundos)
+SAMPLE_INTERVAL = 0.05
+
+
+def base_estimate(num_nodes, num_vehicles, preset=DEFAULT_PRESET):
+    """
+    Estimación sin corregir de una corrida completa (matriz n²)
+
+    Returns:
+        Dict con 'memory_mb' y 'seconds' (matrices más presupuesto del solver)
+    """
+    cells = num_nodes * num_nodes
+    memory = BASE_MEMORY_MB + (cells * BYTES_PER_CELL + num_nodes * num_vehicles * BYTES_PER_NODE_VEHICLE) / 2 ** 20
+    budget, _ = compute_time_budget(num_nodes, preset)
+    return {'memory_mb': memory, 'seconds': cells * SECONDS_PER_CELL + budget}
+
+
+class CostModel:
+    """Estimaciones corregidas con las mediciones de corridas anteriores"""
+
+    @staticmethod
+    def estimate(num_nodes, num_vehicles, preset=DEFAULT_PRESET):
+        """
+        Returns:
+            Dict con 'memory_mb' y 'seconds' estimados
+        """
+        base = base_estimate(num_nodes, num_vehicles, preset)
+        return {metric: round(value * CostModel._factor(metric), 1) for metric, value in base.items()}
+
+    @staticmethod
+    def record(num_nodes, num_vehicles, preset, memory_mb, seconds):
+        """
+        Ajusta los factores de corrección con lo medido en una corrida
+
+        Args:
+            memory_mb: Pico absoluto de RSS del worker (ver PeakMemorySampler);
+                se ignora si la estimación o la medición quedan por debajo
+                de MEMORY_NOISE_FLOOR_MB
+        """
+        base = base_estimate(num_nodes, num_vehicles, preset)
+        if memory_mb is not None and min(memory_mb, base['memory_mb']) < MEMORY_NOISE_FLOOR_MB:
+            memory_mb = None
+        for metric, measured in (('memory_mb', memory_mb), ('seconds', seconds)):
+            if measured is None or base[metric] <= 0:
+                continue
+            factor = CostModel._factor(metric)
+            factor += CORRECTION_WEIGHT * (measured / base[metric] - factor)
+            factor = min(max(factor, CORRECTION_BOUNDS[0]), CORRECTION_BOUNDS[1])
+            try:
+                cache.set(KEY_PREFIX + metric, factor, None)
+            except Exception as e:
+                logger.warning(f"No se pudo guardar el modelo de costos: {e}")
+
+    @staticmethod
+    def _factor(metric):
+        try:
+            return cache.get(KEY_PREFIX + metric) or 1.0
+        except Exception as e:
+            logger.warning(f"Modelo de costos no disponible: {e}")
+            return 1.0
+
+
+def plan_execution(num_nodes, num_vehicles, preset=DEFAULT_PRESET):
+    """
+    Decide dónde ejecutar una optimización según su costo estimado
+
+    Returns:
+        Dict con 'estimate', 'queue' (nombre de la cola de gran memoria o
+        None para la cola por defecto), 'memory_mb' (memoria de los workers
+        de esa cola, para fits_in_worker) y 'decompose' (resolver por
+        grupos porque no cabe en ningún worker)
+    """
+    estimate = CostModel.estimate(num_nodes, num_vehicles, preset)
+    plan = {'estimate': estimate, 'queue': None, 'memory_mb': settings.OPTIMIZATION_WORKER_MEMORY_MB,
+            'decompose': False}
+    if estimate['memory_mb'] <= settings.OPTIMIZATION_WORKER_MEMORY_MB:
+        return plan
+    if settings.OPTIMIZATION_BIG_MEMORY_QUEUE and estimate['memory_mb'] <= settings.OPTIMIZATION_BIG_MEMORY_MB:
+        plan['queue'] = settings.OPTIMIZATION_BIG_MEMORY_QUEUE
+        plan['memory_mb'] = settings.OPTIMIZATION_BIG_MEMORY_MB
+    else:
+        plan['decompose'] = True
+    logger.info(f"Lote de {num_nodes} nodos (~{estimate['memory_mb']} MB): cola {plan['queue']}, "
+                f"descomposición {plan['decompose']}")
+    return plan
+
+
+def fits_in_worker(num_nodes, num_vehicles, preset=DEFAULT_PRESET, memory_mb=None):
+    """
+    Si una corrida completa cabe en la memoria del worker
+
+    Args:
+        memory_mb: Memoria del worker (la 'memory_mb' de plan_execution para
+            la cola donde se encoló); por defecto OPTIMIZATION_WORKER_MEMORY_MB
+    """
+    if memory_mb is None:
+        memory_mb = settings.OPTIMIZATION_WORKER_MEMORY_MB
+    return CostModel.estimate(num_nodes, num_vehicles, preset)['memory_mb'] <= memory_mb
+
+
+def current_rss_mb():
+    """RSS actual del proceso (MB); pico histórico si /proc no está disponible"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class PeakMemorySampler:
+    """
+    Mide el pico absoluto de RSS y la duración de un bloque
+
+    Se muestrea el RSS en un hilo porque la mayor parte de la memoria la
+    reserva OR-Tools en C++, fuera del alcance de tracemalloc. Se registra
+    el pico absoluto y no la diferencia con el RSS inicial: en un worker
+    prefork de larga vida el allocator conserva la memoria de corridas
+    anteriores y la diferencia sale casi nula. Lo que debe caber en el
+    worker es el pico absoluto.
+
+    Uso:
+        with PeakMemorySampler() as sampler:
+            ...
+        sampler.peak_mb, sampler.baseline_mb, sampler.seconds
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.baseline_mb = 0.0
+        self.peak_mb = 0.0
+        self.seconds = 0.0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.baseline_mb = current_rss_mb()
+        self._peak = self.baseline_mb
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, current_rss_mb())
+        self.seconds = time.monotonic() - self._started
+        self.peak_mb = self._peak
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, current_rss_mb())
@@ -0,0 +1,323 @@
+"""
+Descomposición cluster-first/route-second para lotes muy grandes.
+
+En lugar de un único modelo sobre la matriz n², las entregas se agrupan
+por ángulo alrededor del depósito (barrido) en grupos de a lo sumo
+MAX_CLUSTER_SIZE, respetando la capacidad de los vehículos asignados a
+cada grupo. Cada grupo se resuelve con
+RouteOptimizer en un pool de procesos y las rutas se unen en el mismo
+formato que produce RouteOptimizer._extract_solution.
+
+Si un vehículo atiende varios grupos, sus viajes se resuelven en orden:
+cada viaje sale cuando el anterior regresa al depósito, así que las
+llegadas (y las ventanas) de un vehículo nunca se solapan.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .route_optimizer import (
+    RouteOptimizer,
+    build_distance_matrix,
+    DEFAULT_PRESET,
+)
+from .feasibility import DAY_MINUTES
+from .speed_model import build_vehicle_time_matrix
+
+logger = logging.getLogger(__name__)
+
+# Lotes con más entregas que este umbral se optimizan por grupos
+DECOMPOSITION_THRESHOLD = 800
+
+# Tamaño máximo de cada sub-problema (sin contar el depot)
+MAX_CLUSTER_SIZE = 300
+
+
+def partition_deliveries(lats, lngs, vehicle_capacities, max_cluster_size=MAX_CLUSTER_SIZE, depot_index=0):
+    """
+    Agrupa las entregas por barrido angular alrededor del depósito
+
+    El número de grupos depende solo de max_cluster_size, así que ningún
+    sub-problema supera ese tamaño aunque la flota sea pequeña. Con menos
+    grupos que vehículos la flota se reparte en grupos de vehículos
+    consecutivos; con más, cada vehículo atiende varios grupos (un viaje
+    por grupo) y su capacidad se divide entre ellos. Cada grupo recibe un
+    tramo contiguo del barrido que no excede su capacidad (demanda 1 por
+    parada, igual que RouteOptimizer).
+
+    Args:
+        lats, lngs: Coordenadas de todos los nodos (incluye el depot)
+        vehicle_capacities: Máximo de paradas de cada vehículo
+        max_cluster_size: Máximo de entregas por grupo
+        depot_index: Nodo del depósito
+
+    Returns:
+        Lista de dicts {'nodes': [...], 'vehicles': [...], 'capacities': [...],
+        'trip': n} con índices globales; 'capacities' es la capacidad de
+        cada vehículo del grupo en ese viaje y 'trip' el número de viaje de
+        sus vehículos (0 si cada vehículo atiende un solo grupo)
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    nodes = np.array([i for i in range(len(lats)) if i != depot_index], dtype=np.int64)
+    if nodes.size == 0 or not vehicle_capacities:
+        return []
+
+    angles = np.arctan2(lats[nodes] - lats[depot_index], lngs[nodes] - lngs[depot_index])
+    nodes = nodes[np.argsort(angles, kind='stable')]
+
+    num_vehicles = len(vehicle_capacities)
+    num_clusters = -(-nodes.size // max_cluster_size)
+    if num_clusters <= num_vehicles:
+        groups = [
+            (vehicles.tolist(), [vehicle_capacities[vehicle_id] for vehicle_id in vehicles], 0)
+            for vehicles in np.array_split(np.arange(num_vehicles), num_clusters)
+        ]
+    else:
+        # Más grupos que vehículos: el grupo k lo atiende el vehículo k % num_vehicles
+        trips = [len(range(vehicle_id, num_clusters, num_vehicles)) for vehicle_id in range(num_vehicles)]
+        groups = []
+        for k in range(num_clusters):
+            vehicle_id, trip = k % num_vehicles, k // num_vehicles
+            share, extra = divmod(vehicle_capacities[vehicle_id], trips[vehicle_id])
+            groups.append(([vehicle_id], [share + (trip < extra)], trip))
+
+    clusters = []
+    position = 0
+    for k, (vehicles, capacities, trip) in enumerate(groups):
+        remaining = nodes.size - position
+        target = -(-remaining // (num_clusters - k))
+        size = min(target, sum(capacities))
+        clusters.append({
+            'nodes': nodes[position:position + size].tolist(),
+            'vehicles': vehicles,
+            'capacities': capacities,
+            'trip': trip,
+        })
+        position += size
+
+    return clusters
+
+
+def _solve_cluster(task):
+    """Resuelve un sub-problema; se ejecuta en un proceso del pool"""
+    (nodes, vehicles, lats, lngs, capacities, time_windows, departure, preset, initial_routes, stop_check,
+     (speed_table, vehicle_type, hour)) = task
+    distance_matrix = build_distance_matrix(lats, lngs)
+    # Mismos tiempos que la matriz completa (ver tasks._batch_matrices)
+    time_matrix = build_vehicle_time_matrix(distance_matrix, lats, lngs, vehicle_type, hour, speed_table)
+    optimizer = RouteOptimizer(distance_matrix, time_matrix)
+    result = optimizer.optimize(
+        num_vehicles=len(vehicles),
+        vehicle_capacities=capacities,
+        time_windows=time_windows,
+        preset=preset,
+        initial_routes=initial_routes,
+        stop_check=stop_check,
+        departure=departure,
+    )
+    return nodes, vehicles, result
+
+
+class DecompositionOptimizer:
+    """Optimiza lotes grandes resolviendo grupos geográficos en paralelo"""
+
+    def __init__(self, lats, lngs, depot_index=0, max_cluster_size=MAX_CLUSTER_SIZE, processes=None,
+                 speed_table=None, vehicle_type=None):
+        """
+        Args:
+            lats, lngs: Coordenadas de todos los nodos (incluye el depot)
+            depot_index: Nodo del depósito
+            max_cluster_size: Máximo de entregas por sub-problema
+            processes: Procesos del pool (por defecto, uno por CPU)
+            speed_table: SpeedTable para los tiempos de cada sub-problema
+                (a la hora de salida de la flota); sin tabla, velocidad fija
+            vehicle_type: Tipo de vehículo de la tabla
+        """
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lngs = np.asarray(lngs, dtype=np.float64)
+        self.depot_index = depot_index
+        self.max_cluster_size = max_cluster_size
+        self.processes = processes or os.cpu_count() or 1
+        self.stop_check = None
+        self.time_windows = None
+        self.departure = 0
+        self.speed_table = speed_table
+        self.vehicle_type = vehicle_type
+
+    def optimize(self, num_vehicles, vehicle_capacities=None, time_windows=None, preset=DEFAULT_PRESET,
+                 repair=True, stop_check=None, departure=0):
+        """
+        Optimiza por grupos y une las rutas
+
+        Cuando hay más grupos que vehículos, un vehículo tiene una ruta por
+        cada grupo que atiende: los viajes se resuelven por rondas y cada
+        uno sale a la hora de regreso del viaje anterior del vehículo. En
+        ese caso no se reparan fronteras, porque cambiar un viaje movería
+        la salida de los siguientes.
+
+        Args:
+            num_vehicles: Número de vehículos disponibles
+            vehicle_capacities: Máximo de paradas de cada vehículo
+            time_windows: Ventanas (inicio, fin) por nodo global o None;
+                cada sub-problema recibe las de sus nodos
+            preset: Perfil de búsqueda de cada sub-problema
+            repair: Re-optimizar pares de grupos vecinos tras la unión
+            stop_check: Condición de parada de cada sub-problema (ver
+                SolutionMonitor); debe poder serializarse
+            departure: Minuto del día a partir del cual salen los vehículos
+
+        Returns:
+            Dict con el formato de RouteOptimizer._extract_solution o None
+        """
+        capacities = list(vehicle_capacities or [len(self.lats)] * num_vehicles)
+        clusters = partition_deliveries(
+            self.lats, self.lngs, capacities, self.max_cluster_size, self.depot_index
+        )
+        assigned = sum(len(cluster['nodes']) for cluster in clusters)
+        if assigned < len(self.lats) - 1:
+            logger.error("La flota no alcanza para cubrir todas las entregas del lote")
+            return None
+
+        self.stop_check = stop_check
+        self.time_windows = time_windows
+        self.departure = departure
+        routes_by_cluster = [None] * len(clusters)
+        # Minuto en que cada vehículo vuelve al depósito tras su último viaje
+        returns = {}
+        for trip in sorted({cluster['trip'] for cluster in clusters}):
+            wave = [k for k, cluster in enumerate(clusters) if cluster['trip'] == trip]
+            tasks = []
+            for k in wave:
+                cluster = clusters[k]
+                start = max([returns.get(vehicle_id, departure) for vehicle_id in cluster['vehicles']])
+                if start >= DAY_MINUTES:
+                    logger.error(f"El viaje {trip + 1} de los vehículos {cluster['vehicles']} no cabe en el día")
+                    return None
+                tasks.append(self._build_task(cluster['nodes'], cluster['vehicles'], cluster['capacities'], preset,
+                                              departure=start))
+            for k, (nodes, vehicles, result) in zip(wave, self._run(tasks)):
+                if result is None:
+                    logger.error("Un sub-problema de la descomposición no tiene solución")
+                    return None
+                routes_by_cluster[k] = self._to_global_routes(nodes, vehicles, result)
+                for route in routes_by_cluster[k]:
+                    returns[route['vehicle_id']] = route['arrivals'][-1]
+
+        single_trip = all(cluster['trip'] == 0 for cluster in clusters)
+        if repair and single_trip and len(routes_by_cluster) > 1:
+            self._repair_boundaries(clusters, routes_by_cluster)
+
+        return self._stitch(routes_by_cluster)
+
+    def _build_task(self, nodes, vehicles, capacities, preset, initial_routes=None, departure=None):
+        """Prepara los datos de un sub-problema con índices locales; por defecto sale en self.departure"""
+        local_nodes = [self.depot_index] + list(nodes)
+        time_windows = None
+        if self.time_windows:
+            time_windows = [self.time_windows[node] for node in local_nodes]
+            if not any(time_windows):
+                time_windows = None
+        return (
+            local_nodes,
+            vehicles,
+            self.lats[local_nodes],
+            self.lngs[local_nodes],
+            list(capacities),
+            time_windows,
+            self.departure if departure is None else departure,
+            preset,
+            initial_routes,
+            self.stop_check,
+            (self.speed_table, self.vehicle_type, self.departure // 60),
+        )
+
+    def _run(self, tasks):
+        """Ejecuta sub-problemas en paralelo, o en serie si no hay pool disponible"""
+        workers = min(self.processes, len(tasks))
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    return list(executor.map(_solve_cluster, tasks))
+            except (AssertionError, OSError) as e:
+                # Los procesos daemon (p.ej. workers prefork de Celery) no pueden crear hijos
+                logger.warning(f"Pool de procesos no disponible, resolviendo en serie: {e}")
+        return [_solve_cluster(task) for task in tasks]
+
+    @staticmethod
+    def _to_global_routes(local_nodes, vehicles, result):
+        """Traduce nodos y vehículos locales de un sub-problema a índices globales"""
+        routes = []
+        for route in result['routes']:
+            routes.append({
+                **route,
+                'vehicle_id': vehicles[route['vehicle_id']],
+                'stops': [local_nodes[node] for node in route['stops']],
+            })
+        return routes
+
+    def _route_cost(self, route):
+        """Costo de una ruta con los mismos arcos que usa el solver (incluye regreso al depot)"""
+        stops = route['stops']
+        matrix = build_distance_matrix(self.lats[stops], self.lngs[stops])
+        return int(matrix[np.arange(len(stops) - 1), np.arange(1, len(stops))].sum())
+
+    def _repair_boundaries(self, clusters, routes_by_cluster):
+        """
+        Re-optimiza pares de grupos vecinos partiendo de las rutas actuales
+
+        Los pares (0,1), (2,3)... se resuelven en paralelo y luego los
+        pares (1,2), (3,4)...; un par solo se reemplaza si mejora el
+        objetivo. Solo se usa si cada vehículo hace un único viaje.
+        Actualiza clusters y rutas en sitio.
+        """
+        count = len(clusters)
+        for offset in (0, 1):
+            pairs = [(i, i + 1) for i in range(offset, count - 1, 2)]
+            tasks = []
+            for left, right in pairs:
+                nodes = clusters[left]['nodes'] + clusters[right]['nodes']
+                vehicles = clusters[left]['vehicles'] + clusters[right]['vehicles']
+                capacities = clusters[left]['capacities'] + clusters[right]['capacities']
+                local_index = {node: i for i, node in enumerate([self.depot_index] + nodes)}
+                routes_by_vehicle = {
+                    route['vehicle_id']: [local_index[node] for node in route['stops'][1:-1]]
+                    for route in routes_by_cluster[left] + routes_by_cluster[right]
+                }
+                initial_routes = [routes_by_vehicle.get(vehicle_id, []) for vehicle_id in vehicles]
+                tasks.append(self._build_task(nodes, vehicles, capacities, 'fast', initial_routes))
+
+            for (left, right), (nodes, vehicles, result) in zip(pairs, self._run(tasks)):
+                if result is None:
+                    continue
+                current = sum(self._route_cost(route)
+                              for route in routes_by_cluster[left] + routes_by_cluster[right])
+                if result['objective_value'] >= current:
+                    continue
+
+                repaired = self._to_global_routes(nodes, vehicles, result)
+                left_vehicles = set(clusters[left]['vehicles'])
+                routes_by_cluster[left] = [r for r in repaired if r['vehicle_id'] in left_vehicles]
+                routes_by_cluster[right] = [r for r in repaired if r['vehicle_id'] not in left_vehicles]
+                # Las entregas pueden cambiar de grupo entre vecinos
+                clusters[left] = {
+                    **clusters[left],
+                    'nodes': [n for r in routes_by_cluster[left] for n in r['stops'][1:-1]],
+                }
+                clusters[right] = {
+                    **clusters[right],
+                    'nodes': [n for r in routes_by_cluster[right] for n in r['stops'][1:-1]],
+                }
+
+    def _stitch(self, routes_by_cluster):
+        """Une las rutas de todos los grupos en una sola solución"""
+        routes = sorted(
+            (route for routes in routes_by_cluster for route in routes),
+            key=lambda route: route['vehicle_id'],
+        )
+        return {
+            'routes': routes,
+            'total_distance': sum(route['total_distance'] for route in routes),
+            'total_time': sum(route['total_time'] for route in routes),
+            'objective_value': sum(self._route_cost(route) for route in routes),
+        }
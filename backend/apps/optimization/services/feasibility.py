@@ -0,0 +1,201 @@
+"""
+Verificación rápida de factibilidad antes de lanzar el solver.
+
+Si las ventanas de tiempo o las capacidades son imposibles, OR-Tools
+agota todo su presupuesto y devuelve None sin explicación. Aquí se
+comprueban condiciones necesarias, vectorizadas con NumPy, en
+milisegundos:
+
+- Alcanzabilidad: llegar desde el depósito antes de latest_time.
+- Capacidad: total de paradas contra la suma de max_stops de la flota.
+- Ventanas solapadas: las paradas cuya ventana cae dentro de un mismo
+  intervalo deben atenderse en él; cada llegada cuesta al menos el viaje
+  más corto hacia esa parada, así que la flota no puede atender más de
+  lo que cabe en el intervalo.
+
+Superar las tres no garantiza una solución, pero fallar cualquiera
+garantiza que no existe.
+"""
+import logging
+import numpy as np
+from django.core.cache import cache
+from .candidate_graph import GridIndex, haversine_pairs
+from .route_optimizer import MATRIX_BLOCK_CELLS, AVERAGE_SPEED_M_PER_MIN
+
+logger = logging.getLogger(__name__)
+
+# Horizonte de las ventanas (minutos desde medianoche)
+DAY_MINUTES = 24 * 60
+
+KEY_PREFIX = 'optimization:feasibility:'
+
+# Vigencia de los reportes publicados (segundos)
+REPORT_TIMEOUT = 24 * 3600
+
+
+def delivery_window(delivery):
+    """
+    Ventana de una entrega en minutos desde medianoche
+
+    Returns:
+        Tupla (inicio, fin) o None si la entrega no tiene horario
+    """
+    return window_minutes(delivery.earliest_time, delivery.latest_time)
+
+
+def window_minutes(earliest_time, latest_time):
+    """Ventana (inicio, fin) en minutos a partir de dos time opcionales, o None"""
+    if not earliest_time and not latest_time:
+        return None
+    earliest = earliest_time.hour * 60 + earliest_time.minute if earliest_time else 0
+    latest = latest_time.hour * 60 + latest_time.minute if latest_time else DAY_MINUTES
+    return earliest, latest
+
+
+def min_arrival_times(time_matrix, block_cells=MATRIX_BLOCK_CELLS):
+    """Viaje más corto hacia cada nodo desde cualquier otro nodo, por bloques de filas"""
+    n = len(time_matrix)
+    arrival = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+    rows_per_block = max(1, block_cells // max(n, 1))
+    for start in range(0, n, rows_per_block):
+        block = np.array(time_matrix[start:start + rows_per_block], dtype=np.int64)
+        rows = np.arange(len(block))
+        block[rows, start + rows] = np.iinfo(np.int64).max  # excluir el propio nodo
+        np.minimum(arrival, block.min(axis=0), out=arrival)
+    return np.where(arrival == np.iinfo(np.int64).max, 0, arrival)
+
+
+def travel_times_from_coordinates(lats, lngs, depot_index=0, speed_m_per_min=AVERAGE_SPEED_M_PER_MIN):
+    """
+    Tiempos para check_feasibility sin construir la matriz n² (lotes grandes)
+
+    Returns:
+        Tupla (tiempos desde el depósito, viaje más corto hacia cada nodo)
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    depot_times = haversine_pairs(
+        np.full(len(lats), lats[depot_index]), np.full(len(lngs), lngs[depot_index]), lats, lngs
+    ) // speed_m_per_min
+    nearest = GridIndex(lats, lngs, points_per_cell=2).nearest(1)
+    if nearest.shape[1] == 0:
+        return depot_times, np.zeros(len(lats), dtype=np.int64)
+    # La distancia al vecino más cercano acota el viaje hacia el nodo (métrica simétrica)
+    arrival = haversine_pairs(lats, lngs, lats[nearest[:, 0]], lngs[nearest[:, 0]]) // speed_m_per_min
+    return depot_times, arrival
+
+
+def check_feasibility(depot_times, arrival_times, time_windows=None, num_vehicles=1,
+                      vehicle_capacities=None, depot_index=0):
+    """
+    Condiciones necesarias de factibilidad
+
+    Args:
+        depot_times: Tiempo de viaje desde el depósito a cada nodo (minutos)
+        arrival_times: Viaje más corto hacia cada nodo (ver min_arrival_times)
+        time_windows: Ventanas (inicio, fin) por nodo o None; la del depot
+            fija la salida más temprana
+        num_vehicles: Número de vehículos
+        vehicle_capacities: Máximo de paradas de cada vehículo
+        depot_index: Nodo del depósito
+
+    Returns:
+        Dict con 'feasible', 'unreachable' (nodos), 'capacity_shortfall'
+        (paradas que exceden la flota) y 'window_conflicts' (lista de
+        {'window', 'nodes', 'max_servable'})
+    """
+    depot_times = np.asarray(depot_times, dtype=np.int64)
+    arrival_times = np.asarray(arrival_times, dtype=np.float64)
+    n = len(depot_times)
+    customers = np.arange(n) != depot_index
+
+    earliest = np.zeros(n, dtype=np.int64)
+    latest = np.full(n, DAY_MINUTES, dtype=np.int64)
+    for node, window in enumerate(time_windows or []):
+        if window:
+            earliest[node], latest[node] = window
+    departure = earliest[depot_index]
+
+    unreachable = np.flatnonzero(customers & (departure + depot_times > latest))
+
+    capacity_shortfall = 0
+    total_capacity = sum(vehicle_capacities) if vehicle_capacities else None
+    if total_capacity is not None:
+        capacity_shortfall = max(int(customers.sum()) - total_capacity, 0)
+
+    window_conflicts = _window_conflicts(earliest, latest, arrival_times, customers,
+                                         num_vehicles, total_capacity)
+
+    report = {
+        'feasible': not (len(unreachable) or capacity_shortfall or window_conflicts),
+        'unreachable': unreachable.tolist(),
+        'capacity_shortfall': capacity_shortfall,
+        'window_conflicts': window_conflicts,
+    }
+    if not report['feasible']:
+        logger.warning(
+            f"Instancia infactible: {len(unreachable)} paradas inalcanzables, "
+            f"{capacity_shortfall} sobre la capacidad, {len(window_conflicts)} conflictos de ventanas"
+        )
+    return report
+
+
+def _window_conflicts(earliest, latest, arrival_times, customers, num_vehicles, total_capacity):
+    """Intervalos de ventana con más paradas de las que la flota puede atender"""
+    restricted = customers & ((earliest > 0) | (latest < DAY_MINUTES))
+    intervals = np.unique(np.column_stack((earliest[restricted], latest[restricted])), axis=0)
+    if len(intervals) == 0:
+        return []
+
+    conflicts = []
+    rows_per_block = max(1, MATRIX_BLOCK_CELLS // len(earliest))
+    for start in range(0, len(intervals), rows_per_block):
+        block = intervals[start:start + rows_per_block]
+        # contained[u, i]: la ventana de i cae dentro del intervalo u
+        contained = (customers[None, :]
+                     & (earliest[None, :] >= block[:, :1])
+                     & (latest[None, :] <= block[:, 1:]))
+        counts = contained.sum(axis=1)
+
+        # La primera parada de cada vehículo puede alcanzarse antes del
+        # intervalo; las demás consumen al menos su viaje más corto
+        costs = np.sort(np.where(contained, arrival_times[None, :], np.inf), axis=1)
+        span = (block[:, 1] - block[:, 0]) * num_vehicles
+        servable = num_vehicles + (np.cumsum(costs, axis=1) <= span[:, None]).sum(axis=1)
+        if total_capacity is not None:
+            servable = np.minimum(servable, total_capacity)
+
+        for u in np.flatnonzero(counts > servable):
+            conflicts.append({
+                'window': [int(block[u, 0]), int(block[u, 1])],
+                'nodes': np.flatnonzero(contained[u]).tolist(),
+                'max_servable': int(servable[u]),
+            })
+    return conflicts
+
+
+class FeasibilityReports:
+    """Publica el último reporte de factibilidad de cada lote"""
+
+    @staticmethod
+    def set(batch_id, report):
+        try:
+            cache.set(KEY_PREFIX + str(batch_id), report, REPORT_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar el reporte de factibilidad: {e}")
+
+    @staticmethod
+    def get(batch_id):
+        """Devuelve el reporte o None"""
+        try:
+            return cache.get(KEY_PREFIX + str(batch_id))
+        except Exception as e:
+            logger.warning(f"Reporte de factibilidad no disponible: {e}")
+            return None
+
+    @staticmethod
+    def clear(batch_id):
+        try:
+            cache.delete(KEY_PREFIX + str(batch_id))
+        except Exception as e:
+            logger.warning(f"No se pudo limpiar el reporte de factibilidad: {e}")
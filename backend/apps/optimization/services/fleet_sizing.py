@@ -0,0 +1,152 @@
+"""
+Comparación de flotas (what-if) sobre un mismo lote.
+
+"¿Bastan 3 motos en lugar de 4 camionetas?": cada configuración de flota
+se resuelve en su propio proceso sobre las mismas matrices de
+MatrixStore (a los procesos solo se les envía la ruta del archivo) y se
+devuelve una tabla comparativa. No se escribe ninguna Route.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.cache import cache
+from .matrix_store import matrix_handle, attach_matrix
+from .route_optimizer import RouteOptimizer, DEFAULT_DROP_PENALTY
+
+logger = logging.getLogger(__name__)
+
+# Máximo de configuraciones por comparación
+MAX_FLEET_SCENARIOS = 8
+
+# Preset de cada escenario: basta para comparar flotas entre sí
+SCENARIO_PRESET = 'fast'
+
+KEY_PREFIX = 'optimization:fleet_scenarios:'
+
+# Vigencia de la última comparación publicada (segundos)
+SCENARIOS_TIMEOUT = 24 * 3600
+
+# Optimizador de cada proceso del pool (ver _init_scenario_worker)
+_scenario_state = {}
+
+
+def scenario_capacities(scenario):
+    """
+    Máximo de paradas de cada vehículo de un escenario
+
+    Args:
+        scenario: Dict con 'count' y 'max_stops', o con 'capacities'
+            (lista por vehículo, tiene prioridad)
+
+    Returns:
+        Lista de capacidades o None si la flota no tiene límite de paradas
+    """
+    if scenario.get('capacities'):
+        return [int(capacity) for capacity in scenario['capacities']]
+    if scenario.get('max_stops'):
+        return [int(scenario['max_stops'])] * int(scenario['count'])
+    return None
+
+
+def _init_scenario_worker(distance_matrix, time_matrix, depot_index):
+    _scenario_state['optimizer'] = RouteOptimizer(
+        attach_matrix(distance_matrix), attach_matrix(time_matrix), depot_index
+    )
+
+
+def _solve_scenario(optimize_kwargs):
+    """Resuelve un escenario; se ejecuta en un proceso del pool"""
+    return _scenario_state['optimizer'].optimize(**optimize_kwargs)
+
+
+def compare_fleets(distance_matrix, time_matrix, scenarios, time_windows=None, depot_index=0,
+                   processes=None, departure=0):
+    """
+    Resuelve varias configuraciones de flota en paralelo
+
+    Las entregas que no caben en una flota se descartan con
+    DEFAULT_DROP_PENALTY para que el escenario igual tenga resultado.
+
+    Args:
+        distance_matrix: Matriz de distancias (idealmente de MatrixStore)
+        time_matrix: Matriz de tiempos en minutos
+        scenarios: Lista de dicts con 'count', 'max_stops'/'capacities' y
+            opcionalmente 'name'
+        time_windows: Ventanas por nodo o None
+        depot_index: Nodo del depósito
+        processes: Máximo de procesos (por defecto, núcleos disponibles)
+        departure: Minuto del día en que sale la flota (ver fleet_departure)
+
+    Returns:
+        Lista (una fila por escenario, en el mismo orden) de dicts con
+        'name', 'vehicles', 'routes_used', 'total_distance' (metros),
+        'total_time' (minutos), 'longest_route_time' y 'unassigned'
+        (nodos); las métricas son None si el escenario no tiene solución
+    """
+    requests = [
+        {
+            'num_vehicles': int(scenario['count']),
+            'vehicle_capacities': scenario_capacities(scenario),
+            'time_windows': time_windows,
+            'preset': SCENARIO_PRESET,
+            'drop_penalty': DEFAULT_DROP_PENALTY,
+            'departure': departure,
+        }
+        for scenario in scenarios
+    ]
+
+    workers = min(processes or os.cpu_count() or 1, len(requests))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_scenario_worker,
+            initargs=(matrix_handle(distance_matrix), matrix_handle(time_matrix), depot_index),
+        ) as executor:
+            results = list(executor.map(_solve_scenario, requests))
+    except (AssertionError, OSError) as e:
+        # Los procesos daemon (p.ej. workers prefork de Celery) no pueden crear hijos
+        logger.warning(f"Pool de procesos no disponible, escenarios en secuencia: {e}")
+        optimizer = RouteOptimizer(distance_matrix, time_matrix, depot_index)
+        results = [optimizer.optimize(**kwargs) for kwargs in requests]
+
+    rows = []
+    for i, (scenario, result) in enumerate(zip(scenarios, results)):
+        row = {
+            'name': scenario.get('name') or f'Flota {i + 1}',
+            'vehicles': int(scenario['count']),
+            'routes_used': None,
+            'total_distance': None,
+            'total_time': None,
+            'longest_route_time': None,
+            'unassigned': None,
+        }
+        if result:
+            row.update(
+                routes_used=len(result['routes']),
+                total_distance=result['total_distance'],
+                total_time=result['total_time'],
+                longest_route_time=max((route['total_time'] for route in result['routes']), default=0),
+                unassigned=result['unassigned'],
+            )
+        rows.append(row)
+    return rows
+
+
+class FleetScenarios:
+    """Publica la última comparación de flotas de cada lote"""
+
+    @staticmethod
+    def set(batch_id, comparison):
+        try:
+            cache.set(KEY_PREFIX + str(batch_id), comparison, SCENARIOS_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar la comparación de flotas: {e}")
+
+    @staticmethod
+    def get(batch_id):
+        """Devuelve la comparación o None"""
+        try:
+            return cache.get(KEY_PREFIX + str(batch_id))
+        except Exception as e:
+            logger.warning(f"Comparación de flotas no disponible: {e}")
+            return None
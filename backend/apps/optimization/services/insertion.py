@@ -0,0 +1,271 @@
+"""
+Inserción más barata de una entrega en rutas ya planificadas.
+
+Los pedidos del mismo día no requieren re-optimizar el lote completo: se
+evalúan a la vez todas las posiciones de todas las rutas (O(total de
+paradas)) y se elige la de menor costo adicional que respete la
+capacidad del vehículo y las ventanas de tiempo. Solo se reescribe la
+ruta afectada: la nueva parada y las siguientes reciben su hora estimada
+de llegada.
+"""
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from apps.core.models import Delivery, DeliveryBatch, Route, Stop
+from .candidate_graph import haversine_pairs
+from .feasibility import delivery_window
+from .instance import fleet_departure
+from .route_optimizer import AVERAGE_SPEED_M_PER_MIN
+from .speed_model import DEFAULT_DEPARTURE_HOUR, load_speed_table
+
+logger = logging.getLogger(__name__)
+
+# Ventana de una parada sin horario
+OPEN_WINDOW = (0, 24 * 60)
+
+
+def _node_pace(lats, lngs, speed_table, vehicle_type, hour):
+    """
+    Minutos por metro de cada nodo según la tabla de velocidades, o None
+    sin tabla; un arco usa el promedio de sus extremos, como
+    build_vehicle_time_matrix
+    """
+    if speed_table is None:
+        return None
+    return 1.0 / speed_table.node_speeds(lats, lngs, vehicle_type, hour)
+
+
+def find_cheapest_insertion(depot, routes, point, window=OPEN_WINDOW,
+                            departure=DEFAULT_DEPARTURE_HOUR * 60, speed_m_per_min=AVERAGE_SPEED_M_PER_MIN,
+                            speed_table=None):
+    """
+    Mejor posición factible para una nueva parada
+
+    Se permite esperar si se llega antes de la ventana, igual que la
+    dimensión de tiempo de RouteOptimizer.
+
+    Args:
+        depot: Tupla (lat, lng) del depósito
+        routes: Lista de dicts con 'coordinates' (lista de (lat, lng) de
+            las paradas, sin depot), 'windows' (lista de (inicio, fin) en
+            minutos), 'capacity' (máximo de paradas) y opcionalmente
+            'first_position' (posiciones anteriores fijas, ya visitadas)
+            y 'vehicle_type' (tipo del vehículo en la tabla de velocidades)
+        point: Tupla (lat, lng) de la nueva parada
+        window: Ventana (inicio, fin) de la nueva parada en minutos
+        departure: Minuto de salida del depósito; fija también la hora de
+            la tabla de velocidades
+        speed_m_per_min: Velocidad fija si no hay tabla de velocidades
+        speed_table: SpeedTable con que se construyen las matrices del solver
+
+    Returns:
+        Dict con 'route_index', 'position' (índice en la lista de paradas
+        antes del cual se inserta), 'cost' (metros adicionales del
+        recorrido cerrado) y 'added_distance' (metros adicionales sin el
+        regreso al depot, como los totales de _extract_solution), o None
+        si ninguna posición es factible
+    """
+    candidates = []
+    for route_index, route in enumerate(routes):
+        stops = list(route['coordinates'])
+        if len(stops) + 1 > route['capacity']:
+            continue
+
+        # Recorrido cerrado: depot, paradas, depot
+        nodes = np.array([depot] + stops + [depot], dtype=np.float64)
+        windows = np.array([OPEN_WINDOW] + list(route['windows']) + [OPEN_WINDOW], dtype=np.int64)
+        lats, lngs = nodes[:, 0], nodes[:, 1]
+
+        leg = haversine_pairs(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).astype(np.int64)
+        to_point = haversine_pairs(lats, lngs, np.full(len(nodes), point[0]), np.full(len(nodes), point[1]))
+        to_point = to_point.astype(np.int64)
+        pace = _node_pace(lats, lngs, speed_table, route.get('vehicle_type'), departure // 60)
+        if pace is None:
+            leg_time, point_time = leg // speed_m_per_min, to_point // speed_m_per_min
+        else:
+            point_pace = _node_pace([point[0]], [point[1]], speed_table, route.get('vehicle_type'), departure // 60)
+            leg_time = (leg * (pace[:-1] + pace[1:]) / 2).astype(np.int64)
+            point_time = (to_point * (pace + point_pace) / 2).astype(np.int64)
+
+        # Inicio de servicio hacia adelante (con espera) y último inicio
+        # admisible hacia atrás para no romper las ventanas siguientes
+        start = np.empty(len(nodes), dtype=np.int64)
+        start[0] = departure
+        for i in range(1, len(nodes)):
+            start[i] = max(start[i - 1] + leg_time[i - 1], windows[i, 0])
+        latest = np.empty(len(nodes), dtype=np.int64)
+        latest[-1] = windows[-1, 1]
+        for i in range(len(nodes) - 2, -1, -1):
+            latest[i] = min(windows[i, 1], latest[i + 1] - leg_time[i])
+
+        # Posición p: entre nodes[p] y nodes[p + 1]
+        before, after = np.arange(len(nodes) - 1), np.arange(1, len(nodes))
+        arrival = np.maximum(start[before] + point_time[before], window[0])
+        next_start = np.maximum(arrival + point_time[after], windows[after, 0])
+        feasible = (arrival <= window[1]) & (next_start <= latest[after])
+        feasible &= before >= route.get('first_position', 0)
+
+        delta = to_point[before] + to_point[after] - leg
+        # Al final de la ruta los totales guardados no incluyen el regreso
+        added = delta.copy()
+        added[-1] = to_point[-2]
+        for position in np.flatnonzero(feasible):
+            candidates.append((int(delta[position]), route_index, int(position), int(added[position])))
+
+    if not candidates:
+        return None
+    cost, route_index, position, added_distance = min(candidates)
+    return {
+        'route_index': route_index,
+        'position': position,
+        'cost': cost,
+        'added_distance': added_distance,
+    }
+
+
+def forward_schedule(origin, start, points, windows, speed_m_per_min=AVERAGE_SPEED_M_PER_MIN, speed_table=None,
+                     vehicle_type=None, hour=DEFAULT_DEPARTURE_HOUR):
+    """
+    Llegada a cada parada recorriendo points desde origin
+
+    Como en find_cheapest_insertion, se espera si se llega antes de la ventana.
+
+    Args:
+        origin: Tupla (lat, lng) de partida
+        start: Minuto del día en que se sale de origin
+        points: Lista de (lat, lng) de las paradas en orden
+        windows: Ventana (inicio, fin) de cada parada en minutos
+        speed_m_per_min: Velocidad fija si no hay tabla de velocidades
+        speed_table, vehicle_type, hour: Tabla de velocidades, tipo de
+            vehículo y hora de salida (ver find_cheapest_insertion)
+
+    Returns:
+        Lista de minutos del día, una por parada
+    """
+    nodes = np.array([origin] + list(points), dtype=np.float64)
+    legs = haversine_pairs(nodes[:-1, 0], nodes[:-1, 1], nodes[1:, 0], nodes[1:, 1]).astype(np.int64)
+    pace = _node_pace(nodes[:, 0], nodes[:, 1], speed_table, vehicle_type, hour)
+    if pace is None:
+        leg_times = legs // speed_m_per_min
+    else:
+        leg_times = (legs * (pace[:-1] + pace[1:]) / 2).astype(np.int64)
+    arrivals, clock = [], start
+    for leg_time, (opening, _) in zip(leg_times, windows):
+        clock = max(clock + int(leg_time), opening)
+        arrivals.append(clock)
+    return arrivals
+
+
+def _window(delivery):
+    return delivery_window(delivery) or OPEN_WINDOW
+
+
+def _point(coordinates):
+    return coordinates['lat'], coordinates['lng']
+
+
+@transaction.atomic
+def insert_delivery(batch, delivery):
+    """
+    Inserta una entrega en la posición más barata de las rutas del lote
+
+    Las paradas ya visitadas de una ruta quedan fijas y las rutas
+    completadas no se modifican. La entrega queda asignada y su parada y
+    las siguientes reciben la hora estimada de llegada, a partir de la de
+    la parada anterior (o de la salida de la flota si no la tiene).
+
+    La lectura, el cálculo y la escritura van en una transacción con la
+    fila del lote bloqueada, como en save_solution: dos inserciones
+    simultáneas (o una inserción y una re-optimización) no calculan sobre
+    las mismas rutas ni se pisan el orden de las paradas.
+
+    Returns:
+        Stop creado (o el que ya tenía la entrega) o None si no hay
+        posición factible
+    """
+    DeliveryBatch.objects.select_for_update().filter(id=batch.id).exists()
+    existing = Stop.objects.filter(delivery=delivery).first()
+    if existing is not None:
+        # Otra petición la insertó mientras se esperaba el bloqueo
+        return existing
+    routes = list(
+        batch.routes.exclude(status='completed')
+        .select_for_update(of=('self',))
+        .select_related('vehicle')
+        .order_by('route_order')
+    )
+    stops = (
+        Stop.objects.filter(route__in=routes)
+        .select_related('delivery')
+        .order_by('route__route_order', 'stop_order')
+    )
+    stops_by_route = {route.id: [] for route in routes}
+    for stop in stops:
+        stops_by_route[stop.route_id].append(stop)
+
+    candidates = []
+    for route in routes:
+        route_stops = [stop for stop in stops_by_route[route.id] if stop.delivery.coordinates]
+        visited = 0
+        while visited < len(route_stops) and route_stops[visited].status != 'pending':
+            visited += 1
+        candidates.append({
+            'coordinates': [_point(stop.delivery.coordinates) for stop in route_stops],
+            'windows': [_window(stop.delivery) for stop in route_stops],
+            'capacity': route.vehicle.max_stops,
+            'first_position': visited,
+            'vehicle_type': route.vehicle.vehicle_type,
+            'stops': route_stops,
+        })
+
+    depot = _point(batch.depot_coordinates)
+    openings = [window[0] for candidate in candidates for window in candidate['windows']]
+    departure = fleet_departure(openings + [_window(delivery)[0]])
+    # Mismos tiempos que el solver: tabla de velocidades a la hora de salida si existe
+    speed_table = load_speed_table()
+    best = find_cheapest_insertion(depot, candidates, _point(delivery.coordinates), _window(delivery), departure,
+                                   speed_table=speed_table)
+    if best is None:
+        logger.warning(f"Sin posición factible para la entrega {delivery.id} en el lote {batch.id}")
+        return None
+
+    route = routes[best['route_index']]
+    route_stops = candidates[best['route_index']]['stops']
+    position = best['position']
+    stop_order = route_stops[position].stop_order if position < len(route_stops) else (
+        route_stops[-1].stop_order + 1 if route_stops else 1
+    )
+
+    # ETAs de la nueva parada y las siguientes, desde la parada anterior o el depósito
+    midnight = timezone.make_aware(datetime.combine(batch.delivery_date, datetime.min.time()))
+    previous = route_stops[position - 1] if position > 0 else None
+    if previous is not None and previous.estimated_arrival_time is not None:
+        origin = _point(previous.delivery.coordinates)
+        start = int((previous.estimated_arrival_time - midnight).total_seconds() // 60)
+    else:
+        origin, start = depot, departure
+    following = route_stops[position:]
+    arrivals = forward_schedule(
+        origin, start,
+        [_point(delivery.coordinates)] + [_point(other.delivery.coordinates) for other in following],
+        [_window(delivery)] + [_window(other.delivery) for other in following],
+        speed_table=speed_table, vehicle_type=route.vehicle.vehicle_type, hour=departure // 60,
+    )
+    for other, arrival in zip(following, arrivals[1:]):
+        other.estimated_arrival_time = midnight + timedelta(minutes=arrival)
+
+    # Solo se reescribe la ruta afectada
+    Stop.objects.filter(route=route, stop_order__gte=stop_order).update(stop_order=F('stop_order') + 1)
+    stop = Stop.objects.create(route=route, delivery=delivery, stop_order=stop_order,
+                               estimated_arrival_time=midnight + timedelta(minutes=arrivals[0]))
+    Stop.objects.bulk_update(following, ['estimated_arrival_time'])
+    Delivery.objects.filter(id=delivery.id).update(status='assigned', updated_at=timezone.now())
+    added_km = Decimal(best['added_distance']) / 1000
+    Route.objects.filter(id=route.id).update(total_distance_km=F('total_distance_km') + added_km)
+    if batch.total_distance_km is not None:
+        DeliveryBatch.objects.filter(id=batch.id).update(total_distance_km=F('total_distance_km') + added_km)
+    return stop
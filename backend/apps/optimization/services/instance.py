@@ -0,0 +1,107 @@
+"""
+Instancia compilada de un lote, entre el ORM y el solver.
+
+Se leen solo las columnas necesarias con values_list (sin cargar
+direcciones, descripciones ni instrucciones) y se producen arreglos
+contiguos indexados por nodo, con el depósito en el nodo 0. El mapa
+nodo → entrega se fija al compilar y lo reutilizan todas las etapas:
+verificación previa, matrices, solver y persistencia.
+"""
+import numpy as np
+from .feasibility import window_minutes, DAY_MINUTES
+from .speed_model import DEFAULT_DEPARTURE_HOUR
+
+
+def fleet_departure(openings):
+    """
+    Minuto del día en que sale la flota: DEFAULT_DEPARTURE_HOUR, o la
+    primera ventana que abre si es más tarde
+
+    Args:
+        openings: Inicio en minutos de la ventana de cada entrega (0 sin horario)
+    """
+    opening = [int(value) for value in openings if value > 0]
+    default = DEFAULT_DEPARTURE_HOUR * 60
+    return max(default, min(opening)) if opening else default
+
+
+class ProblemInstance:
+    """Depósito y entregas con coordenadas de un lote como arreglos por nodo"""
+
+    def __init__(self, batch_id, lats, lngs, windows, delivery_ids):
+        """
+        Args:
+            batch_id: ID del lote
+            lats, lngs: Coordenadas por nodo (depot en 0)
+            windows: Arreglo (n, 2) de ventanas en minutos; sin horario = (0, DAY_MINUTES)
+            delivery_ids: ID de la entrega de cada nodo a partir del 1
+        """
+        self.batch_id = batch_id
+        self.lats = np.ascontiguousarray(lats, dtype=np.float64)
+        self.lngs = np.ascontiguousarray(lngs, dtype=np.float64)
+        self.windows = np.ascontiguousarray(windows, dtype=np.int32)
+        self.delivery_ids = list(delivery_ids)
+        self.num_nodes = len(self.lats)
+        # Una parada por entrega: la capacidad de los vehículos se mide en paradas
+        self.demands = np.ones(self.num_nodes, dtype=np.int32)
+        self.demands[0] = 0
+        self._node_of = None
+
+    @classmethod
+    def from_batch(cls, batch):
+        """Compila el lote con una sola consulta de columnas"""
+        rows = (
+            batch.deliveries.order_by('created_at', 'id')
+            .values_list('id', 'coordinates', 'earliest_time', 'latest_time')
+        )
+        lats, lngs = [batch.depot_coordinates['lat']], [batch.depot_coordinates['lng']]
+        windows, delivery_ids = [(0, DAY_MINUTES)], []
+        for delivery_id, coordinates, earliest, latest in rows:
+            if not coordinates:
+                continue
+            lats.append(coordinates['lat'])
+            lngs.append(coordinates['lng'])
+            windows.append(window_minutes(earliest, latest) or (0, DAY_MINUTES))
+            delivery_ids.append(delivery_id)
+        return cls(batch.id, lats, lngs, windows, delivery_ids)
+
+    @property
+    def num_deliveries(self):
+        return self.num_nodes - 1
+
+    @property
+    def coordinates(self):
+        """Arreglo (n, 2) de (lat, lng), depot primero"""
+        return np.column_stack((self.lats, self.lngs))
+
+    @property
+    def time_windows(self):
+        """Ventanas en el formato de RouteOptimizer, o None si ninguna entrega tiene horario"""
+        restricted = (self.windows[:, 0] > 0) | (self.windows[:, 1] < DAY_MINUTES)
+        restricted[0] = False
+        if not restricted.any():
+            return None
+        return [None] + [
+            (int(start), int(end)) if flag else None
+            for (start, end), flag in zip(self.windows[1:], restricted[1:])
+        ]
+
+    @property
+    def departure(self):
+        """Minuto del día en que sale la flota (ver fleet_departure)"""
+        return fleet_departure(self.windows[1:, 0])
+
+    @property
+    def departure_hour(self):
+        """Hora de salida de la flota (ver departure)"""
+        return self.departure // 60
+
+    def delivery_id(self, node):
+        """Entrega atendida en un nodo"""
+        return self.delivery_ids[node - 1]
+
+    def node_of(self, delivery_id):
+        """Nodo de una entrega, o None si no forma parte de la instancia"""
+        if self._node_of is None:
+            self._node_of = {delivery_id: node for node, delivery_id in enumerate(self.delivery_ids, 1)}
+        return self._node_of.get(delivery_id)
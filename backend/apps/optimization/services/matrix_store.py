@@ -0,0 +1,120 @@
+"""
+Almacén de matrices int32 compartidas entre procesos.
+
+Las matrices de distancia y tiempo se guardan como archivos .npy en un
+directorio local (tmpfs por defecto) direccionados por el hash de las
+coordenadas. Reintentos, corridas del portafolio y escenarios what-if
+del mismo nodo las abren con memmap de solo lectura: todos los procesos
+comparten las mismas páginas y a los procesos hijos solo se les envía la
+ruta del archivo en lugar de la matriz serializada.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import uuid
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def matrix_key(coordinates, kind, **params):
+    """
+    Clave estable de una matriz
+
+    Args:
+        coordinates: Lista de tuplas (lat, lng), depot primero
+        kind: Tipo de matriz ('distance', 'time'...)
+        **params: Parámetros que cambian el contenido (p.ej. velocidad)
+
+    Returns:
+        Hex digest SHA-256
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(coordinates, dtype=np.float64).tobytes())
+    digest.update(repr((kind, sorted(params.items()))).encode())
+    return digest.hexdigest()
+
+
+class MatrixStore:
+    """Matrices int32 en archivos mapeados en memoria con desalojo por tamaño"""
+
+    @staticmethod
+    def get_or_build(key, builder):
+        """
+        Abre la matriz guardada o la construye y la guarda
+
+        Args:
+            key: Clave de la matriz (ver matrix_key)
+            builder: Función sin argumentos que devuelve la matriz
+
+        Returns:
+            np.memmap int32 de solo lectura, o el arreglo construido si el
+            almacén no está disponible
+        """
+        path = MatrixStore._path(key)
+        try:
+            matrix = np.load(path, mmap_mode='r')
+            os.utime(path)
+            return matrix
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Matriz guardada ilegible, se reconstruye: {e}")
+
+        matrix = np.asarray(builder(), dtype=np.int32)
+        try:
+            os.makedirs(settings.OPTIMIZATION_MATRIX_DIR, exist_ok=True)
+            # Escritura atómica: otros procesos nunca ven un archivo a medias
+            partial = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(partial, 'wb') as handle:
+                np.save(handle, matrix)
+            os.replace(partial, path)
+            MatrixStore._evict(keep=path)
+            return np.load(path, mmap_mode='r')
+        except OSError as e:
+            logger.warning(f"Almacén de matrices no disponible: {e}")
+            return matrix
+
+    @staticmethod
+    def _path(key):
+        return os.path.join(settings.OPTIMIZATION_MATRIX_DIR, f'{key}.npy')
+
+    @staticmethod
+    def _evict(keep):
+        """Borra las matrices usadas hace más tiempo hasta respetar el tamaño máximo"""
+        entries = []
+        with os.scandir(settings.OPTIMIZATION_MATRIX_DIR) as scan:
+            for entry in scan:
+                if entry.name.endswith('.npy'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= settings.OPTIMIZATION_MATRIX_MAX_BYTES:
+                break
+            if path == keep:
+                continue
+            # Los procesos que ya la tienen abierta conservan su mapeo
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def matrix_handle(matrix):
+    """Referencia liviana para enviar una matriz a otro proceso"""
+    # Solo el mapeo completo del archivo; una vista (p.ej. un recorte) se copia
+    if isinstance(matrix, np.memmap) and isinstance(matrix.base, mmap.mmap):
+        return {'path': matrix.filename}
+    return matrix
+
+
+def attach_matrix(handle):
+    """Abre una matriz recibida con matrix_handle sin copiarla"""
+    if isinstance(handle, dict):
+        return np.load(handle['path'], mmap_mode='r')
+    return handle
@@ -0,0 +1,80 @@
+"""
+Persistencia de la solución de un lote.
+
+Rutas, paradas, estados de las entregas y totales del lote se escriben en
+una sola transacción con un número fijo de consultas, sin importar
+cuántas paradas tenga el lote: si algo falla no quedan rutas a medias.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from apps.core.models import DeliveryBatch, Route, Stop
+
+
+def save_solution(batch, instance, result, origin, should_persist=None):
+    """
+    Reemplaza las rutas del lote por las de la solución
+
+    Args:
+        batch: DeliveryBatch
+        instance: ProblemInstance con que se resolvió
+        result: Resultado del solver con 'routes' (y sus 'arrivals') y 'unassigned'
+        origin: Instante del minuto 0 de las llegadas
+        should_persist: Función opcional sin argumentos; se consulta con la
+            fila del lote bloqueada y, si devuelve False (corrida cancelada
+            o reemplazada), no se escribe nada
+
+    Returns:
+        Lista de las Route creadas, o None si la corrida ya no debía guardarse
+    """
+    # Vehículo y conductor se leen una sola vez para todas las rutas
+    vehicle = batch.owner.vehicles.first()
+    driver = batch.owner.drivers.first()
+
+    routes, stops = [], []
+    for i, route_data in enumerate(result['routes']):
+        route = Route(
+            batch=batch,
+            vehicle=vehicle,
+            driver=driver,
+            route_order=i + 1,
+            total_distance_km=route_data['total_distance'] / 1000,
+            estimated_duration_minutes=route_data['total_time'],
+            status='planned'
+        )
+        routes.append(route)
+
+        # Sin depot inicial y final; las rutas de la caché anteriores a las ETAs no las traen
+        arrivals = route_data.get('arrivals') or [None] * len(route_data['stops'])
+        for stop_order, (node, arrival) in enumerate(zip(route_data['stops'][1:-1], arrivals[1:-1]), 1):
+            stops.append(Stop(
+                route=route,
+                delivery_id=instance.delivery_id(node),
+                stop_order=stop_order,
+                estimated_arrival_time=origin + timedelta(minutes=arrival) if arrival is not None else None,
+            ))
+
+    assigned = [stop.delivery_id for stop in stops]
+    with transaction.atomic():
+        if should_persist is not None:
+            # La cancelación bloquea la misma fila (ver cancel_optimization)
+            DeliveryBatch.objects.select_for_update().filter(id=batch.id).exists()
+            if not should_persist():
+                return None
+        batch.routes.all().delete()
+        Route.objects.bulk_create(routes)
+        Stop.objects.bulk_create(stops)
+
+        # Asignadas las entregas con parada; las demás aún sin despachar vuelven a pendiente
+        batch.deliveries.filter(status__in=['pending', 'assigned']).update(
+            status=Case(When(id__in=assigned, then=Value('assigned')), default=Value('pending')),
+            updated_at=timezone.now(),
+        )
+
+        batch.status = 'ready'
+        batch.unassigned_deliveries = [str(instance.delivery_id(node)) for node in result.get('unassigned', [])]
+        batch.total_distance_km = result['total_distance'] / 1000
+        batch.estimated_duration_minutes = result['total_time']
+        batch.save()
+    return routes
@@ -0,0 +1,154 @@
+"""
+Rutas de vista previa en tiempo real.
+
+Mientras el despachador captura entregas no hace falta la calidad de
+OR-Tools: basta una ruta aproximada en milisegundos. Se construyen rutas
+por vecino más cercano y se mejoran con 2-opt y Or-opt vectorizados con
+NumPy hasta agotar un presupuesto de tiempo estricto. Corre dentro de la
+petición, sin pasar por Celery.
+"""
+import time
+import numpy as np
+from .route_optimizer import build_distance_matrix, build_time_matrix
+
+# Presupuesto total de la vista previa (segundos)
+PREVIEW_TIME_BUDGET = 0.25
+
+# Máximo de paradas aceptadas por la vista previa
+MAX_PREVIEW_STOPS = 500
+
+# Máximo de vehículos aceptados por la vista previa
+MAX_PREVIEW_VEHICLES = 50
+
+# Largo máximo de los segmentos que mueve Or-opt
+OR_OPT_SEGMENT = 3
+
+
+def nearest_neighbour_routes(matrix, num_vehicles, vehicle_capacities=None, depot_index=0):
+    """
+    Construye rutas por vecino más cercano, llenando un vehículo a la vez
+
+    Sin capacidades, las paradas se reparten en partes iguales entre los
+    vehículos para que la vista previa use toda la flota.
+
+    Returns:
+        Lista (una por vehículo) de nodos sin depot
+    """
+    n = len(matrix)
+    customers = n - 1
+    if vehicle_capacities is None:
+        vehicle_capacities = [-(-customers // num_vehicles)] * num_vehicles
+
+    unvisited = np.ones(n, dtype=bool)
+    unvisited[depot_index] = False
+    routes = []
+    for capacity in vehicle_capacities:
+        route = []
+        current = depot_index
+        while len(route) < capacity and unvisited.any():
+            distances = np.where(unvisited, matrix[current], np.iinfo(np.int64).max)
+            current = int(distances.argmin())
+            unvisited[current] = False
+            route.append(current)
+        routes.append(route)
+    return routes
+
+
+def two_opt(tour, matrix, deadline):
+    """
+    2-opt vectorizado sobre un recorrido cerrado (depot al inicio y al final)
+
+    En cada pasada se evalúan todos los pares de arcos a la vez y se
+    aplica la mejor inversión. Supone una matriz simétrica.
+    """
+    tour = np.asarray(tour)
+    while len(tour) > 4 and time.monotonic() < deadline:
+        a, b = tour[:-1], tour[1:]
+        # Reemplazar (a_i, b_i) y (a_j, b_j) por (a_i, a_j) y (b_i, b_j)
+        delta = (matrix[a[:, None], a[None, :]] + matrix[b[:, None], b[None, :]]
+                 - matrix[a, b][:, None] - matrix[a, b][None, :])
+        delta = np.triu(delta, k=2)
+        i, j = np.unravel_index(delta.argmin(), delta.shape)
+        if delta[i, j] >= 0:
+            break
+        tour = np.concatenate((tour[:i + 1], tour[j:i:-1], tour[j + 1:]))
+    return tour
+
+
+def or_opt(tour, matrix, deadline):
+    """
+    Or-opt: mueve segmentos de 1 a OR_OPT_SEGMENT paradas a la mejor
+    posición del mismo recorrido, evaluando todas las posiciones a la vez
+    """
+    tour = np.asarray(tour)
+    improved = True
+    while improved and time.monotonic() < deadline:
+        improved = False
+        for length in range(1, OR_OPT_SEGMENT + 1):
+            for start in range(1, len(tour) - length):
+                end = start + length - 1
+                prev, first, last, nxt = tour[start - 1], tour[start], tour[end], tour[end + 1]
+                removal = matrix[prev, first] + matrix[last, nxt] - matrix[prev, nxt]
+
+                rest = np.concatenate((tour[:start], tour[end + 1:]))
+                a, b = rest[:-1], rest[1:]
+                insertion = matrix[a, first] + matrix[last, b] - matrix[a, b]
+                position = int(insertion.argmin())
+                if insertion[position] < removal:
+                    # El largo del recorrido no cambia: se sigue recorriendo
+                    segment = tour[start:end + 1]
+                    tour = np.concatenate((rest[:position + 1], segment, rest[position + 1:]))
+                    improved = True
+            if time.monotonic() >= deadline:
+                break
+    return tour
+
+
+def preview_routes(coordinates, num_vehicles, vehicle_capacities=None, time_budget=PREVIEW_TIME_BUDGET):
+    """
+    Rutas aproximadas dentro de un presupuesto de tiempo
+
+    Args:
+        coordinates: Lista de tuplas (lat, lng), depot primero
+        num_vehicles: Número de vehículos
+        vehicle_capacities: Máximo de paradas de cada vehículo
+        time_budget: Segundos disponibles para construir y mejorar
+
+    Returns:
+        Dict con el formato de RouteOptimizer._extract_solution más
+        'unassigned' (nodos que exceden la capacidad de la flota)
+    """
+    deadline = time.monotonic() + time_budget
+    lats, lngs = np.asarray(coordinates, dtype=np.float64).T
+    matrix = build_distance_matrix(lats, lngs).astype(np.int64)
+    time_matrix = build_time_matrix(matrix)
+
+    initial_routes = nearest_neighbour_routes(matrix, num_vehicles, vehicle_capacities)
+    assigned = {node for stops in initial_routes for node in stops}
+    pending = [stops for stops in initial_routes if stops]
+
+    routes = []
+    for vehicle_id, stops in enumerate(initial_routes):
+        if not stops:
+            continue
+        # Repartir el tiempo restante entre las rutas que faltan por mejorar
+        route_deadline = time.monotonic() + (deadline - time.monotonic()) / len(pending)
+        pending.pop()
+        tour = np.array([0] + stops + [0])
+        tour = or_opt(two_opt(tour, matrix, route_deadline), matrix, route_deadline)
+        # Igual que _extract_solution: sin el arco de regreso al depot
+        routes.append({
+            'vehicle_id': vehicle_id,
+            'stops': tour.tolist(),
+            'total_distance': int(matrix[tour[:-2], tour[1:-1]].sum()),
+            'total_time': int(time_matrix[tour[:-2], tour[1:-1]].sum()),
+        })
+
+    return {
+        'routes': routes,
+        'total_distance': sum(route['total_distance'] for route in routes),
+        'total_time': sum(route['total_time'] for route in routes),
+        'objective_value': sum(int(matrix[route['stops'][:-1], route['stops'][1:]].sum()) for route in routes),
+        # Paradas que no caben en la flota
+        'unassigned': [node for node in range(1, len(matrix)) if node not in assigned],
+    }
@@ -0,0 +1,67 @@
+"""
+Progreso en vivo de una optimización.
+
+RouteOptimizer emite eventos (mejor objetivo, tiempo transcurrido y rutas
+usadas) desde su callback de soluciones; aquí se publican en la caché
+(Redis) por lote para que la API pueda mostrar la curva de convergencia
+mientras la tarea sigue resolviendo.
+"""
+import logging
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'optimization:progress:'
+
+# Puntos conservados de la curva de convergencia
+MAX_PROGRESS_EVENTS = 300
+
+# Vigencia del progreso publicado (segundos)
+PROGRESS_TIMEOUT = 3600
+
+
+class OptimizationProgress:
+    """Publica y consulta el progreso del solver por lote"""
+
+    @staticmethod
+    def publish(batch_id, event):
+        """Agrega un evento a la curva del lote"""
+        try:
+            key = KEY_PREFIX + str(batch_id)
+            events = cache.get(key) or []
+            events.append(event)
+            cache.set(key, events[-MAX_PROGRESS_EVENTS:], PROGRESS_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo publicar el progreso de la optimización: {e}")
+
+    @staticmethod
+    def get(batch_id):
+        """
+        Progreso publicado del lote
+
+        Returns:
+            Dict {'latest', 'events'} o None si no hay eventos
+        """
+        try:
+            events = cache.get(KEY_PREFIX + str(batch_id))
+        except Exception as e:
+            logger.warning(f"Progreso de la optimización no disponible: {e}")
+            return None
+        if not events:
+            return None
+        return {'latest': events[-1], 'events': events}
+
+    @staticmethod
+    def clear(batch_id):
+        """Descarta el progreso de una corrida anterior"""
+        try:
+            cache.delete(KEY_PREFIX + str(batch_id))
+        except Exception as e:
+            logger.warning(f"No se pudo limpiar el progreso de la optimización: {e}")
+
+    @staticmethod
+    def reporter(batch_id):
+        """Callback para RouteOptimizer.optimize(progress_callback=...)"""
+        def report(event):
+            OptimizationProgress.publish(batch_id, event)
+        return report
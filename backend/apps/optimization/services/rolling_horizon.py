@@ -0,0 +1,185 @@
+"""
+Re-optimización intradía (horizonte rodante) de lotes en curso.
+
+Durante el día se acumulan paradas fallidas y pedidos nuevos, pero el
+lote ya no parte del depósito. Aquí cada vehículo sale de su última
+LocationUpdate, las paradas ya visitadas quedan fijas y solo se vuelve a
+resolver el sufijo pendiente (más las entregas sin ruta), partiendo del
+orden actual y con un presupuesto de tiempo corto.
+"""
+import logging
+from datetime import timedelta
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, OuterRef, Subquery, Value, When
+from django.utils import timezone
+from apps.core.models import Delivery, LocationUpdate, Stop
+from .feasibility import delivery_window, DAY_MINUTES
+from .route_optimizer import RouteOptimizer, build_distance_matrix, DEFAULT_DROP_PENALTY
+from .speed_model import build_vehicle_time_matrix, load_speed_table
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto de cada re-optimización (segundos)
+ROLLING_TIME_LIMIT = 2
+
+# Paradas que todavía pueden cambiar de orden o de vehículo
+PENDING_STOP_STATUSES = ('pending',)
+
+
+def reoptimize_in_progress(batch, time_limit=ROLLING_TIME_LIMIT, stop_check=None, should_persist=None):
+    """
+    Re-optimiza el sufijo pendiente de las rutas de un lote en curso
+
+    Args:
+        batch: DeliveryBatch en curso
+        time_limit: Segundos de búsqueda
+        stop_check: Condición de parada del solver (ver SolutionMonitor)
+        should_persist: Función opcional sin argumentos; si devuelve False
+            tras resolver, el resultado se descarta (corrida cancelada)
+
+    Returns:
+        Dict con 'rescheduled' (paradas reordenadas) y 'unassigned' (IDs
+        de entregas que ya no caben), o None si no hubo solución
+    """
+    latest = LocationUpdate.objects.filter(route=OuterRef('pk')).order_by('-timestamp')
+    routes = list(
+        batch.routes.exclude(status='completed')
+        .select_related('vehicle')
+        .annotate(
+            current_lat=Subquery(latest.values('latitude')[:1]),
+            current_lng=Subquery(latest.values('longitude')[:1]),
+        )
+        .order_by('route_order')
+    )
+    if not routes:
+        return None
+
+    stops_by_route = {route.id: [] for route in routes}
+    for stop in (Stop.objects.filter(route__in=routes)
+                 .select_related('delivery')
+                 .order_by('route__route_order', 'stop_order')):
+        stops_by_route[stop.route_id].append(stop)
+
+    depot = (batch.depot_coordinates['lat'], batch.depot_coordinates['lng'])
+    starts, capacities, last_orders, pending = [], [], [], []
+    for route in routes:
+        route_stops = stops_by_route[route.id]
+        visited = [stop for stop in route_stops if stop.status not in PENDING_STOP_STATUSES]
+        starts.append(_current_position(route, visited, depot))
+        capacities.append(max(route.vehicle.max_stops - len(visited), 0))
+        last_orders.append(max((stop.stop_order for stop in visited), default=0))
+        pending.append([stop for stop in route_stops
+                        if stop.status in PENDING_STOP_STATUSES and stop.delivery.coordinates])
+
+    # Nodos: depot, salida de cada vehículo, paradas pendientes y entregas sin ruta
+    new_deliveries = [
+        delivery for delivery in batch.deliveries.filter(stop__isnull=True, status='pending')
+        if delivery.coordinates
+    ]
+    stops = [stop for route_stops in pending for stop in route_stops]
+    deliveries = [stop.delivery for stop in stops] + new_deliveries
+    if not deliveries:
+        return {'rescheduled': 0, 'unassigned': []}
+
+    first_node = 1 + len(routes)
+    node_of_stop = {stop.id: first_node + i for i, stop in enumerate(stops)}
+    coordinates = np.array(
+        [depot] + starts + [(d.coordinates['lat'], d.coordinates['lng']) for d in deliveries],
+        dtype=np.float64,
+    )
+    now = timezone.localtime()
+    distance_matrix = build_distance_matrix(coordinates[:, 0], coordinates[:, 1])
+    # Una sola matriz de tiempos: velocidades del tipo del primer vehículo a la hora actual
+    time_matrix = build_vehicle_time_matrix(distance_matrix, coordinates[:, 0], coordinates[:, 1],
+                                            routes[0].vehicle.vehicle_type, now.hour, load_speed_table())
+    optimizer = RouteOptimizer(distance_matrix, time_matrix)
+
+    time_windows = None
+    windows = [delivery_window(delivery) for delivery in deliveries]
+    if any(windows):
+        departure = now.hour * 60 + now.minute
+        time_windows = [None] + [(departure, DAY_MINUTES)] * len(routes) + windows
+
+    result = optimizer.optimize(
+        num_vehicles=len(routes),
+        vehicle_capacities=capacities,
+        time_windows=time_windows,
+        time_limit=time_limit,
+        initial_routes=[[node_of_stop[stop.id] for stop in route_stops] for route_stops in pending],
+        stop_check=stop_check,
+        drop_penalty=DEFAULT_DROP_PENALTY,
+        vehicle_starts=list(range(1, first_node)),
+    )
+    if result is None:
+        logger.error(f"Sin solución al re-optimizar el lote en curso {batch.id}")
+        return None
+    if should_persist is not None and not should_persist():
+        return None
+
+    # Llegadas desde la medianoche con ventanas, o desde ahora sin ellas
+    origin = now.replace(hour=0, minute=0, second=0, microsecond=0) if time_windows else now
+    return _persist(batch, routes, stops, deliveries, first_node, last_orders, result, origin)
+
+
+def _current_position(route, visited, depot):
+    """Última ubicación reportada, o la última parada visitada, o el depósito"""
+    if route.current_lat is not None:
+        return float(route.current_lat), float(route.current_lng)
+    for stop in reversed(visited):
+        if stop.delivery.coordinates:
+            return stop.delivery.coordinates['lat'], stop.delivery.coordinates['lng']
+    return depot
+
+
+def _persist(batch, routes, stops, deliveries, first_node, last_orders, result, origin):
+    """
+    Reescribe solo las paradas pendientes: orden, vehículo, ETA y entregas nuevas
+
+    Como en save_solution, las entregas con parada quedan asignadas y las
+    descartadas vuelven a pendiente para que una corrida posterior las
+    planifique si se libera capacidad.
+    """
+    existing = {first_node + i: stop for i, stop in enumerate(stops)}
+    updated, created = [], []
+    for route_data in result['routes']:
+        route = routes[route_data['vehicle_id']]
+        visits = zip(route_data['stops'][1:-1], route_data['arrivals'][1:-1])
+        for offset, (node, arrival) in enumerate(visits, 1):
+            stop_order = last_orders[route_data['vehicle_id']] + offset
+            eta = origin + timedelta(minutes=arrival)
+            stop = existing.get(node)
+            if stop is None:
+                created.append(Stop(route=route, delivery=deliveries[node - first_node], stop_order=stop_order,
+                                    estimated_arrival_time=eta))
+            else:
+                stop.route = route
+                stop.stop_order = stop_order
+                stop.estimated_arrival_time = eta
+                updated.append(stop)
+
+    unassigned = [deliveries[node - first_node] for node in result['unassigned']]
+    dropped_stops = [existing[node].id for node in result['unassigned'] if node in existing]
+
+    with transaction.atomic():
+        Stop.objects.filter(id__in=dropped_stops).delete()
+        Stop.objects.bulk_update(updated, ['route', 'stop_order', 'estimated_arrival_time'])
+        Stop.objects.bulk_create(created)
+        routed = [stop.delivery_id for stop in created]
+        Delivery.objects.filter(
+            id__in=routed + [delivery.id for delivery in unassigned],
+            status__in=['pending', 'assigned'],
+        ).update(
+            status=Case(When(id__in=routed, then=Value('assigned')), default=Value('pending')),
+            updated_at=timezone.now(),
+        )
+        batch.unassigned_deliveries = sorted(
+            set(batch.unassigned_deliveries) - {str(stop.delivery_id) for stop in created}
+            | {str(delivery.id) for delivery in unassigned}
+        )
+        batch.save(update_fields=['unassigned_deliveries', 'updated_at'])
+
+    return {
+        'rescheduled': len(updated) + len(created),
+        'unassigned': [str(delivery.id) for delivery in unassigned],
+    }
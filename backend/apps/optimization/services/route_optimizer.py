@@ -1,21 +1,300 @@
-from ortools.constraint_solver import routing_enums_pb2
-from ortools.constraint_solver import pywrapcp
 import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from typing import List, Dict, Any
 import logging
+from .matrix_store import matrix_handle, attach_matrix
 
 logger = logging.getLogger(__name__)
 
+
+def load_solver():
+    """
+    Importa OR-Tools al primer uso
+
+    Los procesos web importan este módulo (matrices, constantes) pero no
+    resuelven: así no pagan el tiempo de importación ni la memoria del
+    solver. Los workers de Celery lo precargan al iniciar (ver apps.py).
+    """
+    from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+    return pywrapcp, routing_enums_pb2
+
+# Presupuesto de búsqueda por preset:
+# segundos = base + por_nodo * nodos, acotado a [base, max]
+# La búsqueda se detiene antes si el objetivo no mejora durante
+# max(min_plateau, plateau_fraction * presupuesto) segundos.
+SOLVER_PRESETS = {
+    'fast': {
+        'base_seconds': 1,
+        'seconds_per_node': 0.01,
+        'max_seconds': 15,
+        'plateau_fraction': 0.2,
+        'min_plateau_seconds': 0.5,
+    },
+    'balanced': {
+        'base_seconds': 2,
+        'seconds_per_node': 0.03,
+        'max_seconds': 120,
+        'plateau_fraction': 0.25,
+        'min_plateau_seconds': 1,
+    },
+    'thorough': {
+        'base_seconds': 5,
+        'seconds_per_node': 0.1,
+        'max_seconds': 600,
+        'plateau_fraction': 0.3,
+        'min_plateau_seconds': 5,
+    },
+}
+DEFAULT_PRESET = 'balanced'
+
+
+def compute_time_budget(num_locations, preset=DEFAULT_PRESET):
+    """
+    Calcula el presupuesto de búsqueda según el tamaño de la instancia
+
+    Returns:
+        Tupla (time_limit, plateau_seconds) en segundos
+    """
+    config = SOLVER_PRESETS[preset]
+    budget = config['base_seconds'] + config['seconds_per_node'] * num_locations
+    budget = min(max(budget, config['base_seconds']), config['max_seconds'])
+    plateau = max(config['min_plateau_seconds'], budget * config['plateau_fraction'])
+    return budget, plateau
+
+
+# Penalización por entrega sin asignar en modo de solución parcial
+# (metros): mayor que cualquier desvío razonable, así que solo se
+# descartan entregas que no caben o no pueden atenderse a tiempo
+DEFAULT_DROP_PENALTY = 1_000_000
+
+# Intervalo mínimo entre eventos de progreso del solver
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+class SolutionMonitor:
+    """Se ejecuta en cada solución aceptada por el solver"""
+
+    def __init__(self, routing, plateau_seconds=None, stop_check=None,
+                 progress_callback=None, progress_interval=PROGRESS_INTERVAL_SECONDS):
+        """
+        Args:
+            routing: Modelo de routing observado
+            plateau_seconds: Ventana sin mejoras tras la cual se detiene
+            stop_check: Función opcional (best_objective, elapsed) que
+                devuelve un motivo para detener la búsqueda o None;
+                best_objective es None mientras se construye la primera
+                solución
+            progress_callback: Función opcional que recibe eventos
+                {'objective', 'elapsed', 'routes_used'} al mejorar
+            progress_interval: Segundos mínimos entre eventos de progreso
+        """
+        self.routing = routing
+        self.plateau_seconds = plateau_seconds
+        self.stop_check = stop_check
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.best_objective = None
+        self.started_at = time.monotonic()
+        self.last_improvement_at = self.started_at
+        self.last_progress_at = None
+        self.pending_progress = None
+        self.stop_reason = None
+
+    def __call__(self):
+        objective = self.routing.CostVar().Max()
+        now = time.monotonic()
+
+        if self.best_objective is None or objective < self.best_objective:
+            self.best_objective = objective
+            self.last_improvement_at = now
+            if self.progress_callback is not None:
+                self._report_progress(now)
+        elif self.plateau_seconds and now - self.last_improvement_at >= self.plateau_seconds:
+            # Sin mejoras en la ventana: detener y conservar la mejor solución
+            self.stop('plateau')
+            return
+
+        if self.stop_check is not None:
+            reason = self.stop_check(self.best_objective, now - self.started_at)
+            if reason:
+                self.stop(reason)
+
+    def check_limit(self):
+        """
+        Límite del solver (CustomLimit), consultado en cada decisión
+
+        Antes de la primera solución el callback de soluciones no se
+        ejecuta: aquí se consulta stop_check para poder detener también la
+        construcción de la solución inicial en lotes grandes.
+        """
+        if self.best_objective is not None or self.stop_check is None:
+            return False
+        reason = self.stop_check(None, time.monotonic() - self.started_at)
+        if reason:
+            self.stop_reason = reason
+            return True
+        return False
+
+    def stop(self, reason):
+        """Termina la búsqueda conservando la mejor solución encontrada"""
+        self.stop_reason = reason
+        self.routing.solver().FinishCurrentSearch()
+
+    def flush_progress(self):
+        """Emite la última mejora retenida por el intervalo, si la hay"""
+        if self.pending_progress is not None:
+            self.progress_callback(self.pending_progress)
+            self.pending_progress = None
+
+    def _report_progress(self, now):
+        """Registra la mejora y la emite si ya pasó el intervalo desde la anterior"""
+        # Las variables están asignadas durante el callback: contar rutas no vacías
+        routes_used = sum(
+            not self.routing.IsEnd(self.routing.NextVar(self.routing.Start(vehicle)).Value())
+            for vehicle in range(self.routing.vehicles())
+        )
+        self.pending_progress = {
+            'objective': int(self.best_objective),
+            'elapsed': round(now - self.started_at, 3),
+            'routes_used': int(routes_used),
+        }
+        if self.last_progress_at is None or now - self.last_progress_at >= self.progress_interval:
+            self.last_progress_at = now
+            self.flush_progress()
+
+
+# Estrategias del modo portafolio: (solución inicial, metaheurística)
+PORTFOLIO_STRATEGIES = [
+    ('PATH_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+    ('SAVINGS', 'GUIDED_LOCAL_SEARCH'),
+    ('CHRISTOFIDES', 'GUIDED_LOCAL_SEARCH'),
+    ('PATH_CHEAPEST_ARC', 'TABU_SEARCH'),
+    ('SAVINGS', 'TABU_SEARCH'),
+]
+
+# Una corrida se cancela si, pasado el periodo de gracia (fracción del
+# presupuesto), su mejor objetivo supera al mejor global por este margen
+PORTFOLIO_MARGIN = 0.05
+PORTFOLIO_GRACE_FRACTION = 0.25
+
+# Estado compartido de cada proceso del portafolio (ver _init_portfolio_worker)
+_portfolio_state = {}
+
+
+def _init_portfolio_worker(shared_best, distance_matrix, time_matrix, depot_index):
+    """Inicializa un proceso del portafolio con la matriz y el mejor objetivo compartido"""
+    _portfolio_state.update(
+        shared_best=shared_best,
+        optimizer=RouteOptimizer(attach_matrix(distance_matrix), attach_matrix(time_matrix), depot_index),
+    )
+
+
+class _PortfolioRace:
+    """Publica el mejor objetivo propio y abandona si otra corrida va claramente adelante"""
+
+    def __init__(self, shared_best, grace_seconds, stop_check=None):
+        self.shared_best = shared_best
+        self.grace_seconds = grace_seconds
+        self.stop_check = stop_check
+
+    def __call__(self, best_objective, elapsed):
+        if self.stop_check is not None:
+            reason = self.stop_check(best_objective, elapsed)
+            if reason:
+                return reason
+        if best_objective is None:
+            # Aún sin primera solución: no hay objetivo que comparar
+            return None
+
+        with self.shared_best.get_lock():
+            if best_objective < self.shared_best.value:
+                self.shared_best.value = best_objective
+            leader = self.shared_best.value
+
+        if elapsed >= self.grace_seconds and best_objective > leader * (1 + PORTFOLIO_MARGIN):
+            return 'outpaced'
+        return None
+
+
+def _solve_portfolio_member(strategy, metaheuristic, grace_seconds, optimize_kwargs):
+    """Resuelve una corrida del portafolio; se ejecuta en un proceso del pool"""
+    optimizer = _portfolio_state['optimizer']
+    optimize_kwargs = dict(optimize_kwargs)
+    race = _PortfolioRace(_portfolio_state['shared_best'], grace_seconds, optimize_kwargs.pop('stop_check', None))
+    result = optimizer.optimize(
+        first_solution_strategy=strategy,
+        metaheuristic=metaheuristic,
+        stop_check=race,
+        **optimize_kwargs,
+    )
+    return result, optimizer.search_stats
+
+
+# Mayor valor para el que _matrix_rows comparte los enteros de Python
+# (1000 km en metros: ~30 MB de enteros en el peor caso)
+SHARED_VALUES_LIMIT = 1_000_000
+
+
+def _matrix_rows(matrix, block_cells=None):
+    """
+    Matriz como lista de listas para OR-Tools sin un entero de Python por celda
+
+    matrix.tolist() crea un objeto int (28 bytes) por celda además del
+    puntero de la lista (8 bytes). Aquí cada valor distinto se crea una
+    sola vez y las filas lo referencian, por bloques de filas: la copia
+    transitoria baja a ~8 bytes por celda. Valores negativos o mayores
+    que SHARED_VALUES_LIMIT usan tolist().
+    """
+    if not matrix.size or matrix.min() < 0 or matrix.max() > SHARED_VALUES_LIMIT:
+        return matrix.tolist()
+    values = np.arange(int(matrix.max()) + 1).astype(object)
+    rows_per_block = max(1, (block_cells or MATRIX_BLOCK_CELLS) // len(matrix))
+    rows = []
+    for start in range(0, len(matrix), rows_per_block):
+        rows.extend(values[matrix[start:start + rows_per_block]].tolist())
+    return rows
+
+
+def _as_int_matrix(matrix):
+    """Matriz entera como np.ndarray; los arreglos que ya son enteros no se copian"""
+    matrix = np.asarray(matrix)
+    if not np.issubdtype(matrix.dtype, np.integer):
+        matrix = matrix.astype(np.int64)
+    return matrix
+
+
 class RouteOptimizer:
     """Optimizador de rutas usando Google OR-Tools"""
     
-    def __init__(self, distance_matrix, time_matrix, depot_index=0):
-        self.distance_matrix = distance_matrix
-        self.time_matrix = time_matrix
+    def __init__(self, distance_matrix, time_matrix, depot_index=0, use_matrix_evaluators=True):
+        """
+        Args:
+            distance_matrix: Matriz de distancias (lista de listas o np.ndarray);
+                los arreglos enteros, incluidos los de MatrixStore, se usan sin copiar
+            time_matrix: Matriz de tiempos con la misma forma
+            depot_index: Nodo del depósito
+            use_matrix_evaluators: Entregar las matrices al solver como
+                evaluadores nativos en lugar de callbacks de Python
+        """
+        self.distance_matrix = _as_int_matrix(distance_matrix)
+        self.time_matrix = _as_int_matrix(time_matrix)
         self.depot_index = depot_index
-        self.num_locations = len(distance_matrix)
+        self.num_locations = len(self.distance_matrix)
+        # Nodos de salida y llegada de las rutas (sin demanda ni descarte)
+        self.endpoints = {depot_index}
+        self.use_matrix_evaluators = use_matrix_evaluators
+        self.search_stats = {}
     
-    def optimize(self, num_vehicles, vehicle_capacities=None, time_windows=None):
+    def optimize(self, num_vehicles, vehicle_capacities=None, time_windows=None,
+                 time_limit=None, cost_callback=None, preset=DEFAULT_PRESET,
+                 initial_routes=None, first_solution_strategy='PATH_CHEAPEST_ARC',
+                 metaheuristic='GUIDED_LOCAL_SEARCH', stop_check=None,
+                 candidate_arcs=None, progress_callback=None, drop_penalty=None,
+                 vehicle_starts=None, departure=0):
         """
         Optimiza rutas para múltiples vehículos
         
@@ -23,26 +302,61 @@ class RouteOptimizer:
             num_vehicles: Número de vehículos disponibles
             vehicle_capacities: Lista con capacidad de cada vehículo
             time_windows: Lista de tuplas (inicio, fin) para cada ubicación
+            time_limit: Límite fijo de búsqueda en segundos (sin parada por
+                estancamiento); si es None se calcula con compute_time_budget
+                según el preset
+            cost_callback: Función opcional (from_node, to_node) -> int para
+                costos personalizados; siempre se evalúa en Python
+            preset: Perfil de búsqueda ('fast', 'balanced', 'thorough')
+            initial_routes: Lista opcional (una por vehículo) con los nodos de
+                una solución previa, sin depot; se usa como punto de partida
+            first_solution_strategy: Nombre de FirstSolutionStrategy
+            metaheuristic: Nombre de LocalSearchMetaheuristic
+            stop_check: Condición de parada adicional (ver SolutionMonitor)
+            candidate_arcs: Lista opcional por nodo con los sucesores
+                permitidos (ver CandidateGraph); los demás arcos se prohíben
+            progress_callback: Receptor opcional de eventos de progreso
+                (ver SolutionMonitor)
+            drop_penalty: Si se especifica, cada entrega puede quedar sin
+                asignar pagando esta penalización (metros) en el objetivo;
+                el resultado lista esos nodos en 'unassigned'
+            vehicle_starts: Nodo de salida de cada vehículo (p.ej. su
+                última ubicación); por defecto todos salen del depot. Las
+                rutas siempre terminan en el depot
+            departure: Minuto del día a partir del cual salen los vehículos;
+                las llegadas del resultado cuentan desde la medianoche
         
         Returns:
             Dict con rutas optimizadas
         """
+        pywrapcp, routing_enums_pb2 = load_solver()
         try:
             # Crear el modelo de routing
-            manager = pywrapcp.RoutingIndexManager(
-                self.num_locations, 
-                num_vehicles, 
-                self.depot_index
-            )
+            self.endpoints = {self.depot_index}
+            if vehicle_starts is not None:
+                self.endpoints.update(vehicle_starts)
+                manager = pywrapcp.RoutingIndexManager(
+                    self.num_locations,
+                    num_vehicles,
+                    [int(node) for node in vehicle_starts],
+                    [self.depot_index] * num_vehicles,
+                )
+            else:
+                manager = pywrapcp.RoutingIndexManager(
+                    self.num_locations, 
+                    num_vehicles, 
+                    self.depot_index
+                )
             routing = pywrapcp.RoutingModel(manager)
             
-            # Callback de distancia
-            def distance_callback(from_index, to_index):
-                from_node = manager.IndexToNode(from_index)
-                to_node = manager.IndexToNode(to_index)
-                return self.distance_matrix[from_node][to_node]
-            
-            transit_callback_index = routing.RegisterTransitCallback(distance_callback)
+            # Costo de arcos
+            if cost_callback is not None:
+                def custom_cost_callback(from_index, to_index):
+                    return cost_callback(manager.IndexToNode(from_index), manager.IndexToNode(to_index))
+
+                transit_callback_index = routing.RegisterTransitCallback(custom_cost_callback)
+            else:
+                transit_callback_index = self._register_matrix(routing, manager, self.distance_matrix)
             routing.SetArcCostEvaluatorOfAllVehicles(transit_callback_index)
             
             # Agregar restricción de capacidad si se especifica
@@ -51,23 +365,69 @@ class RouteOptimizer:
             
             # Agregar ventanas de tiempo si se especifican
             if time_windows:
-                self._add_time_constraints(routing, manager, time_windows)
+                self._add_time_constraints(routing, manager, time_windows, departure)
+            
+            # Permitir descartar entregas imposibles en lugar de fallar
+            if drop_penalty is not None:
+                for node in range(self.num_locations):
+                    if node not in self.endpoints:
+                        routing.AddDisjunction([manager.NodeToIndex(node)], int(drop_penalty))
+            
+            # Restringir arcos a los candidatos si se especifican
+            if candidate_arcs is not None:
+                self._restrict_arcs(routing, manager, num_vehicles, candidate_arcs, drop_penalty is not None)
             
             # Configurar parámetros de búsqueda
             search_parameters = pywrapcp.DefaultRoutingSearchParameters()
             search_parameters.first_solution_strategy = (
-                routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+                getattr(routing_enums_pb2.FirstSolutionStrategy, first_solution_strategy)
             )
             search_parameters.local_search_metaheuristic = (
-                routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+                getattr(routing_enums_pb2.LocalSearchMetaheuristic, metaheuristic)
             )
-            search_parameters.time_limit.FromSeconds(30)  # 30 segundos máximo
+            budget, plateau_seconds = compute_time_budget(self.num_locations, preset)
+            if time_limit is not None:
+                budget, plateau_seconds = time_limit, None
+            search_parameters.time_limit.FromMilliseconds(int(budget * 1000))
+            
+            monitor = SolutionMonitor(routing, plateau_seconds, stop_check, progress_callback)
+            routing.AddAtSolutionCallback(monitor)
+            if stop_check is not None:
+                first_solution_limit = routing.solver().CustomLimit(monitor.check_limit)
+                routing.AddSearchMonitor(first_solution_limit)
             
-            # Resolver
-            solution = routing.SolveWithParameters(search_parameters)
+            # Resolver, partiendo de la solución previa si se proporciona
+            initial_assignment = None
+            if initial_routes is not None:
+                routing.CloseModelWithParameters(search_parameters)
+                initial_assignment = routing.ReadAssignmentFromRoutes(initial_routes, True)
+                if initial_assignment is None:
+                    logger.warning("Solución inicial inválida, optimizando desde cero")
+            
+            if initial_assignment is not None:
+                solution = routing.SolveFromAssignmentWithParameters(initial_assignment, search_parameters)
+            else:
+                solution = routing.SolveWithParameters(search_parameters)
+            if progress_callback is not None:
+                monitor.flush_progress()
+            self._record_search_stats(routing, monitor)
+            self.search_stats['warm_start'] = initial_assignment is not None
+            self.search_stats['restricted_arcs'] = candidate_arcs is not None
             
             if solution:
-                return self._extract_solution(manager, routing, solution)
+                return self._extract_solution(manager, routing, solution, departure)
+            elif monitor.stop_reason is not None:
+                logger.info(f"Búsqueda detenida antes de la primera solución: {monitor.stop_reason}")
+                return None
+            elif candidate_arcs is not None:
+                # Los arcos prohibidos pueden dejar la instancia sin solución
+                logger.warning("Sin solución con arcos candidatos, reintentando sin restricción")
+                return self.optimize(
+                    num_vehicles, vehicle_capacities, time_windows, time_limit, cost_callback,
+                    preset, initial_routes, first_solution_strategy, metaheuristic, stop_check,
+                    progress_callback=progress_callback, drop_penalty=drop_penalty,
+                    vehicle_starts=vehicle_starts, departure=departure,
+                )
             else:
                 logger.error("No se encontró solución para la optimización")
                 return None
@@ -76,15 +436,135 @@ class RouteOptimizer:
             logger.error(f"Error en optimización de rutas: {e}")
             return None
     
+    def optimize_portfolio(self, num_vehicles, strategies=None, processes=None, **kwargs):
+        """
+        Ejecuta varias estrategias en paralelo y conserva el mejor objetivo
+
+        Cada estrategia corre en su propio proceso sobre la misma matriz.
+        Las corridas comparten el mejor objetivo encontrado y abandonan
+        cuando otra va claramente adelante (ver PORTFOLIO_MARGIN).
+
+        Args:
+            num_vehicles: Número de vehículos disponibles
+            strategies: Lista de tuplas (solución inicial, metaheurística)
+            processes: Máximo de procesos (por defecto, núcleos disponibles)
+            **kwargs: Argumentos de optimize (capacidades, ventanas, preset...)
+
+        Returns:
+            Dict con la mejor solución del portafolio o None
+        """
+        strategies = strategies or PORTFOLIO_STRATEGIES
+        workers = min(processes or os.cpu_count() or 1, len(strategies))
+        kwargs['num_vehicles'] = num_vehicles
+
+        budget, _ = compute_time_budget(self.num_locations, kwargs.get('preset', DEFAULT_PRESET))
+        if kwargs.get('time_limit') is not None:
+            budget = kwargs['time_limit']
+        grace_seconds = budget * PORTFOLIO_GRACE_FRACTION
+
+        shared_best = multiprocessing.Value('q', 2 ** 62)
+        try:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_portfolio_worker,
+                initargs=(
+                    shared_best,
+                    matrix_handle(self.distance_matrix),
+                    matrix_handle(self.time_matrix),
+                    self.depot_index,
+                ),
+            ) as executor:
+                futures = [
+                    executor.submit(_solve_portfolio_member, strategy, metaheuristic, grace_seconds, kwargs)
+                    for strategy, metaheuristic in strategies
+                ]
+                outcomes = [future.result() for future in futures]
+        except (AssertionError, OSError) as e:
+            # Los procesos daemon (p.ej. workers prefork de Celery) no pueden crear hijos
+            logger.warning(f"Pool de procesos no disponible, usando una sola estrategia: {e}")
+            return self.optimize(**kwargs)
+
+        best = None
+        portfolio = []
+        for (strategy, metaheuristic), (result, stats) in zip(strategies, outcomes):
+            portfolio.append({
+                'first_solution_strategy': strategy,
+                'metaheuristic': metaheuristic,
+                'objective': result['objective_value'] if result else None,
+                'stop_reason': stats.get('stop_reason'),
+            })
+            if result and (best is None or result['objective_value'] < best[0]['objective_value']):
+                best = (result, stats)
+
+        if best is None:
+            logger.error("Ninguna estrategia del portafolio encontró solución")
+            self.search_stats = {'portfolio': portfolio}
+            return None
+
+        result, stats = best
+        self.search_stats = {**stats, 'portfolio': portfolio}
+        return result
+    
+    def _register_matrix(self, routing, manager, matrix):
+        """
+        Registra una matriz de tránsito, nativa o como callback de Python
+
+        RegisterTransitMatrix solo acepta listas de Python y guarda su
+        propia copia int64 (8 bytes por celda) mientras vive el modelo; la
+        lista intermedia se arma con _matrix_rows y se libera al registrar.
+        """
+        rows = _matrix_rows(matrix)
+        if self.use_matrix_evaluators:
+            # OR-Tools evalúa la matriz en C++ sin volver al intérprete
+            return routing.RegisterTransitMatrix(rows)
+
+        def matrix_callback(from_index, to_index):
+            return rows[manager.IndexToNode(from_index)][manager.IndexToNode(to_index)]
+
+        return routing.RegisterTransitCallback(matrix_callback)
+    
+    def _record_search_stats(self, routing, monitor):
+        """Guarda contadores del solver de la última búsqueda"""
+        solver = routing.solver()
+        self.search_stats = {
+            'accepted_neighbors': solver.AcceptedNeighbors(),
+            'solutions': solver.Solutions(),
+            'branches': solver.Branches(),
+            'wall_time_ms': solver.WallTime(),
+            'stop_reason': monitor.stop_reason or 'time_limit',
+        }
+    
+    def _restrict_arcs(self, routing, manager, num_vehicles, candidate_arcs, droppable=False):
+        """
+        Limita el sucesor de cada nodo a sus arcos candidatos
+
+        Con droppable el propio nodo queda permitido: OR-Tools marca una
+        entrega descartada con next(i) == i.
+        """
+        ends = [routing.End(vehicle_id) for vehicle_id in range(num_vehicles)]
+        for node, successors in enumerate(candidate_arcs):
+            if node == self.depot_index:
+                continue
+            index = manager.NodeToIndex(node)
+            allowed = [manager.NodeToIndex(successor) for successor in successors
+                       if successor != self.depot_index]
+            if droppable and node not in self.endpoints:
+                allowed.append(index)
+            routing.NextVar(index).SetValues(allowed + ends)
+    
     def _add_capacity_constraints(self, routing, manager, capacities):
         """Añade restricciones de capacidad por vehículo"""
-        def demand_callback(from_index):
-            from_node = manager.IndexToNode(from_index)
-            # Aquí deberías tener las demandas por ubicación
-            # Por simplicidad, asumimos demanda = 1 por parada
-            return 1 if from_node != 0 else 0
+        # Aquí deberías tener las demandas por ubicación
+        # Por simplicidad, asumimos demanda = 1 por parada
+        demands = [0 if node in self.endpoints else 1 for node in range(self.num_locations)]
         
-        demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
+        if self.use_matrix_evaluators:
+            demand_callback_index = routing.RegisterUnaryTransitVector(demands)
+        else:
+            def demand_callback(from_index):
+                return demands[manager.IndexToNode(from_index)]
+            
+            demand_callback_index = routing.RegisterUnaryTransitCallback(demand_callback)
         routing.AddDimensionWithVehicleCapacity(
             demand_callback_index,
             0,  # null capacity slack
@@ -93,14 +573,9 @@ class RouteOptimizer:
             'Capacity'
         )
     
-    def _add_time_constraints(self, routing, manager, time_windows):
-        """Añade ventanas de tiempo"""
-        def time_callback(from_index, to_index):
-            from_node = manager.IndexToNode(from_index)
-            to_node = manager.IndexToNode(to_index)
-            return self.time_matrix[from_node][to_node]
-        
-        time_callback_index = routing.RegisterTransitCallback(time_callback)
+    def _add_time_constraints(self, routing, manager, time_windows, departure=0):
+        """Añade ventanas de tiempo; ningún vehículo sale antes de departure"""
+        time_callback_index = self._register_matrix(routing, manager, self.time_matrix)
         
         time_dimension_name = 'Time'
         routing.AddDimension(
@@ -119,41 +594,60 @@ class RouteOptimizer:
                 start_time, end_time = time_window
                 index = manager.NodeToIndex(location_idx)
                 time_dimension.CumulVar(index).SetRange(start_time, end_time)
+
+        # Las entregas sin ventana no pueden recibir llegadas de madrugada
+        for vehicle_id in range(routing.vehicles()):
+            time_dimension.CumulVar(routing.Start(vehicle_id)).SetMin(departure)
     
-    def _extract_solution(self, manager, routing, solution):
-        """Extrae la solución en formato útil"""
+    def _extract_solution(self, manager, routing, solution, departure=0):
+        """
+        Extrae la solución en formato útil
+
+        Cada ruta incluye 'arrivals': llegada a cada nodo de 'stops' en
+        minutos desde la medianoche. Con ventanas de tiempo son los
+        acumulados de la dimensión de tiempo (con esperas); sin ventanas,
+        la salida (departure) más los tiempos de viaje.
+        """
         routes = []
         total_distance = 0
         total_time = 0
+        time_dimension = routing.GetDimensionOrDie('Time') if routing.HasDimension('Time') else None
         
         for vehicle_id in range(routing.vehicles()):
             index = routing.Start(vehicle_id)
             route = {
                 'vehicle_id': vehicle_id,
                 'stops': [],
+                'arrivals': [],
                 'total_distance': 0,
                 'total_time': 0
             }
             
             route_distance = 0
             route_time = 0
+            clock = departure
             
             while not routing.IsEnd(index):
                 node_index = manager.IndexToNode(index)
                 route['stops'].append(node_index)
+                route['arrivals'].append(
+                    solution.Min(time_dimension.CumulVar(index)) if time_dimension else clock
+                )
                 
                 previous_index = index
                 index = solution.Value(routing.NextVar(index))
                 
+                from_node = manager.IndexToNode(previous_index)
+                to_node = manager.IndexToNode(index)
+                clock += int(self.time_matrix[from_node][to_node])
                 if not routing.IsEnd(index):
-                    from_node = manager.IndexToNode(previous_index)
-                    to_node = manager.IndexToNode(index)
-                    route_distance += self.distance_matrix[from_node][to_node]
-                    route_time += self.time_matrix[from_node][to_node]
+                    route_distance += int(self.distance_matrix[from_node][to_node])
+                    route_time += int(self.time_matrix[from_node][to_node])
             
             # Agregar parada final (depot)
             final_node = manager.IndexToNode(index)
             route['stops'].append(final_node)
+            route['arrivals'].append(solution.Min(time_dimension.CumulVar(index)) if time_dimension else clock)
             
             route['total_distance'] = route_distance
             route['total_time'] = route_time
@@ -164,36 +658,154 @@ class RouteOptimizer:
             if len(route['stops']) > 2:  # depot inicial + paradas + depot final
                 routes.append(route)
         
+        # Entregas descartadas (solo con drop_penalty): nodos inactivos
+        unassigned = [
+            node for node in range(self.num_locations)
+            if node not in self.endpoints
+            and solution.Value(routing.NextVar(manager.NodeToIndex(node))) == manager.NodeToIndex(node)
+        ]
+        
         return {
             'routes': routes,
             'total_distance': total_distance,
             'total_time': total_time,
-            'objective_value': solution.ObjectiveValue()
+            'objective_value': solution.ObjectiveValue(),
+            'unassigned': unassigned,
         }
 
-# Función utilitaria para crear matriz de distancias euclidiana
+def build_warm_start_routes(previous_routes, num_locations, num_vehicles, distance_matrix,
+                            vehicle_capacities=None, depot_index=0):
+    """
+    Repara una solución previa para usarla como punto de partida
+
+    Elimina los nodos que ya no existen, recorta las rutas que exceden la
+    capacidad actual de su vehículo y agrega los nodos nuevos o recortados
+    en la posición de inserción más barata, dejando intacto el resto de la
+    secuencia.
+
+    Args:
+        previous_routes: Lista de rutas previas (nodos sin depot)
+        num_locations: Número de nodos de la instancia actual
+        num_vehicles: Número de vehículos disponibles
+        distance_matrix: Matriz de distancias de la instancia actual
+        vehicle_capacities: Máximo de paradas por vehículo (opcional)
+        depot_index: Nodo del depósito
+
+    Returns:
+        Lista de rutas (una por vehículo) o None si la solución previa
+        no cabe en la flota actual
+    """
+    matrix = np.asarray(distance_matrix)
+    seen = set()
+    routes = []
+    for route in previous_routes:
+        kept = [node for node in route
+                if 0 <= node < num_locations and node != depot_index and node not in seen]
+        seen.update(kept)
+        if kept:
+            routes.append(kept)
+
+    if len(routes) > num_vehicles:
+        return None
+    routes.extend([] for _ in range(num_vehicles - len(routes)))
+
+    capacities = vehicle_capacities or [num_locations] * num_vehicles
+    # Las paradas que ya no caben en su vehículo se reinsertan como nuevas
+    for vehicle_id, route in enumerate(routes):
+        del route[capacities[vehicle_id]:]
+    seen = {node for route in routes for node in route}
+    missing = [node for node in range(num_locations) if node != depot_index and node not in seen]
+
+    for node in missing:
+        best = None
+        for vehicle_id, route in enumerate(routes):
+            if len(route) >= capacities[vehicle_id]:
+                continue
+            path = np.array([depot_index] + route + [depot_index])
+            # Costo de insertar el nodo entre cada par consecutivo
+            deltas = matrix[path[:-1], node] + matrix[node, path[1:]] - matrix[path[:-1], path[1:]]
+            position = int(np.argmin(deltas))
+            if best is None or deltas[position] < best[0]:
+                best = (deltas[position], vehicle_id, position)
+
+        if best is None:
+            return None
+        _, vehicle_id, position = best
+        routes[vehicle_id].insert(position, node)
+
+    return routes
+
+
+EARTH_RADIUS_KM = 6371
+
+# Celdas (filas x columnas) procesadas por bloque al construir matrices grandes.
+# 2M celdas float64 ~ 16 MB por temporal, independiente del tamaño del lote.
+MATRIX_BLOCK_CELLS = 2_000_000
+
+
+def build_distance_matrix(lats, lngs, block_cells=MATRIX_BLOCK_CELLS):
+    """
+    Construye la matriz de distancias haversine (metros) de forma vectorizada
+
+    Args:
+        lats: Arreglo de latitudes en grados
+        lngs: Arreglo de longitudes en grados
+        block_cells: Máximo de celdas calculadas por bloque de filas
+
+    Returns:
+        np.ndarray int32 de forma (n, n) con distancias en metros
+    """
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    n = lat.shape[0]
+    matrix = np.empty((n, n), dtype=np.int32)
+    if n == 0:
+        return matrix
+
+    cos_lat = np.cos(lat)
+    rows_per_block = max(1, block_cells // n)
+
+    for start in range(0, n, rows_per_block):
+        stop = min(start + rows_per_block, n)
+        dlat = lat[None, :] - lat[start:stop, None]
+        dlng = lng[None, :] - lng[start:stop, None]
+
+        a = (np.sin(dlat / 2) ** 2 +
+             cos_lat[start:stop, None] * cos_lat[None, :] * np.sin(dlng / 2) ** 2)
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+        # Truncar a metros igual que la versión escalar
+        matrix[start:stop] = (EARTH_RADIUS_KM * c * 1000).astype(np.int32)
+
+    np.fill_diagonal(matrix, 0)
+    return matrix
+
+
 def create_distance_matrix_from_coordinates(coordinates):
     """
-    Crea matriz de distancias euclidiana a partir de coordenadas
+    Crea matriz de distancias haversine a partir de coordenadas
     coordinates: lista de tuplas (lat, lng)
+
+    Envoltorio de compatibilidad sobre build_distance_matrix que
+    devuelve lista de listas de enteros (metros).
     """
-    num_locations = len(coordinates)
-    matrix = [[0 for _ in range(num_locations)] for _ in range(num_locations)]
-    
-    for i in range(num_locations):
-        for j in range(num_locations):
-            if i != j:
-                distance = haversine_distance(
-                    coordinates[i][0], coordinates[i][1],
-                    coordinates[j][0], coordinates[j][1]
-                )
-                matrix[i][j] = int(distance * 1000)  # convertir a metros
-    
-    return matrix
+    if not coordinates:
+        return []
+    coords = np.asarray(coordinates, dtype=np.float64)
+    return build_distance_matrix(coords[:, 0], coords[:, 1]).tolist()
+
+# Velocidad promedio en ciudad usada para estimar tiempos (metros por minuto)
+AVERAGE_SPEED_M_PER_MIN = 50
+
+
+def build_time_matrix(distance_matrix, speed_m_per_min=AVERAGE_SPEED_M_PER_MIN):
+    """Matriz de tiempos (minutos) a partir de la matriz de distancias (metros)"""
+    return np.asarray(distance_matrix) // speed_m_per_min
+
 
 def haversine_distance(lat1, lon1, lat2, lon2):
     """Calcula distancia haversine entre dos puntos en km"""
-    R = 6371  # Radio de la Tierra en km
+    R = EARTH_RADIUS_KM  # Radio de la Tierra en km
     
     dlat = math.radians(lat2 - lat1)
     dlon = math.radians(lon2 - lon1)
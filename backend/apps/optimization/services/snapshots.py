@@ -0,0 +1,154 @@
+"""
+Instantáneas de instancias para reproducir optimizaciones fuera de producción.
+
+Se guarda solo lo que consume el solver (matrices, capacidades, ventanas,
+rutas iniciales, arcos candidatos y parámetros) en un .npz comprimido:
+sin coordenadas, direcciones ni datos de clientes. El comando replay_snapshot las vuelve a
+resolver con otros presets o bajo cProfile.
+"""
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+import numpy as np
+from .route_optimizer import RouteOptimizer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Marca de nodo sin ventana en el arreglo de ventanas
+NO_WINDOW = -1
+
+
+def save_snapshot(directory, distance_matrix, time_matrix, params, time_windows=None,
+                  vehicle_capacities=None, initial_routes=None, candidate_arcs=None, label=''):
+    """
+    Guarda la instancia compilada
+
+    Args:
+        directory: Directorio de destino
+        distance_matrix: Matriz de distancias
+        time_matrix: Matriz de tiempos
+        params: Parámetros de optimize serializables en JSON (num_vehicles,
+            preset, drop_penalty, departure, first_solution_strategy,
+            candidate_k...)
+        time_windows: Ventanas por nodo o None
+        vehicle_capacities: Máximo de paradas de cada vehículo
+        initial_routes: Rutas iniciales (listas de nodos sin depot)
+        candidate_arcs: Sucesores permitidos por nodo (ver CandidateGraph);
+            se guardan los arcos y no las coordenadas de donde salen
+        label: Prefijo del archivo (p.ej. el ID del lote)
+
+    Returns:
+        Ruta del archivo creado
+    """
+    n = len(distance_matrix)
+    windows = np.full((n, 2), NO_WINDOW, dtype=np.int32)
+    for node, window in enumerate(time_windows or []):
+        if window:
+            windows[node] = window
+
+    routes = initial_routes or []
+    arcs = candidate_arcs or []
+    os.makedirs(directory, exist_ok=True)
+    name = f"{label + '-' if label else ''}{datetime.now():%Y%m%d_%H%M%S}-{uuid.uuid4().hex[:8]}.npz"
+    path = os.path.join(directory, name)
+    np.savez_compressed(
+        path,
+        distance_matrix=np.asarray(distance_matrix, dtype=np.int32),
+        time_matrix=np.asarray(time_matrix, dtype=np.int32),
+        time_windows=windows,
+        vehicle_capacities=np.asarray(vehicle_capacities or [], dtype=np.int32),
+        # Rutas iniciales aplanadas: nodos y largo de cada ruta
+        initial_nodes=np.asarray([node for route in routes for node in route], dtype=np.int32),
+        initial_lengths=np.asarray([len(route) for route in routes], dtype=np.int32),
+        # Arcos candidatos aplanados: sucesores y cuántos tiene cada nodo
+        candidate_nodes=np.asarray([node for successors in arcs for node in successors], dtype=np.int32),
+        candidate_lengths=np.asarray([len(successors) for successors in arcs], dtype=np.int32),
+        params=np.array(json.dumps({**params, 'version': SNAPSHOT_VERSION})),
+    )
+    logger.info(f"Instantánea de la instancia guardada en {path}")
+    return path
+
+
+def load_snapshot(path):
+    """
+    Lee una instantánea guardada con save_snapshot
+
+    Returns:
+        Dict con 'distance_matrix', 'time_matrix', 'time_windows' (lista o
+        None), 'vehicle_capacities' (lista o None), 'initial_routes' (lista
+        o None), 'candidate_arcs' (lista o None) y 'params'
+    """
+    with np.load(path, allow_pickle=False) as data:
+        params = json.loads(str(data['params']))
+        if params.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Versión de instantánea no soportada: {params.get('version')}")
+
+        windows = data['time_windows']
+        has_window = windows[:, 0] != NO_WINDOW
+        time_windows = [tuple(int(v) for v in w) if has else None for w, has in zip(windows, has_window)]
+
+        initial_routes = _unflatten(data['initial_nodes'], data['initial_lengths'])
+        # Instantáneas anteriores a los arcos candidatos no los traen
+        candidate_arcs = []
+        if 'candidate_lengths' in data.files:
+            candidate_arcs = _unflatten(data['candidate_nodes'], data['candidate_lengths'])
+
+        return {
+            'distance_matrix': data['distance_matrix'],
+            'time_matrix': data['time_matrix'],
+            'time_windows': time_windows if has_window.any() else None,
+            'vehicle_capacities': data['vehicle_capacities'].tolist() or None,
+            'initial_routes': initial_routes or None,
+            'candidate_arcs': candidate_arcs or None,
+            'params': params,
+        }
+
+
+def _unflatten(nodes, lengths):
+    """Listas de nodos a partir de los nodos aplanados y el largo de cada lista"""
+    nodes = nodes.tolist()
+    bounds = np.concatenate(([0], np.cumsum(lengths))).tolist()
+    return [nodes[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def replay_snapshot(snapshot, portfolio=False, **overrides):
+    """
+    Vuelve a resolver una instantánea
+
+    Args:
+        snapshot: Dict devuelto por load_snapshot
+        portfolio: Resolver con optimize_portfolio
+        **overrides: Parámetros de optimize que reemplazan a los guardados
+            (preset, time_limit...)
+
+    Returns:
+        Tupla (resultado, search_stats)
+    """
+    params = snapshot['params']
+    kwargs = {
+        'num_vehicles': params['num_vehicles'],
+        'vehicle_capacities': snapshot['vehicle_capacities'],
+        'time_windows': snapshot['time_windows'],
+        'initial_routes': snapshot['initial_routes'],
+        'preset': params.get('preset'),
+        'drop_penalty': params.get('drop_penalty'),
+        'departure': params.get('departure'),
+        # Misma búsqueda que en producción: arcos candidatos y estrategia inicial
+        'candidate_arcs': snapshot.get('candidate_arcs'),
+        'first_solution_strategy': params.get('first_solution_strategy'),
+    }
+    kwargs.update({key: value for key, value in overrides.items() if value is not None})
+    kwargs = {key: value for key, value in kwargs.items() if value is not None}
+
+    optimizer = RouteOptimizer(snapshot['distance_matrix'], snapshot['time_matrix'])
+    if portfolio:
+        # Cada miembro del portafolio usa su propia estrategia inicial
+        kwargs.pop('first_solution_strategy', None)
+        result = optimizer.optimize_portfolio(**kwargs)
+    else:
+        result = optimizer.optimize(**kwargs)
+    return result, optimizer.search_stats
@@ -0,0 +1,138 @@
+"""
+Caché de soluciones direccionada por contenido.
+
+La clave es un hash estable del problema compilado (coordenadas, flota,
+capacidades, ventanas de tiempo, hora de salida, preset y lo que define
+la matriz de tiempos: tipo de vehículo y versión de la tabla de
+velocidades), así que cualquier cambio en los datos produce otra clave y
+la entrada anterior simplemente deja de usarse hasta que se desaloja.
+"""
+import hashlib
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'optimization:solution:'
+INDEX_KEY = 'optimization:solution_index'
+INDEX_LOCK_KEY = 'optimization:solution_index:lock'
+
+# El candado caduca solo si el proceso que lo tiene muere (segundos)
+INDEX_LOCK_TIMEOUT = 5
+# Espera máxima por el candado antes de dejar el índice sin actualizar (segundos)
+INDEX_LOCK_WAIT = 1.0
+INDEX_LOCK_POLL = 0.01
+
+
+def problem_key(coordinates, num_vehicles, vehicle_capacities=None, time_windows=None, preset=None,
+                drop_penalty=None, departure=None, vehicle_type=None, speeds=None):
+    """
+    Hash estable de una instancia de optimización
+
+    Args:
+        coordinates: Lista de tuplas (lat, lng), depot primero
+        num_vehicles: Número de vehículos
+        vehicle_capacities: Capacidad de cada vehículo
+        time_windows: Ventanas (inicio, fin) por nodo
+        preset: Perfil de búsqueda
+        drop_penalty: Penalización por entrega sin asignar (modo parcial)
+        departure: Minuto del día en que sale la flota (origen de las llegadas)
+        vehicle_type: Tipo de vehículo con que se calcularon los tiempos
+        speeds: Versión de la tabla de velocidades (SpeedTable.version) o None
+
+    Returns:
+        Hex digest SHA-256
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(coordinates, dtype=np.float64).tobytes())
+    digest.update(json.dumps({
+        'num_vehicles': num_vehicles,
+        'vehicle_capacities': list(vehicle_capacities) if vehicle_capacities else None,
+        'time_windows': [list(window) if window else None for window in time_windows] if time_windows else None,
+        'preset': preset,
+        'drop_penalty': drop_penalty,
+        'departure': departure,
+        'vehicle_type': vehicle_type,
+        'speeds': speeds,
+    }, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class SolutionCache:
+    """Guarda resultados de RouteOptimizer con desalojo LRU acotado"""
+
+    @staticmethod
+    def get(key):
+        """Devuelve el resultado guardado o None"""
+        try:
+            result = cache.get(KEY_PREFIX + key)
+            if result is not None:
+                SolutionCache._touch(key)
+            return result
+        except Exception as e:
+            logger.warning(f"Caché de soluciones no disponible: {e}")
+            return None
+
+    @staticmethod
+    def set(key, result):
+        """Guarda un resultado y desaloja las entradas más antiguas si se excede el máximo"""
+        try:
+            cache.set(KEY_PREFIX + key, result, settings.OPTIMIZATION_CACHE_TIMEOUT)
+            evicted = SolutionCache._touch(key)
+            if evicted:
+                cache.delete_many([KEY_PREFIX + old_key for old_key in evicted])
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la solución en caché: {e}")
+
+    @staticmethod
+    def _touch(key):
+        """
+        Mueve la clave al final del índice LRU y devuelve las claves desalojadas
+
+        La lectura y escritura del índice van bajo un candado: sin él, dos
+        workers que tocan el índice a la vez pierden una de las claves y
+        esa entrada nunca se desaloja. Si el candado no se obtiene a
+        tiempo el índice no se actualiza (la entrada caduca igual por
+        OPTIMIZATION_CACHE_TIMEOUT).
+        """
+        with _index_lock() as acquired:
+            if not acquired:
+                logger.warning(f"Índice de la caché de soluciones ocupado, no se actualiza {key}")
+                return []
+            index = [entry for entry in cache.get(INDEX_KEY, []) if entry != key]
+            index.append(key)
+            overflow = max(len(index) - settings.OPTIMIZATION_CACHE_MAX_ENTRIES, 0)
+            evicted, index = index[:overflow], index[overflow:]
+            cache.set(INDEX_KEY, index, settings.OPTIMIZATION_CACHE_TIMEOUT)
+            return evicted
+
+
+@contextmanager
+def _index_lock():
+    """
+    Candado del índice LRU sobre la caché compartida
+
+    cache.add solo escribe si la clave no existe (SET NX en Redis), así que
+    un solo proceso lo obtiene; el valor identifica al dueño para no
+    liberar el candado de otro si el nuestro ya caducó.
+
+    Yields:
+        True si se obtuvo el candado
+    """
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + INDEX_LOCK_WAIT
+    acquired = cache.add(INDEX_LOCK_KEY, token, INDEX_LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(INDEX_LOCK_POLL)
+        acquired = cache.add(INDEX_LOCK_KEY, token, INDEX_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired and cache.get(INDEX_LOCK_KEY) == token:
+            cache.delete(INDEX_LOCK_KEY)
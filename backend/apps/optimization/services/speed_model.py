@@ -0,0 +1,256 @@
+"""
+Modelo de velocidades derivado del historial GPS.
+
+Un trabajo fuera de línea agrega LocationUpdate.speed por tipo de
+vehículo, hora del día y celda geohash en una tabla compacta (.npz). Al
+optimizar, la tabla da la velocidad de cada nodo según su celda y la hora
+de salida, y la matriz de tiempos se calcula de forma vectorizada a
+partir de la matriz de distancias. Sin tabla se usa la velocidad fija
+AVERAGE_SPEED_M_PER_MIN.
+"""
+import hashlib
+import logging
+import os
+from datetime import timedelta
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+from apps.core.models import LocationUpdate
+from .route_optimizer import build_time_matrix, MATRIX_BLOCK_CELLS
+
+logger = logging.getLogger(__name__)
+
+# Bits de la celda: 25 bits = geohash de 5 caracteres (~4.9 x 4.9 km)
+GEOHASH_BITS = 25
+
+HOURS = 24
+
+# Muestras mínimas para confiar en el promedio de una celda u hora
+MIN_SAMPLES = 20
+
+# Lecturas fuera de este rango (km/h) son paradas o ruido del GPS
+MIN_MOVING_SPEED_KMH = 3
+MAX_SPEED_KMH = 120
+
+# Historial agregado por defecto (días)
+HISTORY_DAYS = 60
+
+# Hora de salida supuesta cuando no se conoce
+DEFAULT_DEPARTURE_HOUR = 8
+
+KMH_TO_M_PER_MIN = 1000 / 60
+
+
+def geohash_cells(lats, lngs, bits=GEOHASH_BITS):
+    """
+    Celda geohash de cada punto como entero, vectorizado
+
+    Los bits se intercalan como en el geohash estándar (longitud primero),
+    así que los primeros 5 * k bits equivalen a un geohash de k caracteres.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    lat_range = [np.full(lats.shape, -90.0), np.full(lats.shape, 90.0)]
+    lng_range = [np.full(lngs.shape, -180.0), np.full(lngs.shape, 180.0)]
+    cells = np.zeros(lats.shape, dtype=np.int64)
+    for bit in range(bits):
+        values, (low, high) = (lngs, lng_range) if bit % 2 == 0 else (lats, lat_range)
+        mid = (low + high) / 2
+        upper = values >= mid
+        low[:] = np.where(upper, mid, low)
+        high[:] = np.where(upper, high, mid)
+        cells = (cells << 1) | upper
+    return cells
+
+
+class SpeedTable:
+    """Velocidades promedio (metros por minuto) por tipo de vehículo, hora y celda"""
+
+    def __init__(self, vehicle_types, cells, cell_speeds, hourly_speeds, type_speeds, global_speed):
+        """
+        Args:
+            vehicle_types: Tipos de vehículo, ordenados
+            cells: Celdas geohash con datos, ordenadas
+            cell_speeds: Arreglo (tipos, 24, celdas); NaN sin muestras suficientes
+            hourly_speeds: Arreglo (tipos, 24) sin distinguir celda
+            type_speeds: Arreglo (tipos,) sin distinguir hora ni celda
+            global_speed: Promedio de todas las lecturas
+        """
+        self.vehicle_types = list(vehicle_types)
+        self.cells = np.asarray(cells, dtype=np.int64)
+        self.cell_speeds = np.asarray(cell_speeds, dtype=np.float32)
+        self.hourly_speeds = np.asarray(hourly_speeds, dtype=np.float32)
+        self.type_speeds = np.asarray(type_speeds, dtype=np.float32)
+        self.global_speed = float(global_speed)
+
+    @classmethod
+    def aggregate(cls, vehicle_types, hours, lats, lngs, speeds_kmh, min_samples=MIN_SAMPLES):
+        """
+        Agrega lecturas GPS en la tabla
+
+        Las lecturas se toman a intervalos de tiempo, así que su promedio
+        aritmético es distancia recorrida entre tiempo transcurrido.
+        """
+        vehicle_types = np.asarray(vehicle_types)
+        types, type_index = np.unique(vehicle_types, return_inverse=True)
+        cells, cell_index = np.unique(geohash_cells(lats, lngs), return_inverse=True)
+        hours = np.asarray(hours, dtype=np.int64)
+        speeds = np.asarray(speeds_kmh, dtype=np.float64) * KMH_TO_M_PER_MIN
+
+        def mean(keys, size):
+            sums = np.bincount(keys, weights=speeds, minlength=size)
+            counts = np.bincount(keys, minlength=size)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(counts >= min_samples, sums / counts, np.nan)
+
+        by_hour = type_index * HOURS + hours
+        return cls(
+            types.tolist(),
+            cells,
+            mean(by_hour * len(cells) + cell_index, len(types) * HOURS * len(cells)).reshape(
+                len(types), HOURS, len(cells)),
+            mean(by_hour, len(types) * HOURS).reshape(len(types), HOURS),
+            mean(type_index, len(types)),
+            speeds.mean(),
+        )
+
+    def node_speeds(self, lats, lngs, vehicle_type, hour):
+        """
+        Velocidad de cada nodo: celda y hora, luego hora, luego tipo y
+        finalmente el promedio global
+        """
+        n = len(lats)
+        speeds = np.full(n, np.nan)
+        if vehicle_type in self.vehicle_types:
+            t = self.vehicle_types.index(vehicle_type)
+            if len(self.cells):
+                cells = geohash_cells(lats, lngs)
+                position = np.clip(np.searchsorted(self.cells, cells), 0, len(self.cells) - 1)
+                known = self.cells[position] == cells
+                speeds[known] = self.cell_speeds[t, hour, position[known]]
+            speeds = np.where(np.isnan(speeds), self.hourly_speeds[t, hour], speeds)
+            speeds = np.where(np.isnan(speeds), self.type_speeds[t], speeds)
+        return np.where(np.isnan(speeds), self.global_speed, speeds)
+
+    @property
+    def version(self):
+        """Huella del contenido, para las claves de matrices derivadas"""
+        digest = hashlib.sha256()
+        for array in (self.cells, self.cell_speeds, self.hourly_speeds, self.type_speeds):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(repr((self.vehicle_types, self.global_speed)).encode())
+        return digest.hexdigest()[:16]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        partial = f'{path}.tmp.npz'
+        np.savez_compressed(
+            partial,
+            vehicle_types=np.array(self.vehicle_types, dtype=str),
+            cells=self.cells,
+            cell_speeds=self.cell_speeds,
+            hourly_speeds=self.hourly_speeds,
+            type_speeds=self.type_speeds,
+            global_speed=np.array(self.global_speed),
+        )
+        os.replace(partial, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data['vehicle_types'].tolist(),
+                data['cells'],
+                data['cell_speeds'],
+                data['hourly_speeds'],
+                data['type_speeds'],
+                float(data['global_speed']),
+            )
+
+
+# Tabla cargada por proceso, recargada si el archivo cambia
+_loaded_table = {}
+
+
+def load_speed_table(path=None):
+    """
+    Tabla de velocidades vigente
+
+    Returns:
+        SpeedTable o None si todavía no se ha generado
+    """
+    path = path or settings.OPTIMIZATION_SPEED_TABLE_PATH
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    if _loaded_table.get('key') != (path, mtime):
+        try:
+            _loaded_table.update(key=(path, mtime), table=SpeedTable.load(path))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Tabla de velocidades ilegible: {e}")
+            return None
+    return _loaded_table['table']
+
+
+def build_speed_table(days=HISTORY_DAYS, min_samples=MIN_SAMPLES):
+    """
+    Agrega el historial de LocationUpdate en una SpeedTable
+
+    Returns:
+        SpeedTable o None si no hay lecturas en el periodo
+    """
+    rows = (
+        LocationUpdate.objects.filter(
+            timestamp__gte=timezone.now() - timedelta(days=days),
+            speed__gte=MIN_MOVING_SPEED_KMH,
+            speed__lte=MAX_SPEED_KMH,
+        )
+        .annotate(hour=ExtractHour('timestamp'))  # hora local (TIME_ZONE)
+        .values_list('route__vehicle__vehicle_type', 'hour', 'latitude', 'longitude', 'speed')
+    )
+    columns = list(zip(*rows.iterator(chunk_size=10000)))
+    if not columns:
+        return None
+    vehicle_types, hours, lats, lngs, speeds = columns
+    table = SpeedTable.aggregate(
+        vehicle_types, hours,
+        np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64), speeds,
+        min_samples=min_samples,
+    )
+    logger.info(f"Tabla de velocidades: {len(speeds)} lecturas, {len(table.cells)} celdas")
+    return table
+
+
+def build_vehicle_time_matrix(distance_matrix, lats, lngs, vehicle_type=None, hour=DEFAULT_DEPARTURE_HOUR,
+                              table=None, block_cells=MATRIX_BLOCK_CELLS):
+    """
+    Matriz de tiempos (minutos) para un tipo de vehículo y hora de salida
+
+    Cada arco usa el promedio del ritmo (minutos por metro) de sus dos
+    extremos, por bloques de filas.
+
+    Args:
+        distance_matrix: Matriz de distancias (metros)
+        lats, lngs: Coordenadas de los nodos
+        vehicle_type: Tipo de vehículo de la tabla
+        hour: Hora local de salida (0-23)
+        table: SpeedTable; sin tabla se usa build_time_matrix
+
+    Returns:
+        np.ndarray int32 (n, n)
+    """
+    if table is None:
+        return build_time_matrix(distance_matrix).astype(np.int32)
+
+    pace = 1.0 / table.node_speeds(lats, lngs, vehicle_type, hour)
+    n = len(pace)
+    matrix = np.empty((n, n), dtype=np.int32)
+    rows_per_block = max(1, block_cells // max(n, 1))
+    for start in range(0, n, rows_per_block):
+        stop = min(start + rows_per_block, n)
+        block = np.asarray(distance_matrix[start:stop], dtype=np.float64)
+        matrix[start:stop] = block * (pace[start:stop, None] + pace[None, :]) / 2
+    return matrix
+
@@ -1,63 +1,366 @@
+import logging
+from datetime import datetime
 from celery import shared_task
-from apps.core.models import DeliveryBatch, Route, Stop
-from .services.route_optimizer import RouteOptimizer, create_distance_matrix_from_coordinates
+from django.conf import settings
+from django.utils import timezone
+from apps.core.models import DeliveryBatch, Stop
+from .services.route_optimizer import (
+    RouteOptimizer,
+    build_distance_matrix,
+    build_time_matrix,
+    build_warm_start_routes,
+    DEFAULT_PRESET,
+    DEFAULT_DROP_PENALTY,
+)
+from .services.decomposition import DecompositionOptimizer, DECOMPOSITION_THRESHOLD
+from .services.candidate_graph import (
+    CandidateGraph,
+    CANDIDATE_ARCS_THRESHOLD,
+    CANDIDATE_FIRST_SOLUTION,
+    DEFAULT_NEIGHBORS,
+)
+from .services.solution_cache import SolutionCache, problem_key
+from .services.progress import OptimizationProgress
+from .services.cancellation import OptimizationRuns, CancellationCheck
+from .services.matrix_store import MatrixStore, matrix_key
+from .services.rolling_horizon import reoptimize_in_progress
+from .services.fleet_sizing import FleetScenarios, compare_fleets
+from .services.snapshots import save_snapshot
+from .services.instance import ProblemInstance
+from .services.persistence import save_solution
+from .services.cost_estimator import CostModel, PeakMemorySampler, fits_in_worker
+from .services.speed_model import build_speed_table, build_vehicle_time_matrix, load_speed_table
+from .services.feasibility import (
+    DAY_MINUTES,
+    FeasibilityReports,
+    check_feasibility,
+    min_arrival_times,
+    travel_times_from_coordinates,
+)
+
+logger = logging.getLogger(__name__)
+
+NUM_VEHICLES = 2  # vehículos de prueba
 
 @shared_task
-def optimize_batch_task(batch_id):
+def optimize_batch_task(batch_id, preset=DEFAULT_PRESET, incremental=False, portfolio=False, partial=False,
+                        run_id=None, snapshot=False, decompose=False, memory_mb=None):
+    # Corrida registrada por la vista al encolar; una llamada directa registra la suya
+    run_id = run_id or OptimizationRuns.start(batch_id)
+    if OptimizationRuns.state(batch_id, run_id) != 'active':
+        # Cancelada o reemplazada mientras esperaba en la cola
+        return False
+
     try:
         batch = DeliveryBatch.objects.get(id=batch_id)
         batch.status = 'optimizing'
         batch.save()
+        if OptimizationRuns.state(batch_id, run_id) != 'active':
+            # Cancelada entre la verificación y la escritura: cancel_optimization ya
+            # pudo restablecer el estado, deshacer 'optimizing'
+            _release(batch)
+            return False
+        OptimizationProgress.clear(batch_id)
+        FeasibilityReports.clear(batch_id)
 
-        # Obtener coordenadas (depot + entregas)
-        coordinates = [(batch.depot_coordinates['lat'], batch.depot_coordinates['lng'])]
-        deliveries = list(batch.deliveries.all())
-        for delivery in deliveries:
-            if delivery.coordinates:
-                coordinates.append((delivery.coordinates['lat'], delivery.coordinates['lng']))
+        # Depot y entregas con coordenadas; el nodo i es instance.delivery_id(i) en todas las etapas
+        instance = ProblemInstance.from_batch(batch)
 
-        # Matrices
-        distance_matrix = create_distance_matrix_from_coordinates(coordinates)
-        time_matrix = [[d // 50 for d in row] for row in distance_matrix]
-
-        # Optimizar (2 vehículos de prueba)
-        optimizer = RouteOptimizer(distance_matrix, time_matrix)
-        result = optimizer.optimize(num_vehicles=2)
+        # Un lote sin cambios devuelve la solución guardada sin volver a resolver
+        # En modo parcial cada entrega puede descartarse pagando una penalización
+        drop_penalty = DEFAULT_DROP_PENALTY if partial else None
+        capacities = _vehicle_capacities(batch)
+        # Los tiempos dependen del tipo de vehículo y de la tabla de velocidades vigente
+        table = load_speed_table()
+        cache_key = problem_key(instance.coordinates, NUM_VEHICLES, capacities, instance.time_windows,
+                                preset=preset, drop_penalty=drop_penalty, departure=instance.departure,
+                                vehicle_type=_vehicle_type(batch), speeds=table.version if table else None)
+        result = SolutionCache.get(cache_key)
+        if result is None:
+            stop_check = CancellationCheck(batch_id, run_id)
+            result = _solve(batch, instance, capacities, preset, incremental, portfolio, stop_check, drop_penalty,
+                            snapshot, decompose, memory_mb)
+            if OptimizationRuns.state(batch_id, run_id) != 'active':
+                # El lote cambió o se canceló: no guardar rutas obsoletas
+                return False
+            if result:
+                SolutionCache.set(cache_key, result)
 
         if result:
-            # Guardar rutas y paradas
-            for i, route_data in enumerate(result['routes']):
-                vehicle = batch.owner.vehicles.first() or None
-                driver = batch.owner.drivers.first() or None
-
-                route = Route.objects.create(
-                    batch=batch,
-                    vehicle=vehicle,
-                    driver=driver,
-                    route_order=i+1,
-                    total_distance_km=route_data['total_distance'] / 1000,
-                    estimated_duration_minutes=route_data['total_time'] // 60,
-                    status='planned'
-                )
-
-                for stop_idx in route_data['stops'][1:-1]:  # Sin depot inicial y final
-                    delivery = deliveries[stop_idx - 1]  # Índice ajustado
-                    Stop.objects.create(
-                        route=route,
-                        delivery=delivery,
-                        stop_order=stop_idx
-                    )
-
-            batch.status = 'ready'
-            batch.total_distance_km = result['total_distance'] / 1000
-            batch.estimated_duration_minutes = result['total_time'] // 60
+            # Rutas, paradas (con su hora estimada de llegada) y estados en una sola transacción,
+            # solo si la corrida sigue activa al bloquear el lote
+            routes = save_solution(batch, instance, result, _arrival_origin(batch, instance),
+                                   should_persist=lambda: OptimizationRuns.state(batch_id, run_id) == 'active')
+            if routes is None:
+                return False
         else:
             batch.status = 'failed'
-
-        batch.save()
+            batch.save()
         return True
 
     except Exception as e:
         batch.status = 'failed'
         batch.save()
         return False
+
+    finally:
+        OptimizationRuns.finish(batch_id, run_id)
+
+
+@shared_task
+def reoptimize_in_progress_task(batch_id, run_id=None):
+    """Re-optimiza el sufijo pendiente de un lote en curso (horizonte rodante)"""
+    run_id = run_id or OptimizationRuns.start(batch_id)
+    if OptimizationRuns.state(batch_id, run_id) != 'active':
+        return False
+
+    try:
+        batch = DeliveryBatch.objects.get(id=batch_id, status='in_progress')
+        # Un evento más reciente reemplaza esta corrida: no guardar un orden obsoleto
+        result = reoptimize_in_progress(
+            batch,
+            stop_check=CancellationCheck(batch_id, run_id),
+            should_persist=lambda: OptimizationRuns.state(batch_id, run_id) == 'active',
+        )
+        return result is not None
+    except DeliveryBatch.DoesNotExist:
+        return False
+    finally:
+        OptimizationRuns.finish(batch_id, run_id)
+
+
+@shared_task
+def reoptimize_in_progress_batches():
+    """Disparo periódico (Celery beat) de la re-optimización de los lotes en curso"""
+    batch_ids = DeliveryBatch.objects.filter(status='in_progress').values_list('id', flat=True)
+    for batch_id in batch_ids:
+        reoptimize_in_progress_task.delay(str(batch_id), run_id=OptimizationRuns.start(batch_id))
+    return len(batch_ids)
+
+
+@shared_task
+def compare_fleets_task(batch_id, scenarios):
+    """Compara configuraciones de flota sobre el lote sin guardar rutas"""
+    FleetScenarios.set(batch_id, {'status': 'running', 'scenarios': []})
+    try:
+        batch = DeliveryBatch.objects.get(id=batch_id)
+        instance = ProblemInstance.from_batch(batch)
+
+        # Todas las flotas se resuelven sobre las mismas matrices compartidas
+        distance_matrix, time_matrix = _batch_matrices(instance, _vehicle_type(batch))
+        rows = compare_fleets(distance_matrix, time_matrix, scenarios, time_windows=instance.time_windows,
+                              departure=instance.departure)
+        for row in rows:
+            if row['unassigned'] is not None:
+                row['unassigned'] = [str(instance.delivery_id(node)) for node in row['unassigned']]
+        FleetScenarios.set(batch_id, {'status': 'done', 'scenarios': rows})
+        return True
+    except Exception as e:
+        FleetScenarios.set(batch_id, {'status': 'failed', 'scenarios': [], 'error': str(e)})
+        return False
+
+
+@shared_task
+def build_speed_table_task():
+    """Regenera la tabla de velocidades con el historial GPS reciente (Celery beat)"""
+    table = build_speed_table()
+    if table is None:
+        return False
+    table.save(settings.OPTIMIZATION_SPEED_TABLE_PATH)
+    return True
+
+
+def _batch_matrices(instance, vehicle_type=None):
+    """
+    Matrices int32 compartidas: reintentos y otras corridas del mismo lote no las reconstruyen
+
+    Los tiempos salen de la tabla de velocidades (tipo de vehículo y hora
+    de salida) si existe; si no, de la velocidad fija.
+    """
+    coordinates = instance.coordinates
+    distance_matrix = MatrixStore.get_or_build(
+        matrix_key(coordinates, 'distance'), lambda: build_distance_matrix(instance.lats, instance.lngs)
+    )
+    table = load_speed_table()
+    if table is None:
+        time_matrix = MatrixStore.get_or_build(
+            matrix_key(coordinates, 'time'), lambda: build_time_matrix(distance_matrix)
+        )
+    else:
+        hour = instance.departure_hour
+        time_matrix = MatrixStore.get_or_build(
+            matrix_key(coordinates, 'time', vehicle_type=vehicle_type, hour=hour, speeds=table.version),
+            lambda: build_vehicle_time_matrix(distance_matrix, instance.lats, instance.lngs, vehicle_type, hour,
+                                              table),
+        )
+    return distance_matrix, time_matrix
+
+
+def _solve(batch, instance, capacities, preset, incremental, portfolio, stop_check=None, drop_penalty=None,
+           snapshot=False, decompose=False, memory_mb=None):
+    """
+    Resuelve el lote con el motor adecuado a su tamaño
+
+    La descomposición no admite soluciones parciales: para lotes grandes
+    la verificación previa rechaza el lote aunque se pida modo parcial.
+    Con snapshot se guarda la instancia compilada (ver services.snapshots);
+    los lotes descompuestos no tienen matriz completa y no se guardan.
+    Con decompose (o si la matriz n² no cabe en memory_mb, la memoria de
+    la cola que eligió plan_execution) se descompone siempre, aunque la
+    corrida sea incremental.
+    """
+    oversized = decompose or not fits_in_worker(instance.num_nodes, NUM_VEHICLES, preset, memory_mb)
+    if oversized or (instance.num_deliveries > DECOMPOSITION_THRESHOLD and not incremental):
+        # Lotes muy grandes: optimizar por grupos sin construir la matriz n²
+        if not _precheck(instance, *travel_times_from_coordinates(instance.lats, instance.lngs), capacities):
+            return None
+        optimizer = DecompositionOptimizer(instance.lats, instance.lngs, speed_table=load_speed_table(),
+                                           vehicle_type=_vehicle_type(batch))
+        return optimizer.optimize(num_vehicles=NUM_VEHICLES, vehicle_capacities=capacities,
+                                  time_windows=instance.time_windows, preset=preset, stop_check=stop_check,
+                                  departure=instance.departure)
+
+    # Medir la corrida completa para afinar las estimaciones de memoria y tiempo
+    with PeakMemorySampler() as sampler:
+        result = _solve_full(batch, instance, capacities, preset, incremental, portfolio, stop_check, drop_penalty,
+                             snapshot)
+    # En modo portafolio la memoria se reparte entre procesos hijos que no se miden
+    if result is not None and not portfolio:
+        CostModel.record(instance.num_nodes, NUM_VEHICLES, preset, sampler.peak_mb, sampler.seconds)
+    return result
+
+
+def _solve_full(batch, instance, capacities, preset, incremental, portfolio, stop_check, drop_penalty, snapshot):
+    """Corrida con la matriz n² completa"""
+    time_windows = instance.time_windows
+    distance_matrix, time_matrix = _batch_matrices(instance, _vehicle_type(batch))
+
+    # Descartar en milisegundos instancias imposibles antes de gastar tiempo de solver;
+    # en modo parcial el solver descarta las entregas problemáticas
+    if not _precheck(instance, time_matrix[0], min_arrival_times(time_matrix), capacities,
+                     allow_partial=drop_penalty is not None):
+        return None
+
+    # Partir de las rutas guardadas si es una re-optimización incremental
+    initial_routes = None
+    if incremental:
+        initial_routes = build_warm_start_routes(
+            _previous_routes(batch, instance),
+            instance.num_nodes,
+            NUM_VEHICLES,
+            distance_matrix,
+            vehicle_capacities=capacities,
+        )
+        if initial_routes is None:
+            logger.warning(f"Las rutas previas del lote {batch.id} no caben en la flota actual, optimizando desde cero")
+
+    # Lotes grandes: cada nodo solo puede seguir a sus vecinos cercanos; si así no
+    # hay solución, RouteOptimizer reintenta sin restricción
+    candidate_arcs = None
+    if instance.num_deliveries > CANDIDATE_ARCS_THRESHOLD:
+        candidate_arcs = CandidateGraph(instance.lats, instance.lngs, k=DEFAULT_NEIGHBORS).allowed_successors()
+    first_solution_strategy = CANDIDATE_FIRST_SOLUTION if candidate_arcs else 'PATH_CHEAPEST_ARC'
+
+    if snapshot:
+        # La instantánea registra la misma búsqueda (arcos y estrategia inicial) que se ejecuta
+        save_snapshot(
+            settings.OPTIMIZATION_SNAPSHOT_DIR, distance_matrix, time_matrix,
+            {'num_vehicles': NUM_VEHICLES, 'preset': preset, 'drop_penalty': drop_penalty, 'portfolio': portfolio,
+             'departure': instance.departure, 'first_solution_strategy': first_solution_strategy,
+             'candidate_k': DEFAULT_NEIGHBORS if candidate_arcs else None},
+            time_windows=time_windows, vehicle_capacities=capacities, initial_routes=initial_routes,
+            candidate_arcs=candidate_arcs, label=str(batch.id),
+        )
+
+    # Optimizar (varias estrategias en paralelo en modo portafolio)
+    optimizer = RouteOptimizer(distance_matrix, time_matrix)
+    if portfolio:
+        return optimizer.optimize_portfolio(
+            num_vehicles=NUM_VEHICLES, vehicle_capacities=capacities, time_windows=time_windows, preset=preset,
+            initial_routes=initial_routes, stop_check=stop_check, drop_penalty=drop_penalty,
+            candidate_arcs=candidate_arcs, departure=instance.departure,
+        )
+    return optimizer.optimize(
+        num_vehicles=NUM_VEHICLES,
+        vehicle_capacities=capacities,
+        time_windows=time_windows,
+        preset=preset,
+        initial_routes=initial_routes,
+        stop_check=stop_check,
+        progress_callback=OptimizationProgress.reporter(batch.id),
+        drop_penalty=drop_penalty,
+        candidate_arcs=candidate_arcs,
+        first_solution_strategy=first_solution_strategy,
+        departure=instance.departure,
+    )
+
+
+def _arrival_origin(batch, instance):
+    """
+    Instante que corresponde al minuto 0 de las llegadas del solver
+
+    Con o sin ventanas las llegadas cuentan desde la medianoche del día de
+    entrega: el solver ya parte de instance.departure.
+    """
+    return timezone.make_aware(datetime.combine(batch.delivery_date, datetime.min.time()))
+
+
+def _release(batch):
+    """Estado de un lote sin optimización en curso (igual que cancel_optimization)"""
+    batch.status = 'ready' if batch.routes.exists() else 'draft'
+    batch.save(update_fields=['status', 'updated_at'])
+
+
+def _vehicle_capacities(batch):
+    """Máximo de paradas de cada vehículo; las rutas se guardan con el primer vehículo del dueño"""
+    vehicle = batch.owner.vehicles.first()
+    return [vehicle.max_stops] * NUM_VEHICLES if vehicle else None
+
+
+def _vehicle_type(batch):
+    """Tipo del vehículo con que se guardan las rutas del lote"""
+    vehicle = batch.owner.vehicles.first()
+    return vehicle.vehicle_type if vehicle else None
+
+
+def _precheck(instance, depot_times, arrival_times, vehicle_capacities=None, allow_partial=False):
+    """
+    Verifica condiciones necesarias de factibilidad y publica el reporte
+    con las entregas problemáticas si la instancia es imposible
+
+    Usa la misma flota que el solver: capacidades de los vehículos y
+    salida en instance.departure. Con allow_partial el reporte se publica
+    pero el lote no se rechaza.
+    """
+    time_windows = list(instance.time_windows or [None] * instance.num_nodes)
+    time_windows[0] = (instance.departure, DAY_MINUTES)
+    report = check_feasibility(depot_times, arrival_times, time_windows, NUM_VEHICLES, vehicle_capacities)
+    if report['feasible']:
+        return True
+
+    delivery_ids = [None] + [str(delivery_id) for delivery_id in instance.delivery_ids]
+    FeasibilityReports.set(instance.batch_id, {
+        'unreachable': [delivery_ids[node] for node in report['unreachable']],
+        'capacity_shortfall': report['capacity_shortfall'],
+        'window_conflicts': [
+            {**conflict, 'nodes': [delivery_ids[node] for node in conflict['nodes']]}
+            for conflict in report['window_conflicts']
+        ],
+    })
+    return allow_partial
+
+
+def _previous_routes(batch, instance):
+    """Secuencias de nodos de las rutas guardadas del lote"""
+    stops = (
+        Stop.objects.filter(route__batch=batch)
+        .order_by('route__route_order', 'stop_order')
+        .values_list('route_id', 'delivery_id')
+    )
+
+    routes = {}
+    for route_id, delivery_id in stops:
+        node = instance.node_of(delivery_id)
+        if node is not None:
+            routes.setdefault(route_id, []).append(node)
+    return list(routes.values())
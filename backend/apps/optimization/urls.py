@@ -0,0 +1,13 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('routes/preview/', views.preview_route, name='preview-route'),
+    path('delivery-batches/<uuid:batch_id>/optimize/', views.optimize_batch, name='optimize-batch'),
+    path('delivery-batches/<uuid:batch_id>/cancel-optimization/', views.cancel_optimization, name='cancel-optimization'),
+    path('delivery-batches/<uuid:batch_id>/insert-delivery/', views.insert_batch_delivery, name='insert-delivery'),
+    path('delivery-batches/<uuid:batch_id>/reoptimize-in-progress/', views.reoptimize_in_progress_batch,
+         name='reoptimize-in-progress'),
+    path('delivery-batches/<uuid:batch_id>/fleet-scenarios/', views.fleet_scenarios, name='fleet-scenarios'),
+    path('delivery-batches/<uuid:batch_id>/optimization/', views.optimization_status, name='optimization-status'),
+]
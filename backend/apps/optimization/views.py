@@ -1,23 +1,232 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from apps.core.models import DeliveryBatch
-from .tasks import optimize_batch_task
+from apps.core.models import DeliveryBatch, Delivery
+from .tasks import optimize_batch_task, reoptimize_in_progress_task, compare_fleets_task, NUM_VEHICLES
+from .services.route_optimizer import SOLVER_PRESETS, DEFAULT_PRESET
+from .services.progress import OptimizationProgress
+from .services.cancellation import OptimizationRuns
+from .services.preview import preview_routes, MAX_PREVIEW_STOPS, MAX_PREVIEW_VEHICLES
+from .services.insertion import insert_delivery
+from .services.feasibility import FeasibilityReports
+from .services.fleet_sizing import FleetScenarios, MAX_FLEET_SCENARIOS
+from .services.cost_estimator import plan_execution
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def optimize_batch(request, batch_id):
     try:
         batch = DeliveryBatch.objects.get(id=batch_id, owner=request.user)
-        if batch.status != 'draft':
+        incremental = bool(request.data.get('incremental', False))
+        # Un lote en optimización puede volver a encolarse: la corrida anterior se cancela
+        if incremental and batch.status not in ('draft', 'ready', 'optimizing'):
+            return Response({'error': 'Solo lotes en borrador o listos pueden re-optimizarse'}, status=400)
+        if not incremental and batch.status not in ('draft', 'optimizing'):
             return Response({'error': 'Solo lotes en borrador pueden optimizarse'}, status=400)
 
-        # Lanzar tarea Celery
-        task = optimize_batch_task.delay(str(batch.id))
+        # La re-optimización parte de las rutas existentes: basta el preset rápido
+        preset = request.data.get('preset', 'fast' if incremental else DEFAULT_PRESET)
+        if preset not in SOLVER_PRESETS:
+            return Response({'error': f'Preset inválido. Opciones: {", ".join(SOLVER_PRESETS)}'}, status=400)
+
+        # Lotes que no caben en un worker normal: cola de gran memoria o descomposición
+        num_nodes = batch.deliveries.filter(coordinates__isnull=False).count() + 1
+        plan = plan_execution(num_nodes, NUM_VEHICLES, preset)
+
+        # Lanzar tarea Celery (reemplaza cualquier corrida previa del lote)
+        task = optimize_batch_task.apply_async(
+            args=[str(batch.id)],
+            kwargs={
+                'preset': preset,
+                'incremental': incremental,
+                'portfolio': bool(request.data.get('portfolio', False)),
+                'partial': bool(request.data.get('partial', False)),
+                'run_id': OptimizationRuns.start(batch.id),
+                # Instantánea para perfilar fuera de producción (solo personal interno)
+                'snapshot': request.user.is_staff and bool(request.data.get('snapshot', False)),
+                'decompose': plan['decompose'],
+                # El worker verifica la memoria con el límite de la cola elegida
+                'memory_mb': plan['memory_mb'],
+            },
+            queue=plan['queue'],
+        )
         return Response({
             'status': 'optimizing',
             'task_id': task.id,
+            'preset': preset,
+            'execution': plan,
             'message': 'La optimización está en progreso...'
         })
     except DeliveryBatch.DoesNotExist:
         return Response({'error': 'Lote no encontrado'}, status=404)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def cancel_optimization(request, batch_id):
+    try:
+        # Con la fila bloqueada la tarea no puede guardar rutas a la vez (ver save_solution)
+        with transaction.atomic():
+            batch = DeliveryBatch.objects.select_for_update().get(id=batch_id, owner=request.user)
+            if batch.status != 'optimizing':
+                return Response({'error': 'El lote no tiene una optimización en curso'}, status=400)
+
+            # El solver detecta la cancelación en su límite de búsqueda y la tarea no guarda rutas
+            OptimizationRuns.cancel(batch.id)
+            batch.status = 'ready' if batch.routes.exists() else 'draft'
+            batch.save()
+        return Response({
+            'status': batch.status,
+            'message': 'Optimización cancelada'
+        })
+    except DeliveryBatch.DoesNotExist:
+        return Response({'error': 'Lote no encontrado'}, status=404)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reoptimize_in_progress_batch(request, batch_id):
+    try:
+        batch = DeliveryBatch.objects.get(id=batch_id, owner=request.user)
+        if batch.status != 'in_progress':
+            return Response({'error': 'Solo lotes en curso admiten re-optimización intradía'}, status=400)
+
+        # Disparo por evento (parada fallida, pedido nuevo); reemplaza la corrida anterior
+        task = reoptimize_in_progress_task.delay(str(batch.id), run_id=OptimizationRuns.start(batch.id))
+        return Response({
+            'status': batch.status,
+            'task_id': task.id,
+            'message': 'Re-optimizando las paradas pendientes...'
+        })
+    except DeliveryBatch.DoesNotExist:
+        return Response({'error': 'Lote no encontrado'}, status=404)
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def fleet_scenarios(request, batch_id):
+    try:
+        batch = DeliveryBatch.objects.get(id=batch_id, owner=request.user)
+    except DeliveryBatch.DoesNotExist:
+        return Response({'error': 'Lote no encontrado'}, status=404)
+
+    if request.method == 'GET':
+        return Response(FleetScenarios.get(batch.id) or {'status': 'none', 'scenarios': []})
+
+    # Cada escenario: {'name', 'count', 'max_stops'} o {'count', 'capacities'}
+    scenarios = request.data.get('scenarios') or []
+    try:
+        scenarios = [
+            {
+                'name': str(scenario.get('name') or ''),
+                'count': int(scenario['count']),
+                'max_stops': int(scenario['max_stops']) if scenario.get('max_stops') else None,
+                'capacities': [int(c) for c in scenario['capacities']] if scenario.get('capacities') else None,
+            }
+            for scenario in scenarios
+        ]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return Response({'error': 'Cada escenario requiere count y max_stops o capacities numéricos'}, status=400)
+
+    if not scenarios or len(scenarios) > MAX_FLEET_SCENARIOS:
+        return Response({'error': f'Se requieren entre 1 y {MAX_FLEET_SCENARIOS} escenarios'}, status=400)
+    for scenario in scenarios:
+        if scenario['count'] < 1 or (scenario['capacities'] and len(scenario['capacities']) != scenario['count']):
+            return Response({'error': 'count debe ser positivo y coincidir con capacities'}, status=400)
+        if scenario['count'] > settings.OPTIMIZATION_MAX_FLEET_VEHICLES:
+            return Response({'error': f'Máximo {settings.OPTIMIZATION_MAX_FLEET_VEHICLES} vehículos por escenario'},
+                            status=400)
+
+    # Solo compara: no se crean ni reemplazan rutas
+    task = compare_fleets_task.delay(str(batch.id), scenarios)
+    return Response({
+        'status': 'running',
+        'task_id': task.id,
+        'message': 'Comparando flotas...'
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def optimization_status(request, batch_id):
+    try:
+        batch = DeliveryBatch.objects.get(id=batch_id, owner=request.user)
+        # Curva de convergencia publicada por el solver mientras optimiza
+        return Response({
+            'status': batch.status,
+            'unassigned_deliveries': batch.unassigned_deliveries,
+            'progress': OptimizationProgress.get(batch.id),
+            # Entregas que hacen imposible el lote, si la verificación previa lo rechazó
+            'feasibility': FeasibilityReports.get(batch.id),
+        })
+    except DeliveryBatch.DoesNotExist:
+        return Response({'error': 'Lote no encontrado'}, status=404)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def preview_route(request):
+    # Ruta aproximada dentro de la misma petición, sin encolar en Celery
+    depot = request.data.get('depot') or {}
+    stops = request.data.get('stops') or []
+    try:
+        coordinates = [(float(depot['lat']), float(depot['lng']))]
+        coordinates += [(float(stop['lat']), float(stop['lng'])) for stop in stops]
+        num_vehicles = int(request.data.get('num_vehicles', 1))
+    except (KeyError, TypeError, ValueError):
+        return Response({'error': 'Se requieren coordenadas lat/lng para el depósito y cada parada'}, status=400)
+
+    if not stops:
+        return Response({'error': 'Se requiere al menos una parada'}, status=400)
+    if len(stops) > MAX_PREVIEW_STOPS:
+        return Response({'error': f'La vista previa admite hasta {MAX_PREVIEW_STOPS} paradas'}, status=400)
+    if num_vehicles < 1:
+        return Response({'error': 'Se requiere al menos un vehículo'}, status=400)
+    # Más vehículos que paradas solo agrega rutas vacías
+    max_vehicles = min(len(stops), MAX_PREVIEW_VEHICLES)
+    if num_vehicles > max_vehicles:
+        return Response({'error': f'La vista previa admite hasta {max_vehicles} vehículos para este lote'}, status=400)
+
+    result = preview_routes(coordinates, num_vehicles)
+    # Índices de parada según el orden recibido (sin depot)
+    return Response({
+        'routes': [
+            {**route, 'stops': [node - 1 for node in route['stops'][1:-1]]}
+            for route in result['routes']
+        ],
+        'unassigned': [node - 1 for node in result['unassigned']],
+        'total_distance': result['total_distance'],
+        'total_time': result['total_time'],
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def insert_batch_delivery(request, batch_id):
+    try:
+        batch = DeliveryBatch.objects.get(id=batch_id, owner=request.user)
+        if batch.status not in ('ready', 'in_progress'):
+            return Response({'error': 'Solo lotes con rutas planificadas admiten inserciones'}, status=400)
+
+        delivery = Delivery.objects.get(id=request.data.get('delivery_id'), batch=batch)
+        if not delivery.coordinates:
+            return Response({'error': 'La entrega no tiene coordenadas'}, status=400)
+        if hasattr(delivery, 'stop'):
+            return Response({'error': 'La entrega ya está en una ruta'}, status=400)
+
+        # Inserción más barata: solo cambia la ruta afectada
+        stop = insert_delivery(batch, delivery)
+        if stop is None:
+            return Response({'error': 'Ninguna ruta admite la entrega con su capacidad y horario'}, status=409)
+        return Response({
+            'route_id': str(stop.route_id),
+            'stop_id': str(stop.id),
+            'stop_order': stop.stop_order,
+        })
+    except DeliveryBatch.DoesNotExist:
+        return Response({'error': 'Lote no encontrado'}, status=404)
+    except (Delivery.DoesNotExist, ValueError, ValidationError):
+        return Response({'error': 'Entrega no encontrada'}, status=404)
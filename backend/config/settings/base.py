@@ -116,6 +116,45 @@ REST_FRAMEWORK = {
 CELERY_BROKER_URL = env('REDIS_URL', default='redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = env('REDIS_URL', default='redis://localhost:6379/0')
 
+# Caché compartida (web y workers)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': env('REDIS_CACHE_URL', default='redis://localhost:6379/1'),
+    }
+}
+
+# Optimización de rutas
+OPTIMIZATION_CACHE_MAX_ENTRIES = env.int('OPTIMIZATION_CACHE_MAX_ENTRIES', default=500)
+OPTIMIZATION_CACHE_TIMEOUT = env.int('OPTIMIZATION_CACHE_TIMEOUT', default=60 * 60 * 24)  # segundos
+# Matrices compartidas entre procesos del mismo nodo (tmpfs si está disponible)
+OPTIMIZATION_MATRIX_DIR = env('OPTIMIZATION_MATRIX_DIR', default='/dev/shm/rutas-rd-matrices')
+OPTIMIZATION_MATRIX_MAX_BYTES = env.int('OPTIMIZATION_MATRIX_MAX_BYTES', default=512 * 1024 * 1024)
+# Memoria disponible para una optimización en un worker normal y en la cola de gran memoria (MB);
+# sin cola de gran memoria los lotes que no caben se descomponen
+OPTIMIZATION_WORKER_MEMORY_MB = env.int('OPTIMIZATION_WORKER_MEMORY_MB', default=1024)
+OPTIMIZATION_BIG_MEMORY_MB = env.int('OPTIMIZATION_BIG_MEMORY_MB', default=8192)
+OPTIMIZATION_BIG_MEMORY_QUEUE = env('OPTIMIZATION_BIG_MEMORY_QUEUE', default='')
+# Instantáneas de instancias para reproducir optimizaciones (replay_snapshot)
+OPTIMIZATION_SNAPSHOT_DIR = env('OPTIMIZATION_SNAPSHOT_DIR', default=str(BASE_DIR / 'snapshots'))
+# Velocidades por tipo de vehículo, hora y zona (build_speed_table)
+OPTIMIZATION_SPEED_TABLE_PATH = env('OPTIMIZATION_SPEED_TABLE_PATH', default=str(BASE_DIR / 'data' / 'speed_table.npz'))
+# Máximo de vehículos por escenario de comparación de flotas
+OPTIMIZATION_MAX_FLEET_VEHICLES = env.int('OPTIMIZATION_MAX_FLEET_VEHICLES', default=50)
+# Re-optimización periódica de lotes en curso (segundos)
+OPTIMIZATION_ROLLING_INTERVAL = env.int('OPTIMIZATION_ROLLING_INTERVAL', default=10 * 60)
+
+CELERY_BEAT_SCHEDULE = {
+    'reoptimize-in-progress-batches': {
+        'task': 'apps.optimization.tasks.reoptimize_in_progress_batches',
+        'schedule': OPTIMIZATION_ROLLING_INTERVAL,
+    },
+    'build-speed-table': {
+        'task': 'apps.optimization.tasks.build_speed_table_task',
+        'schedule': 24 * 60 * 60,
+    },
+}
+
 # APIs de mapas
 GOOGLE_MAPS_API_KEY = env('GOOGLE_MAPS_API_KEY', default='')
 OPENSTREETMAP_API_URL = 'https://nominatim.openstreetmap.org'
@@ -0,0 +1,62 @@
+import os
+from unittest.mock import patch
+from django.core.management import call_command
+from django.test import TestCase
+import numpy as np
+from apps.optimization.benchmarks import (
+    synthetic_instance, check_regressions, measure_startup, run_case, REGION_DEPOTS,
+)
+
+class BenchmarkSuiteTestCase(TestCase):
+
+    def test_synthetic_instance_is_reproducible(self):
+        """Test instancias sintéticas con la misma semilla son idénticas"""
+        lats, lngs = synthetic_instance(500, seed=3)
+        again_lats, again_lngs = synthetic_instance(500, seed=3)
+
+        np.testing.assert_array_equal(lats, again_lats)
+        np.testing.assert_array_equal(lngs, again_lngs)
+        self.assertEqual((lats[0], lngs[0]), REGION_DEPOTS['santo_domingo'])
+        # Paradas dentro de Gran Santo Domingo
+        self.assertTrue(((lats[1:] > 18.3) & (lats[1:] < 18.7)).mean() > 0.99)
+        self.assertFalse(np.array_equal(lats, synthetic_instance(500, seed=4)[0]))
+
+    def test_run_case_records_metrics(self):
+        """Test un caso registra todas las métricas del suite"""
+        case = run_case(10, preset='fast')
+
+        for metric in ('matrix_seconds', 'solve_seconds', 'objective', 'routes_used', 'peak_rss_mb'):
+            self.assertIn(metric, case)
+        self.assertEqual(case['engine'], 'route_optimizer')
+        self.assertGreaterEqual(case['routes_used'], 1)
+
+    def test_check_regressions(self):
+        """Test detección de regresiones contra una corrida base"""
+        baseline = {'cases': [{'num_stops': 50, 'region': 'santo_domingo', 'solve_seconds': 2.0,
+                               'objective': 1000, 'peak_rss_mb': 100, 'matrix_seconds': 0.01}]}
+        same = {'cases': [dict(baseline['cases'][0], solve_seconds=2.2)]}
+        slower = {'cases': [dict(baseline['cases'][0], solve_seconds=3.0, objective=1100)]}
+
+        self.assertEqual(check_regressions(same, baseline), [])
+        regressions = check_regressions(slower, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(any('solve_seconds' in message for message in regressions))
+
+    def test_web_workers_do_not_load_solver(self):
+        """Test importar la API no carga OR-Tools; solo los workers lo cargan"""
+        stats = measure_startup(repeat=1)
+
+        self.assertFalse(stats['solver_loaded_by_web'])
+        self.assertGreaterEqual(stats['worker_rss_mb'], stats['web_rss_mb'])
+
+    @patch('apps.core.management.commands.benchmark_optimizer.compare_evaluators')
+    def test_legacy_flags_run_evaluators(self, mock_compare):
+        """Test los flags sin subcomando siguen comparando evaluadores"""
+        mock_compare.return_value = {
+            mode: {'accepted_neighbors': 1, 'branches': 1, 'objective': 1} for mode in ('callback', 'matrix')
+        }
+        mock_compare.return_value['speedup'] = 1.0
+        call_command('benchmark_optimizer', '--sizes', '10,20', '--time-limit', '1', stdout=open(os.devnull, 'w'))
+
+        self.assertEqual([call.args[0] for call in mock_compare.call_args_list], [10, 20])
+        self.assertEqual(mock_compare.call_args.kwargs, {'num_vehicles': 4, 'time_limit': 1, 'seed': 0})
@@ -0,0 +1,100 @@
+from django.test import TestCase
+from unittest.mock import patch
+import numpy as np
+from apps.optimization.benchmarks import random_coordinates
+from apps.optimization.services.candidate_graph import CandidateGraph, CANDIDATE_FIRST_SOLUTION
+from apps.optimization.services.route_optimizer import RouteOptimizer, build_time_matrix
+
+class CandidateGraphTestCase(TestCase):
+
+    def setUp(self):
+        self.lats, self.lngs = random_coordinates(300, seed=11)
+        self.graph = CandidateGraph(self.lats, self.lngs, k=15)
+
+    def test_grid_nearest_matches_brute_force(self):
+        """Test vecinos de la cuadrícula coinciden con búsqueda exhaustiva"""
+        xy = self.graph.index.xy
+        dist = np.hypot(*(xy[:, None, :] - xy[None, :, :]).transpose(2, 0, 1))
+        np.fill_diagonal(dist, np.inf)
+        expected = np.argsort(dist, axis=1)[:, :15]
+
+        self.assertEqual(self.graph.neighbors.shape, (301, 15))
+        for row, expected_row in zip(self.graph.neighbors, expected):
+            self.assertEqual(set(row.tolist()), set(expected_row.tolist()))
+
+    def test_graph_memory_is_linear(self):
+        """Test memoria del grafo es O(nk)"""
+        self.assertEqual(self.graph.nbytes, 301 * 15 * 4 * 2)
+
+    @patch('apps.optimization.services.candidate_graph.DistanceMatrixService.get_distance_matrix')
+    def test_road_costs_only_for_candidate_arcs(self, mock_matrix):
+        """Test solo se piden costos de ruta para los arcos candidatos"""
+        def fake_matrix(origins, destinations):
+            for points in (origins, destinations):
+                self.assertLessEqual(len(points), 100)
+            return {'distances': [[1234] * len(destinations) for _ in origins]}
+
+        mock_matrix.side_effect = fake_matrix
+        requested = self.graph.fetch_road_costs()
+
+        self.assertLess(requested, 301 * 301 / 2)
+        self.assertTrue((self.graph.costs == 1234).all())
+
+    def test_forbidden_arcs_optimization(self):
+        """Test optimización con arcos no candidatos prohibidos"""
+        matrix = self.graph.to_dense()
+        successors = self.graph.allowed_successors()
+        self.assertIn(0, successors[5])
+        for node in successors[7]:
+            if node != 0:  # el sucesor del depot no se restringe
+                self.assertIn(7, successors[node])
+
+        optimizer = RouteOptimizer(matrix, build_time_matrix(matrix))
+        result = optimizer.optimize(
+            num_vehicles=4,
+            vehicle_capacities=[300] * 4,
+            time_limit=1,
+            first_solution_strategy=CANDIDATE_FIRST_SOLUTION,
+            candidate_arcs=successors,
+        )
+
+        self.assertIsNotNone(result)
+        self.assertTrue(optimizer.search_stats['restricted_arcs'])
+        stops = sorted(node for route in result['routes'] for node in route['stops'][1:-1])
+        self.assertEqual(stops, list(range(1, 301)))
+        for route in result['routes']:
+            for from_node, to_node in zip(route['stops'][1:-2], route['stops'][2:-1]):
+                self.assertIn(to_node, successors[from_node])
+
+    def test_forbidden_arcs_fallback(self):
+        """Test sin solución con arcos candidatos se reintenta sin restricción"""
+        matrix = self.graph.to_dense()
+        optimizer = RouteOptimizer(matrix, build_time_matrix(matrix))
+        result = optimizer.optimize(
+            num_vehicles=10,
+            vehicle_capacities=[40] * 10,
+            time_limit=1,
+            candidate_arcs=self.graph.allowed_successors(),
+        )
+
+        self.assertIsNotNone(result)
+        self.assertFalse(optimizer.search_stats['restricted_arcs'])
+
+    def test_forbidden_arcs_with_drop_penalty(self):
+        """Test con arcos candidatos las entregas descartables siguen pudiendo descartarse"""
+        matrix = self.graph.to_dense()
+        time_windows = [None] * 301
+        time_windows[9] = (0, 1)  # imposible de alcanzar a tiempo
+        optimizer = RouteOptimizer(matrix, build_time_matrix(matrix))
+        result = optimizer.optimize(
+            num_vehicles=4,
+            time_windows=time_windows,
+            time_limit=1,
+            first_solution_strategy=CANDIDATE_FIRST_SOLUTION,
+            candidate_arcs=self.graph.allowed_successors(),
+            drop_penalty=1_000_000,
+        )
+
+        self.assertIsNotNone(result)
+        self.assertTrue(optimizer.search_stats['restricted_arcs'])
+        self.assertIn(9, result['unassigned'])
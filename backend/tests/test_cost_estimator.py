@@ -0,0 +1,153 @@
+import os
+import tempfile
+import time
+from datetime import date
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+import numpy as np
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Delivery
+from apps.optimization.tasks import optimize_batch_task
+from apps.optimization.services.decomposition import DecompositionOptimizer
+from apps.optimization.services.cost_estimator import (
+    MEMORY_NOISE_FLOOR_MB,
+    CostModel,
+    PeakMemorySampler,
+    base_estimate,
+    current_rss_mb,
+    fits_in_worker,
+    plan_execution,
+)
+
+User = get_user_model()
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM, OPTIMIZATION_WORKER_MEMORY_MB=1024, OPTIMIZATION_BIG_MEMORY_MB=8192)
+class CostEstimatorTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_memory_grows_with_matrix_cells(self):
+        """Test la memoria estimada crece con n² y 8000 paradas no caben en un worker normal"""
+        small, large = base_estimate(1000, 10), base_estimate(8000, 10)
+        self.assertLess(small['memory_mb'], 1024)
+        self.assertGreater(large['memory_mb'], 2 * 1024)
+        self.assertGreater(large['seconds'], small['seconds'])
+
+    def test_measurements_refine_estimates(self):
+        """Test las mediciones corrigen las estimaciones siguientes"""
+        before = CostModel.estimate(2000, 10, 'fast')
+        for _ in range(10):
+            CostModel.record(2000, 10, 'fast', before['memory_mb'] * 2, before['seconds'])
+
+        after = CostModel.estimate(2000, 10, 'fast')
+        self.assertGreater(after['memory_mb'], before['memory_mb'] * 1.8)
+        self.assertAlmostEqual(after['seconds'], before['seconds'], delta=0.2)
+
+    def test_plan_routes_oversized_jobs(self):
+        """Test los lotes grandes van a la cola de gran memoria o a la descomposición"""
+        self.assertEqual(plan_execution(500, 2), {**plan_execution(500, 2), 'queue': None, 'decompose': False})
+        with self.settings(OPTIMIZATION_BIG_MEMORY_QUEUE='optimization-large'):
+            self.assertEqual(plan_execution(8000, 2)['queue'], 'optimization-large')
+            self.assertTrue(plan_execution(20000, 2)['decompose'])
+        with self.settings(OPTIMIZATION_BIG_MEMORY_QUEUE=''):
+            plan = plan_execution(8000, 2)
+            self.assertEqual((plan['queue'], plan['decompose']), (None, True))
+
+    def test_sampler_measures_peak(self):
+        """Test el muestreo registra el pico de RSS aunque la memoria ya se haya liberado"""
+        with PeakMemorySampler(interval=0.01) as sampler:
+            block = np.ones(64 * 2 ** 20, dtype=np.uint8)
+            time.sleep(0.05)  # varios intervalos de muestreo con el bloque reservado
+            del block
+        self.assertGreater(sampler.peak_mb - sampler.baseline_mb, 40)
+        self.assertGreater(sampler.seconds, 0)
+
+    def test_sampler_reports_absolute_peak(self):
+        """Test el pico es el RSS absoluto aunque el worker ya tenga la memoria reservada"""
+        block = np.ones(64 * 2 ** 20, dtype=np.uint8)
+        with PeakMemorySampler(interval=0.01) as sampler:
+            block[:] = 2  # reutiliza memoria ya reservada: la diferencia con el inicio es casi nula
+        self.assertGreaterEqual(sampler.peak_mb, sampler.baseline_mb)
+        self.assertGreater(sampler.peak_mb, 64)
+        del block
+
+    def test_small_runs_do_not_drag_the_factor(self):
+        """Test las mediciones por debajo del umbral de ruido no corrigen la memoria"""
+        before = CostModel.estimate(2000, 10, 'fast')
+        for _ in range(10):
+            CostModel.record(2000, 10, 'fast', MEMORY_NOISE_FLOOR_MB / 4, before['seconds'])
+            CostModel.record(10, 2, 'fast', current_rss_mb(), before['seconds'])
+        self.assertEqual(CostModel.estimate(2000, 10, 'fast')['memory_mb'], before['memory_mb'])
+
+    def test_fits_in_worker_uses_setting(self):
+        """Test sin memory_mb el límite es OPTIMIZATION_WORKER_MEMORY_MB"""
+        self.assertTrue(fits_in_worker(1000, 10))
+        with self.settings(OPTIMIZATION_WORKER_MEMORY_MB=1):
+            self.assertFalse(fits_in_worker(1000, 10))
+
+
+@override_settings(
+    CACHES=LOCMEM,
+    OPTIMIZATION_MATRIX_DIR=os.path.join(tempfile.gettempdir(), 'test-optimization-matrices'),
+)
+class MemoryGuardrailTaskTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        Vehicle.objects.create(owner=self.user, name='Moto 1', vehicle_type='motorcycle')
+        Driver.objects.create(owner=self.user, name='Juan', phone='8090000000')
+        customer = Customer.objects.create(owner=self.user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(owner=self.user, name='Lote Test', delivery_date=date.today(),
+                                                  depot_address='Almacén',
+                                                  depot_coordinates={'lat': 18.4861, 'lng': -69.9312})
+        for lat, lng in [(18.45, -69.90), (18.50, -69.88), (18.47, -69.95)]:
+            Delivery.objects.create(batch=self.batch, customer=customer, address='Calle Test',
+                                    coordinates={'lat': lat, 'lng': lng})
+
+    def test_full_solve_records_measurements(self):
+        """Test una corrida completa alimenta el modelo de costos"""
+        with patch('apps.optimization.tasks.CostModel.record') as record:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+        record.assert_called_once()
+        self.assertEqual(record.call_args.args[:3], (4, 2, 'fast'))
+
+    @override_settings(OPTIMIZATION_WORKER_MEMORY_MB=1)
+    def test_oversized_job_is_decomposed_instead_of_crashing(self):
+        """Test si la matriz no cabe en el worker la tarea descompone el lote"""
+        with patch('apps.optimization.tasks.DecompositionOptimizer', wraps=DecompositionOptimizer) as decomposition:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast', incremental=True))
+
+        decomposition.assert_called_once()
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'ready')
+
+    @override_settings(OPTIMIZATION_WORKER_MEMORY_MB=1, OPTIMIZATION_BIG_MEMORY_MB=8192,
+                       OPTIMIZATION_BIG_MEMORY_QUEUE='optimization-large')
+    def test_endpoint_sends_oversized_job_to_big_memory_queue(self):
+        """Test la API encola en la cola de gran memoria los lotes que no caben"""
+        self.client.force_login(self.user)
+        with patch('apps.optimization.views.optimize_batch_task.apply_async') as apply_async:
+            apply_async.return_value.id = 'task-id'
+            response = self.client.post(f'/api/delivery-batches/{self.batch.id}/optimize/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(apply_async.call_args.kwargs['queue'], 'optimization-large')
+        self.assertFalse(apply_async.call_args.kwargs['kwargs']['decompose'])
+        self.assertEqual(apply_async.call_args.kwargs['kwargs']['memory_mb'], 8192)
+        self.assertEqual(response.json()['execution']['queue'], 'optimization-large')
+
+    @override_settings(OPTIMIZATION_WORKER_MEMORY_MB=1)
+    def test_big_memory_job_is_solved_whole(self):
+        """Test en la cola de gran memoria la tarea usa el límite de esa cola y no descompone"""
+        with patch('apps.optimization.tasks.DecompositionOptimizer') as decomposition:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast', memory_mb=8192))
+
+        decomposition.assert_not_called()
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'ready')
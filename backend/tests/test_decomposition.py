@@ -0,0 +1,101 @@
+from django.test import TestCase
+import numpy as np
+from apps.optimization.benchmarks import random_coordinates
+from apps.optimization.services.decomposition import DecompositionOptimizer, partition_deliveries
+from apps.optimization.services.route_optimizer import build_distance_matrix
+from apps.optimization.services.speed_model import SpeedTable, build_vehicle_time_matrix
+
+class DecompositionTestCase(TestCase):
+
+    def setUp(self):
+        self.lats, self.lngs = random_coordinates(60, seed=7)
+
+    def test_partition_respects_capacity_and_covers_all(self):
+        """Test partición cubre todas las entregas sin exceder capacidad"""
+        capacities = [10] * 8
+        clusters = partition_deliveries(self.lats, self.lngs, capacities, max_cluster_size=20)
+
+        nodes = sorted(node for cluster in clusters for node in cluster['nodes'])
+        self.assertEqual(nodes, list(range(1, 61)))
+        self.assertEqual(len(clusters), 3)
+        for cluster in clusters:
+            self.assertLessEqual(len(cluster['nodes']), sum(capacities[v] for v in cluster['vehicles']))
+
+    def test_decomposed_optimization(self):
+        """Test optimización por grupos produce una solución completa"""
+        optimizer = DecompositionOptimizer(self.lats, self.lngs, max_cluster_size=20, processes=2)
+        result = optimizer.optimize(num_vehicles=6, vehicle_capacities=[12] * 6, preset='fast')
+
+        self.assertIsNotNone(result)
+        self.assertEqual(set(result.keys()), {'routes', 'total_distance', 'total_time', 'objective_value'})
+        stops = sorted(node for route in result['routes'] for node in route['stops'][1:-1])
+        self.assertEqual(stops, list(range(1, 61)))
+        for route in result['routes']:
+            self.assertEqual(route['stops'][0], 0)
+            self.assertEqual(route['stops'][-1], 0)
+            self.assertLessEqual(len(route['stops']) - 2, 12)
+        self.assertEqual(len({route['vehicle_id'] for route in result['routes']}), len(result['routes']))
+
+    def test_insufficient_fleet(self):
+        """Test flota insuficiente devuelve None"""
+        optimizer = DecompositionOptimizer(self.lats, self.lngs, max_cluster_size=20, processes=1)
+        self.assertIsNone(optimizer.optimize(num_vehicles=2, vehicle_capacities=[10, 10], repair=False))
+
+    def test_more_clusters_than_vehicles(self):
+        """Test con flota pequeña el tamaño de grupo se respeta y los vehículos hacen varios viajes"""
+        capacities = [40, 35]
+        clusters = partition_deliveries(self.lats, self.lngs, capacities, max_cluster_size=15)
+
+        self.assertEqual(len(clusters), 4)
+        self.assertEqual([cluster['vehicles'] for cluster in clusters], [[0], [1], [0], [1]])
+        for cluster in clusters:
+            self.assertLessEqual(len(cluster['nodes']), 15)
+            self.assertLessEqual(len(cluster['nodes']), sum(cluster['capacities']))
+        # La capacidad de cada vehículo se reparte entre sus viajes
+        self.assertEqual([cluster['capacities'][0] for cluster in clusters], [20, 18, 20, 17])
+
+    def test_trips_of_a_vehicle_do_not_overlap(self):
+        """Test con más grupos que vehículos cada viaje sale cuando regresa el anterior"""
+        lats, lngs = random_coordinates(60, seed=7, spread_km=2)
+        optimizer = DecompositionOptimizer(lats, lngs, max_cluster_size=15, processes=1)
+        result = optimizer.optimize(num_vehicles=2, preset='fast', departure=480)
+
+        self.assertIsNotNone(result)
+        for vehicle_id in (0, 1):
+            trips = sorted((route['arrivals'] for route in result['routes'] if route['vehicle_id'] == vehicle_id),
+                           key=lambda arrivals: arrivals[0])
+            self.assertEqual(len(trips), 2)
+            self.assertEqual(trips[0][0], 480)
+            self.assertEqual(trips[1][0], trips[0][-1])
+
+    def test_decomposition_keeps_time_windows(self):
+        """Test cada sub-problema recibe las ventanas de sus nodos"""
+        time_windows = [None] * 61
+        for node in (5, 25, 45):
+            time_windows[node] = (600, 660)
+        # Zona compacta: cada viaje de 20 paradas cabe en el horizonte de un día
+        lats, lngs = random_coordinates(60, seed=7, spread_km=2)
+        optimizer = DecompositionOptimizer(lats, lngs, max_cluster_size=20, processes=1)
+        result = optimizer.optimize(num_vehicles=2, time_windows=time_windows, preset='fast', repair=False)
+
+        self.assertIsNotNone(result)
+        stops = sorted(node for route in result['routes'] for node in route['stops'][1:-1])
+        self.assertEqual(stops, list(range(1, 61)))
+        self.assertTrue({route['vehicle_id'] for route in result['routes']} <= {0, 1})
+        for route in result['routes']:
+            for node, arrival in zip(route['stops'], route['arrivals']):
+                if time_windows[node]:
+                    self.assertTrue(600 <= arrival <= 660)
+
+    def test_sub_problems_use_speed_table(self):
+        """Test los sub-problemas toman los tiempos de la tabla de velocidades"""
+        lats, lngs = random_coordinates(30, seed=7, spread_km=2)
+        table = SpeedTable(['car'], [], np.zeros((1, 24, 0)), np.full((1, 24), np.nan), [25.0], 25.0)
+        optimizer = DecompositionOptimizer(lats, lngs, max_cluster_size=15, processes=1, speed_table=table,
+                                           vehicle_type='car')
+        result = optimizer.optimize(num_vehicles=2, preset='fast', departure=480)
+
+        time_matrix = build_vehicle_time_matrix(build_distance_matrix(lats, lngs), lats, lngs, 'car', 8, table)
+        for route in result['routes']:
+            stops = route['stops']
+            self.assertEqual(route['arrivals'], [480] + list(480 + np.cumsum(time_matrix[stops[:-1], stops[1:]])))
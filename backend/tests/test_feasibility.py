@@ -0,0 +1,145 @@
+import os
+import tempfile
+import time as clock
+from datetime import date, time
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+import numpy as np
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Delivery, Stop
+from apps.optimization.tasks import optimize_batch_task
+from apps.optimization.benchmarks import synthetic_instance
+from apps.optimization.services.route_optimizer import RouteOptimizer, build_distance_matrix, build_time_matrix
+from apps.optimization.services.feasibility import (
+    check_feasibility,
+    min_arrival_times,
+    travel_times_from_coordinates,
+)
+
+User = get_user_model()
+
+
+class FeasibilityCheckTestCase(TestCase):
+
+    def setUp(self):
+        lats, lngs = synthetic_instance(30, seed=2)
+        self.lats, self.lngs = lats, lngs
+        self.time_matrix = build_time_matrix(build_distance_matrix(lats, lngs))
+        self.depot_times = self.time_matrix[0]
+        self.arrival_times = min_arrival_times(self.time_matrix)
+
+    def test_feasible_instance_passes(self):
+        """Test una instancia sin restricciones imposibles pasa la verificación"""
+        report = check_feasibility(self.depot_times, self.arrival_times, num_vehicles=3,
+                                   vehicle_capacities=[15, 15, 15])
+        self.assertTrue(report['feasible'])
+
+    def test_unreachable_and_capacity(self):
+        """Test paradas inalcanzables antes de su latest_time y flota insuficiente"""
+        far = int(np.argmax(self.depot_times))
+        windows = [None] * 31
+        windows[far] = (0, int(self.depot_times[far]) - 1)
+        report = check_feasibility(self.depot_times, self.arrival_times, windows, num_vehicles=2,
+                                   vehicle_capacities=[10, 10])
+
+        self.assertFalse(report['feasible'])
+        self.assertEqual(report['unreachable'], [far])
+        self.assertEqual(report['capacity_shortfall'], 10)
+
+    def test_window_overlap_exceeds_fleet(self):
+        """Test demasiadas paradas en una ventana estrecha para la flota"""
+        windows = [None] + [(600, 600 + int(self.arrival_times[1:].min()))] * 30
+        report = check_feasibility(self.depot_times, self.arrival_times, windows, num_vehicles=2)
+
+        self.assertFalse(report['feasible'])
+        conflict = report['window_conflicts'][0]
+        self.assertEqual(len(conflict['nodes']), 30)
+        self.assertLess(conflict['max_servable'], 30)
+
+        # Con una ventana amplia las mismas paradas caben
+        windows = [None] + [(0, 1440)] * 30
+        self.assertTrue(check_feasibility(self.depot_times, self.arrival_times, windows, num_vehicles=2)['feasible'])
+
+    def test_coordinate_bounds_match_matrix(self):
+        """Test las cotas sin matriz coinciden con las de la matriz completa"""
+        depot_times, arrival_times = travel_times_from_coordinates(self.lats, self.lngs)
+
+        np.testing.assert_array_equal(depot_times, self.depot_times)
+        np.testing.assert_array_equal(arrival_times, self.arrival_times)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OPTIMIZATION_MATRIX_DIR=os.path.join(tempfile.gettempdir(), 'test-optimization-matrices'),
+)
+class PrecheckTaskTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        Vehicle.objects.create(owner=self.user, name='Moto 1', vehicle_type='motorcycle')
+        Driver.objects.create(owner=self.user, name='Juan', phone='8090000000')
+        customer = Customer.objects.create(owner=self.user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(
+            owner=self.user,
+            name='Lote Test',
+            delivery_date=date.today(),
+            depot_address='Almacén',
+            depot_coordinates={'lat': 18.4861, 'lng': -69.9312}
+        )
+        Delivery.objects.create(batch=self.batch, customer=customer, address='Calle Test',
+                                coordinates={'lat': 18.45, 'lng': -69.90})
+        # ~5 km del depósito: imposible llegar antes de medianoche y cinco minutos
+        self.late = Delivery.objects.create(batch=self.batch, customer=customer, address='Calle Test',
+                                            coordinates={'lat': 18.50, 'lng': -69.88}, latest_time=time(0, 5))
+
+    def test_impossible_batch_fails_without_solving(self):
+        """Test un lote imposible falla sin lanzar el solver y explica por qué"""
+        started = clock.perf_counter()
+        with patch.object(RouteOptimizer, 'optimize') as mock_optimize:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+            mock_optimize.assert_not_called()
+        self.assertLess(clock.perf_counter() - started, 1)
+
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'failed')
+        self.client.force_login(self.user)
+        data = self.client.get(f'/api/delivery-batches/{self.batch.id}/optimization/').json()
+        self.assertEqual(data['feasibility']['unreachable'], [str(self.late.id)])
+
+    def test_reachability_measured_from_departure(self):
+        """Test una ventana que cierra justo después de la salida de la flota es inalcanzable"""
+        Delivery.objects.filter(id=self.late.id).update(latest_time=time(8, 5))
+        with patch.object(RouteOptimizer, 'optimize') as mock_optimize:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+            mock_optimize.assert_not_called()
+
+        self.client.force_login(self.user)
+        data = self.client.get(f'/api/delivery-batches/{self.batch.id}/optimization/').json()
+        self.assertEqual(data['feasibility']['unreachable'], [str(self.late.id)])
+
+    def test_batch_over_fleet_capacity_fails_without_solving(self):
+        """Test un lote con más entregas que paradas admite la flota se rechaza sin resolver"""
+        Delivery.objects.filter(id=self.late.id).update(latest_time=None)
+        Delivery.objects.create(batch=self.batch, customer=self.late.customer, address='Calle Test',
+                                coordinates={'lat': 18.47, 'lng': -69.95})
+        Vehicle.objects.filter(owner=self.user).update(max_stops=1)
+        with patch.object(RouteOptimizer, 'optimize') as mock_optimize:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+            mock_optimize.assert_not_called()
+
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'failed')
+        self.client.force_login(self.user)
+        data = self.client.get(f'/api/delivery-batches/{self.batch.id}/optimization/').json()
+        self.assertEqual(data['feasibility']['capacity_shortfall'], 1)
+
+    def test_partial_mode_dispatches_remaining_deliveries(self):
+        """Test en modo parcial el lote queda listo y registra las entregas sin asignar"""
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast', partial=True))
+
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'ready')
+        self.assertEqual(self.batch.unassigned_deliveries, [str(self.late.id)])
+        self.assertEqual(Stop.objects.filter(route__batch=self.batch).count(), 1)
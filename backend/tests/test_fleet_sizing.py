@@ -0,0 +1,127 @@
+import os
+import tempfile
+from datetime import date
+from unittest.mock import patch
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from apps.core.models import Customer, DeliveryBatch, Delivery
+from apps.optimization.tasks import compare_fleets_task
+from apps.optimization.services.fleet_sizing import FleetScenarios, compare_fleets, scenario_capacities
+from apps.optimization.services.instance import ProblemInstance
+from apps.optimization.services.route_optimizer import build_distance_matrix, build_time_matrix
+
+User = get_user_model()
+
+COORDINATES = [(18.4861, -69.9312), (18.45, -69.90), (18.50, -69.88), (18.47, -69.95), (18.52, -69.93)]
+
+
+class CompareFleetsTestCase(TestCase):
+
+    def setUp(self):
+        lats, lngs = zip(*COORDINATES)
+        self.distance_matrix = build_distance_matrix(lats, lngs)
+        self.time_matrix = build_time_matrix(self.distance_matrix)
+
+    def test_scenario_capacities(self):
+        """Test las capacidades por vehículo tienen prioridad sobre max_stops"""
+        self.assertEqual(scenario_capacities({'count': 3, 'max_stops': 10}), [10, 10, 10])
+        self.assertEqual(scenario_capacities({'count': 2, 'max_stops': 10, 'capacities': [5, 20]}), [5, 20])
+        self.assertIsNone(scenario_capacities({'count': 2}))
+
+    def test_compares_fleets_in_parallel(self):
+        """Test cada flota obtiene su fila y las entregas que no caben quedan sin asignar"""
+        rows = compare_fleets(self.distance_matrix, self.time_matrix, [
+            {'name': '2 motos', 'count': 2, 'max_stops': 2},
+            {'count': 1, 'max_stops': 3},
+        ], processes=2)
+
+        self.assertEqual([row['name'] for row in rows], ['2 motos', 'Flota 2'])
+        self.assertEqual(rows[0]['unassigned'], [])
+        self.assertEqual(len(rows[1]['unassigned']), 1)
+        for row in rows:
+            self.assertGreater(row['total_distance'], 0)
+            self.assertLessEqual(row['longest_route_time'], row['total_time'])
+
+    def test_fleets_leave_at_departure(self):
+        """Test las flotas salen a la hora de salida: una ventana que cierra antes queda sin asignar"""
+        time_windows = [(0, 1440)] * len(COORDINATES)
+        time_windows[1] = (0, 400)
+        scenarios = [{'count': 1, 'max_stops': 10}]
+
+        early = compare_fleets(self.distance_matrix, self.time_matrix, scenarios, time_windows=time_windows,
+                               processes=1)
+        late = compare_fleets(self.distance_matrix, self.time_matrix, scenarios, time_windows=time_windows,
+                              processes=1, departure=480)
+        self.assertEqual(early[0]['unassigned'], [])
+        self.assertEqual(late[0]['unassigned'], [1])
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OPTIMIZATION_MATRIX_DIR=os.path.join(tempfile.gettempdir(), 'test-optimization-matrices'),
+)
+class FleetScenariosTaskTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        customer = Customer.objects.create(owner=self.user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(
+            owner=self.user,
+            name='Lote Test',
+            delivery_date=date.today(),
+            depot_address='Almacén',
+            depot_coordinates={'lat': COORDINATES[0][0], 'lng': COORDINATES[0][1]},
+        )
+        self.deliveries = [
+            Delivery.objects.create(batch=self.batch, customer=customer, address='Calle Test',
+                                    coordinates={'lat': lat, 'lng': lng})
+            for lat, lng in COORDINATES[1:]
+        ]
+
+    def test_task_publishes_comparison_without_routes(self):
+        """Test la comparación se publica con IDs de entrega y no crea rutas"""
+        self.assertTrue(compare_fleets_task(str(self.batch.id), [
+            {'name': 'Camioneta', 'count': 1, 'max_stops': 4},
+            {'name': 'Moto', 'count': 1, 'max_stops': 3},
+        ]))
+
+        comparison = FleetScenarios.get(self.batch.id)
+        self.assertEqual(comparison['status'], 'done')
+        self.assertEqual(comparison['scenarios'][0]['unassigned'], [])
+        delivery_ids = {str(delivery.id) for delivery in self.deliveries}
+        self.assertTrue(set(comparison['scenarios'][1]['unassigned']) <= delivery_ids)
+        self.assertEqual(len(comparison['scenarios'][1]['unassigned']), 1)
+        self.assertFalse(self.batch.routes.exists())
+
+    def test_task_passes_departure(self):
+        """Test la comparación usa la misma hora de salida que la optimización"""
+        with patch('apps.optimization.tasks.compare_fleets', return_value=[]) as compare:
+            self.assertTrue(compare_fleets_task(str(self.batch.id), [{'count': 1, 'max_stops': 4}]))
+        self.assertEqual(compare.call_args.kwargs['departure'], ProblemInstance.from_batch(self.batch).departure)
+
+    def test_endpoint_validates_scenarios(self):
+        """Test la API rechaza escenarios inválidos"""
+        self.client.force_login(self.user)
+        url = f'/api/delivery-batches/{self.batch.id}/fleet-scenarios/'
+
+        self.assertEqual(self.client.get(url).json()['status'], 'none')
+        for scenarios in ([], [{'count': 0, 'max_stops': 5}], [{'count': 2, 'capacities': [5]}], [{'max_stops': 5}]):
+            response = self.client.post(url, {'scenarios': scenarios}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(OPTIMIZATION_MAX_FLEET_VEHICLES=10)
+    def test_endpoint_limits_fleet_size(self):
+        """Test la API rechaza escenarios con más vehículos que el máximo"""
+        self.client.force_login(self.user)
+        url = f'/api/delivery-batches/{self.batch.id}/fleet-scenarios/'
+        with patch('apps.optimization.views.compare_fleets_task.delay') as delay:
+            response = self.client.post(url, {'scenarios': [{'count': 11, 'max_stops': 5}]},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            delay.return_value.id = 'task-id'
+            response = self.client.post(url, {'scenarios': [{'count': 10, 'max_stops': 5}]},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        delay.assert_called_once()
@@ -0,0 +1,160 @@
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from unittest.mock import patch
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+import numpy as np
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Delivery, Route, Stop
+from apps.optimization.services.insertion import find_cheapest_insertion, forward_schedule, insert_delivery
+from apps.optimization.services.speed_model import SpeedTable
+
+User = get_user_model()
+
+DEPOT = (18.4861, -69.9312)
+
+
+class CheapestInsertionTestCase(TestCase):
+
+    def setUp(self):
+        # Ruta en lazo: al norte del depósito hacia el este y regreso en diagonal
+        self.route = {
+            'coordinates': [(18.50, -69.92), (18.50, -69.90), (18.50, -69.88)],
+            'windows': [(0, 1440)] * 3,
+            'capacity': 10,
+        }
+
+    def test_inserts_between_closest_stops(self):
+        """Test la parada nueva se inserta entre sus vecinas en la ruta"""
+        best = find_cheapest_insertion(DEPOT, [self.route], (18.5001, -69.89))
+
+        self.assertEqual((best['route_index'], best['position']), (0, 2))
+        self.assertLess(best['cost'], 100)
+
+    def test_respects_capacity(self):
+        """Test rutas llenas no reciben la parada"""
+        full = dict(self.route, capacity=3)
+        other = {'coordinates': [(18.40, -69.99)], 'windows': [(0, 1440)], 'capacity': 10}
+        best = find_cheapest_insertion(DEPOT, [full, other], (18.5001, -69.89))
+
+        self.assertEqual(best['route_index'], 1)
+        self.assertIsNone(find_cheapest_insertion(DEPOT, [full], (18.5001, -69.89)))
+
+    def test_respects_time_windows(self):
+        """Test la inserción no retrasa paradas con ventana ajustada"""
+        # Salida 8:00: la última parada se alcanza a las 10:02 y cierra a las 10:04;
+        # desviarse antes de ella la retrasa 4 minutos
+        tight = dict(self.route, windows=[(0, 1440), (0, 1440), (0, 604)])
+        cheapest = find_cheapest_insertion(DEPOT, [self.route], (18.505, -69.89))
+        best = find_cheapest_insertion(DEPOT, [tight], (18.505, -69.89))
+
+        self.assertEqual(cheapest['position'], 2)
+        self.assertEqual(best['position'], 3)
+        # La ventana de la parada nueva también se respeta
+        self.assertIsNone(find_cheapest_insertion(DEPOT, [self.route], (18.505, -69.89), window=(0, 8 * 60)))
+
+    def test_uses_speed_table(self):
+        """Test con tabla de velocidades los tiempos salen de ella y no de la velocidad fija"""
+        route = dict(self.route, vehicle_type='motorcycle')
+        self.assertIsNotNone(find_cheapest_insertion(DEPOT, [route], (18.505, -69.89), window=(0, 600)))
+
+        # A la mitad de la velocidad fija la parada nueva ya no se alcanza antes de las 10:00
+        slow = SpeedTable(['motorcycle'], [], np.zeros((1, 24, 0)), np.full((1, 24), np.nan), [25.0], 25.0)
+        self.assertIsNone(find_cheapest_insertion(DEPOT, [route], (18.505, -69.89), window=(0, 600),
+                                                  speed_table=slow))
+        arrivals = forward_schedule(DEPOT, 480, self.route['coordinates'], self.route['windows'],
+                                    speed_table=slow, vehicle_type='motorcycle', hour=8)
+        fixed = forward_schedule(DEPOT, 480, self.route['coordinates'], self.route['windows'])
+        self.assertGreater(arrivals[-1] - 480, 1.9 * (fixed[-1] - 480))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OPTIMIZATION_MATRIX_DIR=os.path.join(tempfile.gettempdir(), 'test-optimization-matrices'),
+)
+class InsertDeliveryEndpointTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        vehicle = Vehicle.objects.create(owner=self.user, name='Moto 1', vehicle_type='motorcycle')
+        driver = Driver.objects.create(owner=self.user, name='Juan', phone='8090000000')
+        self.customer = Customer.objects.create(owner=self.user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(
+            owner=self.user,
+            name='Lote Test',
+            delivery_date=date.today(),
+            depot_address='Almacén',
+            depot_coordinates={'lat': DEPOT[0], 'lng': DEPOT[1]},
+            status='ready',
+            total_distance_km=10,
+        )
+        self.east = Route.objects.create(batch=self.batch, vehicle=vehicle, driver=driver, route_order=1,
+                                         total_distance_km=5, estimated_duration_minutes=0)
+        self.west = Route.objects.create(batch=self.batch, vehicle=vehicle, driver=driver, route_order=2,
+                                         total_distance_km=5, estimated_duration_minutes=0)
+        for order, lng in enumerate([-69.92, -69.90, -69.88], 1):
+            Stop.objects.create(route=self.east, delivery=self.add_delivery(18.50, lng), stop_order=order)
+        for order, lng in enumerate([-69.94, -69.96], 1):
+            Stop.objects.create(route=self.west, delivery=self.add_delivery(DEPOT[0], lng), stop_order=order)
+        self.client.force_login(self.user)
+
+    def add_delivery(self, lat, lng, **kwargs):
+        return Delivery.objects.create(batch=self.batch, customer=self.customer, address='Calle Test',
+                                       coordinates={'lat': lat, 'lng': lng}, **kwargs)
+
+    def test_insert_delivery_updates_only_affected_route(self):
+        """Test insertar una entrega reordena solo la ruta afectada"""
+        delivery = self.add_delivery(18.505, -69.89, earliest_time=time(8), latest_time=time(18))
+        url = f'/api/delivery-batches/{self.batch.id}/insert-delivery/'
+        response = self.client.post(url, {'delivery_id': str(delivery.id)}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['route_id'], str(self.east.id))
+        self.assertEqual(response.json()['stop_order'], 3)
+        sequence = list(self.east.stops.order_by('stop_order').values_list('delivery_id', 'stop_order'))
+        self.assertEqual([order for _, order in sequence], [1, 2, 3, 4])
+        self.assertEqual(sequence[2][0], delivery.id)
+        self.assertEqual(list(self.west.stops.values_list('stop_order', flat=True).order_by('stop_order')), [1, 2])
+        self.east.refresh_from_db()
+        self.assertGreater(self.east.total_distance_km, 5)
+
+        response = self.client.post(url, {'delivery_id': str(delivery.id)}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_insert_delivery_assigns_and_sets_etas(self):
+        """Test la entrega insertada queda asignada y ella y las paradas siguientes reciben ETA"""
+        midnight = timezone.make_aware(datetime.combine(self.batch.delivery_date, datetime.min.time()))
+        for order, stop in enumerate(self.east.stops.order_by('stop_order'), 1):
+            stop.estimated_arrival_time = midnight + timedelta(hours=9, minutes=10 * order)
+            stop.save()
+        delivery = self.add_delivery(18.505, -69.89)
+
+        stop = insert_delivery(self.batch, delivery)
+
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.status, 'assigned')
+        etas = list(self.east.stops.order_by('stop_order').values_list('estimated_arrival_time', flat=True))
+        self.assertEqual(etas[:2], [midnight + timedelta(hours=9, minutes=10 * order) for order in (1, 2)])
+        self.assertEqual(etas[stop.stop_order - 1], stop.estimated_arrival_time)
+        self.assertGreater(stop.estimated_arrival_time, etas[1])
+        self.assertGreater(etas[3], stop.estimated_arrival_time)
+
+    def test_insert_delivery_locks_batch_and_routes(self):
+        """Test la inserción bloquea el lote y sus rutas antes de leerlas"""
+        delivery = self.add_delivery(18.505, -69.89)
+        with patch.object(QuerySet, 'select_for_update', autospec=True,
+                          side_effect=QuerySet.select_for_update) as select_for_update:
+            insert_delivery(self.batch, delivery)
+
+        locked = [call.args[0].model for call in select_for_update.call_args_list]
+        self.assertEqual(locked, [DeliveryBatch, Route])
+
+    def test_insert_delivery_twice_returns_existing_stop(self):
+        """Test si la entrega ya se insertó mientras se esperaba el bloqueo no se duplica"""
+        delivery = self.add_delivery(18.505, -69.89)
+        stop = insert_delivery(self.batch, delivery)
+
+        self.assertEqual(insert_delivery(self.batch, delivery), stop)
+        self.assertEqual(self.east.stops.count() + self.west.stops.count(), 6)
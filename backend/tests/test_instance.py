@@ -0,0 +1,49 @@
+from datetime import date, time
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from apps.core.models import Customer, DeliveryBatch, Delivery
+from apps.optimization.services.instance import ProblemInstance
+
+User = get_user_model()
+
+
+class ProblemInstanceTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        self.customer = Customer.objects.create(owner=user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(
+            owner=user,
+            name='Lote Test',
+            delivery_date=date.today(),
+            depot_address='Almacén',
+            depot_coordinates={'lat': 18.4861, 'lng': -69.9312},
+        )
+
+    def add_delivery(self, coordinates, **kwargs):
+        return Delivery.objects.create(batch=self.batch, customer=self.customer, address='Calle Test',
+                                       coordinates=coordinates, **kwargs)
+
+    def test_compiles_nodes_in_one_query(self):
+        """Test la instancia omite entregas sin coordenadas y mapea cada nodo a su entrega"""
+        first = self.add_delivery({'lat': 18.45, 'lng': -69.90})
+        self.add_delivery(None)
+        last = self.add_delivery({'lat': 18.50, 'lng': -69.88}, earliest_time=time(9), latest_time=time(11))
+
+        with self.assertNumQueries(1):
+            instance = ProblemInstance.from_batch(self.batch)
+
+        self.assertEqual(instance.num_nodes, 3)
+        self.assertEqual(instance.coordinates.tolist(), [[18.4861, -69.9312], [18.45, -69.90], [18.50, -69.88]])
+        self.assertEqual([instance.delivery_id(1), instance.delivery_id(2)], [first.id, last.id])
+        self.assertEqual((instance.node_of(last.id), instance.node_of(first.id)), (2, 1))
+        self.assertEqual(instance.demands.tolist(), [0, 1, 1])
+        self.assertEqual(instance.time_windows, [None, None, (540, 660)])
+
+    def test_no_time_windows(self):
+        """Test sin horarios la instancia no impone ventanas al solver"""
+        self.add_delivery({'lat': 18.45, 'lng': -69.90})
+
+        instance = ProblemInstance.from_batch(self.batch)
+        self.assertIsNone(instance.time_windows)
+        self.assertIsNone(instance.node_of(self.batch.id))
@@ -0,0 +1,67 @@
+import os
+import pickle
+import tempfile
+import time
+from django.test import TestCase, override_settings
+import numpy as np
+from apps.optimization.services.matrix_store import MatrixStore, matrix_key, matrix_handle, attach_matrix
+from apps.optimization.services.route_optimizer import RouteOptimizer, build_distance_matrix, build_time_matrix
+
+class MatrixStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(OPTIMIZATION_MATRIX_DIR=self.tmp.name)
+        self.settings_override.enable()
+        self.coordinates = [(18.4861, -69.9312), (18.45, -69.90), (18.50, -69.88), (18.47, -69.95)]
+        self.lats, self.lngs = np.asarray(self.coordinates).T
+        self.builds = 0
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp.cleanup()
+
+    def build(self):
+        self.builds += 1
+        return build_distance_matrix(self.lats, self.lngs)
+
+    def test_matrix_is_built_once_and_memory_mapped(self):
+        """Test la matriz se construye una vez y luego se abre mapeada en memoria"""
+        key = matrix_key(self.coordinates, 'distance')
+        first = MatrixStore.get_or_build(key, self.build)
+        second = MatrixStore.get_or_build(key, self.build)
+
+        self.assertEqual(self.builds, 1)
+        self.assertIsInstance(second, np.memmap)
+        self.assertEqual(second.dtype, np.int32)
+        self.assertFalse(second.flags.writeable)
+        np.testing.assert_array_equal(first, build_distance_matrix(self.lats, self.lngs))
+        self.assertNotEqual(key, matrix_key(self.coordinates, 'time'))
+
+    def test_handle_is_lightweight_and_attaches_zero_copy(self):
+        """Test la referencia enviada a otros procesos es la ruta, no la matriz"""
+        matrix = MatrixStore.get_or_build(matrix_key(self.coordinates, 'distance'), self.build)
+        handle = matrix_handle(matrix)
+
+        self.assertLess(len(pickle.dumps(handle)), 200)
+        attached = attach_matrix(handle)
+        self.assertIsInstance(attached, np.memmap)
+        np.testing.assert_array_equal(attached, matrix)
+        # Las vistas parciales se envían como arreglo
+        self.assertIsInstance(matrix_handle(matrix[1:]), np.ndarray)
+        self.assertTrue(np.shares_memory(RouteOptimizer(matrix, build_time_matrix(matrix)).distance_matrix, matrix))
+
+    def test_least_recently_used_matrix_is_evicted(self):
+        """Test desalojo de la matriz usada hace más tiempo al superar el tamaño máximo"""
+        size = build_distance_matrix(self.lats, self.lngs).nbytes + 128  # datos + encabezado .npy
+        with override_settings(OPTIMIZATION_MATRIX_MAX_BYTES=2 * size):
+            keys = [matrix_key(self.coordinates, 'distance', variant=i) for i in range(3)]
+            for key in keys[:2]:
+                MatrixStore.get_or_build(key, self.build)
+                time.sleep(0.01)
+            MatrixStore.get_or_build(keys[0], self.build)  # uso reciente
+            time.sleep(0.01)
+            MatrixStore.get_or_build(keys[2], self.build)
+
+        stored = set(os.listdir(self.tmp.name))
+        self.assertEqual(stored, {f'{keys[0]}.npy', f'{keys[2]}.npy'})
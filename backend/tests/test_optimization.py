@@ -1,5 +1,28 @@
-from django.test import TestCase
-from apps.optimization.services.route_optimizer import RouteOptimizer, create_distance_matrix_from_coordinates
+import os
+import tempfile
+from datetime import date, datetime, time, timedelta
+from unittest.mock import patch
+from django.core.cache import cache
+from django.utils import timezone
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+import numpy as np
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Delivery, Route, Stop
+from apps.optimization.tasks import optimize_batch_task
+from apps.optimization.services.cancellation import OptimizationRuns, CancellationCheck
+from apps.optimization.benchmarks import random_coordinates
+from apps.optimization.services.candidate_graph import CandidateGraph
+from apps.optimization.services.speed_model import SpeedTable
+from apps.optimization.services.route_optimizer import (
+    RouteOptimizer,
+    _matrix_rows,
+    SOLVER_PRESETS,
+    compute_time_budget,
+    build_distance_matrix,
+    build_warm_start_routes,
+    create_distance_matrix_from_coordinates,
+    haversine_distance,
+)
 
 class RouteOptimizerTestCase(TestCase):
     
@@ -33,6 +56,34 @@ class RouteOptimizerTestCase(TestCase):
         self.assertIsNotNone(result)
         self.assertLessEqual(len(result['routes']), 2)
     
+    def test_arrivals_follow_time_dimension(self):
+        """Test las llegadas salen de la dimensión de tiempo y respetan las ventanas"""
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        route = optimizer.optimize(num_vehicles=1, preset='fast')['routes'][0]
+        stops = route['stops']
+        travel = [self.time_matrix[a][b] for a, b in zip(stops[:-1], stops[1:])]
+        self.assertEqual(route['arrivals'], [0] + list(np.cumsum(travel)))
+
+        # La parada 2 abre más tarde de lo que se tarda en llegar: hay espera
+        time_windows = [(480, 1440), None, (700, 720), None]
+        route = optimizer.optimize(num_vehicles=1, time_windows=time_windows, preset='fast')['routes'][0]
+        self.assertEqual(len(route['arrivals']), len(route['stops']))
+        self.assertGreaterEqual(route['arrivals'][0], 480)
+        self.assertTrue(700 <= route['arrivals'][route['stops'].index(2)] <= 720)
+        self.assertEqual(route['arrivals'], sorted(route['arrivals']))
+
+    def test_vehicles_leave_at_departure(self):
+        """Test con o sin ventanas las llegadas parten de la hora de salida"""
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        route = optimizer.optimize(num_vehicles=1, preset='fast', departure=480)['routes'][0]
+        self.assertEqual(route['arrivals'][0], 480)
+
+        time_windows = [None, None, (600, 720), None]
+        route = optimizer.optimize(num_vehicles=1, time_windows=time_windows, preset='fast',
+                                   departure=480)['routes'][0]
+        self.assertTrue(all(arrival >= 480 for arrival in route['arrivals']))
+        self.assertTrue(600 <= route['arrivals'][route['stops'].index(2)] <= 720)
+
     def test_distance_matrix_creation(self):
         """Test creación de matriz de distancias"""
         matrix = create_distance_matrix_from_coordinates(self.coordinates)
@@ -40,3 +91,374 @@ class RouteOptimizerTestCase(TestCase):
         self.assertEqual(len(matrix), len(self.coordinates))
         self.assertEqual(len(matrix[0]), len(self.coordinates))
         self.assertEqual(matrix[0][0], 0)  # Distancia a sí mismo = 0
+
+    def test_vectorized_matrix_matches_haversine(self):
+        """Test matriz vectorizada coincide con haversine escalar"""
+        coords = np.array(self.coordinates)
+        matrix = build_distance_matrix(coords[:, 0], coords[:, 1])
+
+        self.assertEqual(matrix.dtype, np.int32)
+        for i, (lat1, lng1) in enumerate(self.coordinates):
+            for j, (lat2, lng2) in enumerate(self.coordinates):
+                expected = 0 if i == j else int(haversine_distance(lat1, lng1, lat2, lng2) * 1000)
+                self.assertLessEqual(abs(int(matrix[i, j]) - expected), 1)
+
+    def test_vectorized_matrix_row_blocks(self):
+        """Test procesamiento por bloques produce la misma matriz"""
+        rng = np.random.default_rng(42)
+        lats = 18.45 + rng.random(50) * 0.1
+        lngs = -69.95 + rng.random(50) * 0.1
+
+        full = build_distance_matrix(lats, lngs)
+        blocked = build_distance_matrix(lats, lngs, block_cells=120)
+
+        np.testing.assert_array_equal(full, blocked)
+        np.testing.assert_array_equal(full, full.T)
+
+    def test_matrix_rows_share_python_ints(self):
+        """Test la lista para OR-Tools reutiliza un entero por valor en lugar de uno por celda"""
+        matrix = build_distance_matrix(*zip(*self.coordinates))
+        rows = _matrix_rows(matrix, block_cells=len(matrix))
+
+        self.assertEqual(rows, matrix.tolist())
+        self.assertGreater(rows[0][1], 256)  # fuera de la caché de enteros pequeños de Python
+        self.assertIs(rows[0][1], rows[1][0])
+        self.assertEqual(_matrix_rows(np.array([[0, -1], [-1, 0]])), [[0, -1], [-1, 0]])
+
+    def test_matrix_and_callback_evaluators_agree(self):
+        """Test evaluadores nativos y callbacks producen el mismo costo"""
+        results = []
+        for use_matrix in (True, False):
+            optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix, use_matrix_evaluators=use_matrix)
+            results.append(optimizer.optimize(
+                num_vehicles=1,
+                vehicle_capacities=[10],
+                time_windows=[(0, 1440)] * len(self.coordinates),
+                time_limit=1,
+            ))
+
+        self.assertIsNotNone(results[0])
+        self.assertEqual(results[0]['objective_value'], results[1]['objective_value'])
+        self.assertEqual(results[0]['routes'][0]['stops'], results[1]['routes'][0]['stops'])
+
+    def test_custom_cost_callback(self):
+        """Test costo personalizado usa el callback de Python"""
+        calls = []
+
+        def cost(from_node, to_node):
+            calls.append((from_node, to_node))
+            return 1
+
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        result = optimizer.optimize(num_vehicles=1, time_limit=1, cost_callback=cost)
+
+        self.assertIsNotNone(result)
+        self.assertTrue(calls)
+        self.assertEqual(result['objective_value'], len(self.coordinates))
+
+    def test_time_budget_scales_with_instance_size(self):
+        """Test presupuesto de tiempo crece con el tamaño y respeta el preset"""
+        small, _ = compute_time_budget(13, 'balanced')
+        large, _ = compute_time_budget(2001, 'balanced')
+
+        self.assertLess(small, 5)
+        self.assertGreater(large, 30)
+        self.assertLessEqual(large, SOLVER_PRESETS['balanced']['max_seconds'])
+        self.assertLess(compute_time_budget(500, 'fast')[0], compute_time_budget(500, 'thorough')[0])
+
+    def test_plateau_stops_search_early(self):
+        """Test búsqueda se detiene cuando el objetivo se estanca"""
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        result = optimizer.optimize(num_vehicles=1, preset='fast')
+
+        self.assertIsNotNone(result)
+        self.assertEqual(optimizer.search_stats['stop_reason'], 'plateau')
+        self.assertLess(optimizer.search_stats['wall_time_ms'], 1000)
+
+    def test_progress_events_are_throttled(self):
+        """Test eventos de progreso: objetivo decreciente y a lo sumo uno por intervalo"""
+        coordinates = [(18.40 + (i % 7) * 0.02, -69.98 + (i // 7) * 0.02) for i in range(30)]
+        distance_matrix = create_distance_matrix_from_coordinates(coordinates)
+        optimizer = RouteOptimizer(distance_matrix, [[d // 50 for d in row] for row in distance_matrix])
+        events = []
+        result = optimizer.optimize(num_vehicles=3, time_limit=2, progress_callback=events.append)
+
+        self.assertIsNotNone(result)
+        self.assertTrue(events)
+        self.assertEqual(events[-1]['objective'], result['objective_value'])
+        objectives = [event['objective'] for event in events]
+        self.assertEqual(objectives, sorted(objectives, reverse=True))
+        # Intervalo de 1s en una búsqueda de 2s: primera mejora, ~2 más y la final
+        self.assertLessEqual(len(events), 5)
+        for event in events:
+            self.assertTrue(1 <= event['routes_used'] <= 3)
+
+    def test_drop_penalty_returns_partial_solution(self):
+        """Test con penalización por descarte una parada imposible no invalida la solución"""
+        # Cliente 2 debe atenderse antes de llegar a él desde el depósito
+        time_windows = [None, None, (0, 1), None]
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        self.assertIsNone(optimizer.optimize(num_vehicles=1, time_windows=time_windows, time_limit=1))
+
+        result = optimizer.optimize(num_vehicles=1, time_windows=time_windows, preset='fast', drop_penalty=100000)
+        self.assertIsNotNone(result)
+        self.assertEqual(result['unassigned'], [2])
+        self.assertEqual(sorted(result['routes'][0]['stops'][1:-1]), [1, 3])
+
+    def test_vehicle_starts_from_current_position(self):
+        """Test cada vehículo sale de su nodo de inicio y regresa al depósito"""
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        result = optimizer.optimize(num_vehicles=2, vehicle_starts=[1, 2], preset='fast')
+
+        # Un vehículo sin paradas pendientes vuelve directo y no se reporta
+        self.assertTrue(all(route['stops'][0] in (1, 2) for route in result['routes']))
+        self.assertTrue(all(route['stops'][-1] == 0 for route in result['routes']))
+        visited = [node for route in result['routes'] for node in route['stops'][1:-1]]
+        self.assertEqual(visited, [3])
+
+    def test_portfolio_keeps_best_strategy(self):
+        """Test modo portafolio ejecuta varias estrategias y conserva la mejor"""
+        strategies = [
+            ('PATH_CHEAPEST_ARC', 'GUIDED_LOCAL_SEARCH'),
+            ('SAVINGS', 'TABU_SEARCH'),
+            ('CHRISTOFIDES', 'GUIDED_LOCAL_SEARCH'),
+        ]
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        result = optimizer.optimize_portfolio(num_vehicles=1, strategies=strategies, processes=3, time_limit=1)
+
+        self.assertIsNotNone(result)
+        portfolio = optimizer.search_stats['portfolio']
+        self.assertEqual(len(portfolio), 3)
+        self.assertEqual(result['objective_value'], min(run['objective'] for run in portfolio))
+
+    def test_warm_start_routes_repair(self):
+        """Test reparación de solución previa: quita nodos eliminados e inserta nuevos"""
+        previous = [[3, 1], [7]]  # el nodo 7 ya no existe
+        routes = build_warm_start_routes(previous, len(self.coordinates), 2, self.distance_matrix)
+
+        self.assertEqual(len(routes), 2)
+        self.assertEqual(sorted(node for route in routes for node in route), [1, 2, 3])
+        # El orden relativo de los nodos conservados se mantiene
+        kept = [node for node in routes[0] if node in (1, 3)]
+        self.assertEqual(kept, [3, 1])
+
+    def test_warm_start_routes_respect_capacity(self):
+        """Test las paradas que exceden la capacidad actual se reinsertan en otro vehículo"""
+        routes = build_warm_start_routes([[3, 2, 1]], len(self.coordinates), 2, self.distance_matrix,
+                                         vehicle_capacities=[2, 2])
+
+        self.assertEqual(routes[0], [3, 2])
+        self.assertEqual(routes[1], [1])
+        self.assertIsNone(build_warm_start_routes([[3, 2, 1]], len(self.coordinates), 2, self.distance_matrix,
+                                                  vehicle_capacities=[1, 1]))
+
+    def test_optimize_from_initial_routes(self):
+        """Test optimización partiendo de una solución previa"""
+        optimizer = RouteOptimizer(self.distance_matrix, self.time_matrix)
+        result = optimizer.optimize(num_vehicles=1, preset='fast', initial_routes=[[3, 2, 1]])
+
+        self.assertIsNotNone(result)
+        self.assertTrue(optimizer.search_stats['warm_start'])
+        self.assertEqual(sorted(result['routes'][0]['stops'][1:-1]), [1, 2, 3])
+
+
+User = get_user_model()
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OPTIMIZATION_MATRIX_DIR=os.path.join(tempfile.gettempdir(), 'test-optimization-matrices'),
+)
+class OptimizeBatchTaskTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        Vehicle.objects.create(owner=self.user, name='Moto 1', vehicle_type='motorcycle')
+        Driver.objects.create(owner=self.user, name='Juan', phone='8090000000')
+        self.customer = Customer.objects.create(owner=self.user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(
+            owner=self.user,
+            name='Lote Test',
+            delivery_date=date.today(),
+            depot_address='Almacén',
+            depot_coordinates={'lat': 18.4861, 'lng': -69.9312}
+        )
+        for lat, lng in [(18.45, -69.90), (18.50, -69.88), (18.47, -69.95)]:
+            self.add_delivery(lat, lng)
+
+    def add_delivery(self, lat, lng):
+        return Delivery.objects.create(
+            batch=self.batch,
+            customer=self.customer,
+            address='Calle Test',
+            coordinates={'lat': lat, 'lng': lng}
+        )
+
+    def test_incremental_reoptimization(self):
+        """Test re-optimización incremental conserva y completa las rutas"""
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'ready')
+        self.assertEqual(Stop.objects.filter(route__batch=self.batch).count(), 3)
+
+        new_delivery = self.add_delivery(18.49, -69.92)
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast', incremental=True))
+
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'ready')
+        stops = Stop.objects.filter(route__batch=self.batch)
+        self.assertEqual(stops.count(), 4)
+        self.assertTrue(stops.filter(delivery=new_delivery).exists())
+        for route in self.batch.routes.all():
+            orders = list(route.stops.order_by('stop_order').values_list('stop_order', flat=True))
+            self.assertEqual(orders, list(range(1, len(orders) + 1)))
+
+    def test_incremental_warm_start_fits_current_capacity(self):
+        """Test si las rutas previas exceden la capacidad actual la re-optimización sigue partiendo de ellas"""
+        vehicle = Vehicle.objects.get(owner=self.user)
+        route = Route.objects.create(batch=self.batch, vehicle=vehicle, driver=Driver.objects.get(owner=self.user),
+                                     route_order=1, total_distance_km=5,
+                                     estimated_duration_minutes=0)
+        for order, delivery in enumerate(self.batch.deliveries.all(), 1):
+            Stop.objects.create(route=route, delivery=delivery, stop_order=order)
+        Vehicle.objects.filter(id=vehicle.id).update(max_stops=2)
+
+        with patch.object(RouteOptimizer, 'optimize', autospec=True, side_effect=RouteOptimizer.optimize) as solve:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast', incremental=True))
+
+        optimizer, kwargs = solve.call_args.args[0], solve.call_args.kwargs
+        self.assertTrue(all(len(stops) <= 2 for stops in kwargs['initial_routes']))
+        self.assertTrue(optimizer.search_stats['warm_start'])
+        self.assertTrue(all(route.stops.count() <= 2 for route in self.batch.routes.all()))
+
+    def test_large_batch_uses_candidate_arcs(self):
+        """Test los lotes sobre el umbral se resuelven con el grafo de arcos candidatos"""
+        with patch('apps.optimization.tasks.CANDIDATE_ARCS_THRESHOLD', 2), \
+                patch('apps.optimization.tasks.CandidateGraph', wraps=CandidateGraph) as graph:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+
+        graph.assert_called_once()
+        self.assertEqual(Stop.objects.filter(route__batch=self.batch).count(), 3)
+
+    def test_stops_get_estimated_arrival_times(self):
+        """Test la tarea guarda la ETA de cada parada y la duración en minutos"""
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+
+        self.batch.refresh_from_db()
+        stops = Stop.objects.filter(route__batch=self.batch).order_by('route__route_order', 'stop_order')
+        departure = timezone.make_aware(datetime.combine(self.batch.delivery_date, datetime.min.time()))
+        departure += timedelta(hours=8)
+        for route in self.batch.routes.all():
+            etas = [stop.estimated_arrival_time for stop in stops if stop.route_id == route.id]
+            self.assertTrue(all(eta > departure for eta in etas))
+            self.assertEqual(etas, sorted(etas))
+            self.assertGreaterEqual(route.estimated_duration_minutes, (etas[-1] - departure).total_seconds() // 60)
+        self.assertEqual(self.batch.estimated_duration_minutes,
+                         sum(route.estimated_duration_minutes for route in self.batch.routes.all()))
+
+    def test_stops_without_window_leave_at_departure(self):
+        """Test con una entrega con horario las demás no reciben ETAs de madrugada"""
+        self.batch.deliveries.filter(coordinates__lat=18.50).update(earliest_time=time(10, 0),
+                                                                   latest_time=time(12, 0))
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+
+        midnight = timezone.make_aware(datetime.combine(self.batch.delivery_date, datetime.min.time()))
+        for stop in Stop.objects.filter(route__batch=self.batch).select_related('delivery'):
+            self.assertGreater(stop.estimated_arrival_time, midnight + timedelta(hours=8))
+            if stop.delivery.earliest_time:
+                self.assertGreaterEqual(stop.estimated_arrival_time, midnight + timedelta(hours=10))
+
+    def test_unchanged_batch_uses_cached_solution(self):
+        """Test re-optimizar un lote sin cambios usa la solución en caché"""
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+
+        with patch.object(RouteOptimizer, 'optimize', return_value=None) as mock_optimize:
+            self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+            mock_optimize.assert_not_called()
+
+            self.add_delivery(18.49, -69.92)
+            optimize_batch_task(str(self.batch.id), preset='fast')
+            mock_optimize.assert_called_once()
+
+    def test_new_speed_table_invalidates_cached_solution(self):
+        """Test una tabla de velocidades nueva vuelve a resolver un lote sin cambios"""
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+
+        table = SpeedTable(['motorcycle'], [], np.zeros((1, 24, 0)), np.full((1, 24), np.nan), [300.0], 250.0)
+        with patch('apps.optimization.tasks.load_speed_table', return_value=table), \
+                patch.object(RouteOptimizer, 'optimize', return_value=None) as mock_optimize:
+            optimize_batch_task(str(self.batch.id), preset='fast')
+            mock_optimize.assert_called_once()
+
+    def test_optimization_status_exposes_progress(self):
+        """Test el estado de optimización incluye la curva de convergencia"""
+        self.client.force_login(self.user)
+        url = f'/api/delivery-batches/{self.batch.id}/optimization/'
+        self.assertIsNone(self.client.get(url).json()['progress'])
+
+        self.assertTrue(optimize_batch_task(str(self.batch.id), preset='fast'))
+
+        data = self.client.get(url).json()
+        self.assertEqual(data['status'], 'ready')
+        self.assertTrue(data['progress']['events'])
+        self.assertEqual(data['progress']['latest'], data['progress']['events'][-1])
+        self.assertIn('routes_used', data['progress']['latest'])
+
+    def test_cancelled_run_stops_solver(self):
+        """Test una corrida cancelada detiene la búsqueda en menos de un segundo"""
+        coordinates = [(18.40 + (i % 7) * 0.02, -69.98 + (i // 7) * 0.02) for i in range(30)]
+        distance_matrix = create_distance_matrix_from_coordinates(coordinates)
+        optimizer = RouteOptimizer(distance_matrix, [[d // 50 for d in row] for row in distance_matrix])
+
+        # Cancelada al encontrar la primera solución: se conserva la mejor encontrada
+        run_id = OptimizationRuns.start(self.batch.id)
+        result = optimizer.optimize(num_vehicles=2, time_limit=10, stop_check=CancellationCheck(self.batch.id, run_id),
+                                    progress_callback=lambda event: OptimizationRuns.cancel(self.batch.id))
+
+        self.assertIsNotNone(result)
+        self.assertEqual(optimizer.search_stats['stop_reason'], 'cancelled')
+        self.assertLess(optimizer.search_stats['wall_time_ms'], 1000)
+
+    def test_cancelled_run_stops_before_first_solution(self):
+        """Test la cancelación también detiene la construcción de la primera solución"""
+        lats, lngs = random_coordinates(400, seed=1)
+        distance_matrix = build_distance_matrix(lats, lngs)
+        optimizer = RouteOptimizer(distance_matrix, distance_matrix // 50)
+
+        run_id = OptimizationRuns.start(self.batch.id)
+        OptimizationRuns.cancel(self.batch.id)
+        result = optimizer.optimize(num_vehicles=4, time_limit=10,
+                                    first_solution_strategy='PARALLEL_CHEAPEST_INSERTION',
+                                    stop_check=CancellationCheck(self.batch.id, run_id))
+
+        self.assertIsNone(result)
+        self.assertEqual(optimizer.search_stats['stop_reason'], 'cancelled')
+        self.assertLess(optimizer.search_stats['wall_time_ms'], 1000)
+
+    def test_superseded_run_does_not_save_routes(self):
+        """Test una corrida reemplazada por otra más nueva no guarda rutas"""
+        stale_run = OptimizationRuns.start(self.batch.id)
+        OptimizationRuns.start(self.batch.id)
+
+        self.assertFalse(optimize_batch_task(str(self.batch.id), preset='fast', run_id=stale_run))
+        self.assertFalse(self.batch.routes.exists())
+        self.assertEqual(OptimizationRuns.state(self.batch.id, stale_run), 'superseded')
+
+    def test_cancel_optimization_endpoint(self):
+        """Test cancelar una optimización en curso desde la API"""
+        self.client.force_login(self.user)
+        url = f'/api/delivery-batches/{self.batch.id}/cancel-optimization/'
+        self.assertEqual(self.client.post(url).status_code, 400)
+
+        run_id = OptimizationRuns.start(self.batch.id)
+        self.batch.status = 'optimizing'
+        self.batch.save()
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'draft')
+        self.assertEqual(OptimizationRuns.state(self.batch.id, run_id), 'cancelled')
+        self.assertFalse(optimize_batch_task(str(self.batch.id), preset='fast', run_id=run_id))
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'draft')
@@ -0,0 +1,104 @@
+from datetime import date, datetime, timedelta
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Delivery, Route, Stop
+from apps.optimization.services.instance import ProblemInstance
+from apps.optimization.services.persistence import save_solution
+
+User = get_user_model()
+
+
+class SaveSolutionTestCase(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        Vehicle.objects.create(owner=user, name='Moto 1', vehicle_type='motorcycle')
+        Driver.objects.create(owner=user, name='Juan', phone='8090000000')
+        self.customer = Customer.objects.create(owner=user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(owner=user, name='Lote Test', delivery_date=date.today(),
+                                                  depot_address='Almacén',
+                                                  depot_coordinates={'lat': 18.4861, 'lng': -69.9312})
+        self.origin = timezone.make_aware(datetime.combine(date.today(), datetime.min.time()))
+
+    def add_deliveries(self, count):
+        Delivery.objects.bulk_create([
+            Delivery(batch=self.batch, customer=self.customer, address='Calle Test',
+                     coordinates={'lat': 18.45 + i * 0.001, 'lng': -69.90})
+            for i in range(count)
+        ])
+        return ProblemInstance.from_batch(self.batch)
+
+    def solution(self, instance, unassigned=()):
+        """Dos rutas que se reparten los nodos asignados"""
+        nodes = [node for node in range(1, instance.num_nodes) if node not in unassigned]
+        routes = []
+        for vehicle_id, route_nodes in enumerate((nodes[::2], nodes[1::2])):
+            routes.append({
+                'vehicle_id': vehicle_id,
+                'stops': [0] + route_nodes + [0],
+                'arrivals': list(range(0, 10 * (len(route_nodes) + 2), 10)),
+                'total_distance': 5000,
+                'total_time': 60,
+            })
+        return {'routes': routes, 'unassigned': list(unassigned), 'total_distance': 10000, 'total_time': 120}
+
+    def test_writes_routes_stops_and_statuses(self):
+        """Test la solución guarda rutas, paradas con ETA y el estado de cada entrega"""
+        instance = self.add_deliveries(5)
+        save_solution(self.batch, instance, self.solution(instance, unassigned=[5]), self.origin)
+
+        self.assertEqual(Route.objects.filter(batch=self.batch).count(), 2)
+        first = Stop.objects.get(delivery_id=instance.delivery_id(1))
+        self.assertEqual((first.stop_order, first.estimated_arrival_time), (1, self.origin + timedelta(minutes=10)))
+        statuses = dict(self.batch.deliveries.values_list('id', 'status'))
+        self.assertEqual(statuses.pop(instance.delivery_id(5)), 'pending')
+        self.assertEqual(set(statuses.values()), {'assigned'})
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'ready')
+        self.assertEqual(self.batch.unassigned_deliveries, [str(instance.delivery_id(5))])
+
+    def test_query_count_does_not_grow_with_stops(self):
+        """Test reemplazar las rutas cuesta las mismas consultas con 4 o 60 paradas"""
+        counts = []
+        for size in (4, 60):
+            Delivery.objects.all().delete()
+            instance = self.add_deliveries(size)
+            save_solution(self.batch, instance, self.solution(instance), self.origin)
+            with CaptureQueriesContext(connection) as queries:
+                save_solution(self.batch, instance, self.solution(instance), self.origin)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+        # Flota (2), savepoint (2), borrado en cascada (4), rutas, paradas, entregas y lote
+        with self.assertNumQueries(12):
+            save_solution(self.batch, instance, self.solution(instance), self.origin)
+        self.assertEqual(Stop.objects.filter(route__batch=self.batch).count(), 60)
+
+    def test_cancelled_run_writes_nothing(self):
+        """Test si la corrida ya no está activa al bloquear el lote no se escribe nada"""
+        instance = self.add_deliveries(4)
+        self.assertIsNone(save_solution(self.batch, instance, self.solution(instance), self.origin,
+                                        should_persist=lambda: False))
+
+        self.assertFalse(Route.objects.filter(batch=self.batch).exists())
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.status, 'draft')
+        self.assertEqual(set(self.batch.deliveries.values_list('status', flat=True)), {'pending'})
+
+    def test_failure_leaves_previous_routes(self):
+        """Test si la escritura falla no quedan rutas a medias"""
+        instance = self.add_deliveries(4)
+        save_solution(self.batch, instance, self.solution(instance), self.origin)
+        previous = set(Route.objects.filter(batch=self.batch).values_list('id', flat=True))
+
+        broken = self.solution(instance)
+        broken['routes'][1]['stops'] = [0, 1, 0]  # entrega repetida: viola la unicidad de Stop.delivery
+        broken['routes'][1]['arrivals'] = [0, 10, 20]
+        with self.assertRaises(IntegrityError):
+            save_solution(self.batch, instance, broken, self.origin)
+
+        self.assertEqual(set(Route.objects.filter(batch=self.batch).values_list('id', flat=True)), previous)
+        self.assertEqual(Stop.objects.filter(route__batch=self.batch).count(), 4)
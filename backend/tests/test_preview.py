@@ -0,0 +1,84 @@
+import time
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+import numpy as np
+from apps.optimization.benchmarks import synthetic_instance
+from apps.optimization.services.preview import preview_routes, two_opt, or_opt, MAX_PREVIEW_VEHICLES
+from apps.optimization.services.route_optimizer import build_distance_matrix
+
+User = get_user_model()
+
+
+class PreviewRoutesTestCase(TestCase):
+
+    def test_two_opt_removes_crossing(self):
+        """Test 2-opt elimina un cruce de arcos"""
+        # Cuadrado recorrido en diagonal: 0 -> 2 -> 1 -> 3 -> 0 se cruza
+        lats = np.array([0.0, 0.0, 0.01, 0.01])
+        lngs = np.array([0.0, 0.01, 0.0, 0.01])
+        matrix = build_distance_matrix(lats, lngs).astype(np.int64)
+        crossing = np.array([0, 3, 1, 2, 0])
+        improved = two_opt(crossing, matrix, time.monotonic() + 1)
+
+        cost = lambda tour: matrix[tour[:-1], tour[1:]].sum()
+        self.assertLess(cost(improved), cost(crossing))
+        self.assertEqual(sorted(improved[1:-1].tolist()), [1, 2, 3])
+
+    def test_or_opt_never_worsens(self):
+        """Test Or-opt conserva las paradas y no empeora el recorrido"""
+        lats, lngs = synthetic_instance(40, seed=5)
+        matrix = build_distance_matrix(lats, lngs).astype(np.int64)
+        tour = np.concatenate(([0], np.random.default_rng(5).permutation(np.arange(1, 41)), [0]))
+        improved = or_opt(tour, matrix, time.monotonic() + 1)
+
+        cost = lambda t: matrix[t[:-1], t[1:]].sum()
+        self.assertLess(cost(improved), cost(tour))
+        self.assertEqual(sorted(improved[1:-1].tolist()), list(range(1, 41)))
+
+    def test_preview_within_latency_budget(self):
+        """Test vista previa de 200 paradas en menos de 300 ms"""
+        lats, lngs = synthetic_instance(200, seed=1)
+        started = time.perf_counter()
+        result = preview_routes(list(zip(lats, lngs)), num_vehicles=3)
+        elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.3)
+        stops = sorted(node for route in result['routes'] for node in route['stops'][1:-1])
+        self.assertEqual(stops, list(range(1, 201)))
+        self.assertEqual(result['unassigned'], [])
+
+    def test_preview_endpoint(self):
+        """Test endpoint de vista previa devuelve rutas con índices de parada"""
+        user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        self.client.force_login(user)
+        payload = {
+            'depot': {'lat': 18.4861, 'lng': -69.9312},
+            'stops': [{'lat': 18.45, 'lng': -69.90}, {'lat': 18.50, 'lng': -69.88}, {'lat': 18.47, 'lng': -69.95}],
+            'num_vehicles': 2,
+        }
+        response = self.client.post('/api/routes/preview/', payload, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        stops = sorted(stop for route in response.json()['routes'] for stop in route['stops'])
+        self.assertEqual(stops, [0, 1, 2])
+
+        payload['stops'] = [{'lat': 18.45}]
+        response = self.client.post('/api/routes/preview/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_preview_rejects_too_many_vehicles(self):
+        """Test vista previa rechaza más vehículos que paradas o que el máximo"""
+        user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        self.client.force_login(user)
+        stops = [{'lat': 18.45 + i * 0.001, 'lng': -69.90} for i in range(MAX_PREVIEW_VEHICLES + 1)]
+        payload = {'depot': {'lat': 18.4861, 'lng': -69.9312}, 'stops': stops[:3], 'num_vehicles': 4}
+        response = self.client.post('/api/routes/preview/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        payload.update(stops=stops, num_vehicles=MAX_PREVIEW_VEHICLES + 1)
+        response = self.client.post('/api/routes/preview/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        payload['num_vehicles'] = 3
+        response = self.client.post('/api/routes/preview/', payload, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
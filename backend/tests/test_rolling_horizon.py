@@ -0,0 +1,100 @@
+import os
+import tempfile
+from datetime import date
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Delivery, Route, Stop, LocationUpdate
+from apps.optimization.services.rolling_horizon import reoptimize_in_progress
+
+User = get_user_model()
+
+DEPOT = (18.4861, -69.9312)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OPTIMIZATION_MATRIX_DIR=os.path.join(tempfile.gettempdir(), 'test-optimization-matrices'),
+)
+class RollingHorizonTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        vehicle = Vehicle.objects.create(owner=self.user, name='Moto 1', vehicle_type='motorcycle')
+        self.driver = Driver.objects.create(owner=self.user, name='Juan', phone='8090000000')
+        self.customer = Customer.objects.create(owner=self.user, name='Cliente', phone='8091111111')
+        self.batch = DeliveryBatch.objects.create(
+            owner=self.user,
+            name='Lote Test',
+            delivery_date=date.today(),
+            depot_address='Almacén',
+            depot_coordinates={'lat': DEPOT[0], 'lng': DEPOT[1]},
+            status='in_progress',
+        )
+        self.route = Route.objects.create(batch=self.batch, vehicle=vehicle, driver=self.driver, route_order=1,
+                                          total_distance_km=5, estimated_duration_minutes=0, status='in_progress')
+        # Ya entregadas las dos primeras; las pendientes quedaron en orden inverso
+        self.stops = []
+        for order, lng in enumerate([-69.92, -69.91, -69.87, -69.89, -69.88], 1):
+            stop = Stop.objects.create(route=self.route, delivery=self.add_delivery(18.50, lng), stop_order=order)
+            self.stops.append(stop)
+        Stop.objects.filter(id__in=[self.stops[0].id, self.stops[1].id]).update(status='delivered')
+
+    def add_delivery(self, lat, lng):
+        return Delivery.objects.create(batch=self.batch, customer=self.customer, address='Calle Test',
+                                       coordinates={'lat': lat, 'lng': lng})
+
+    def test_reoptimizes_only_pending_suffix(self):
+        """Test las paradas entregadas quedan fijas y el sufijo sale de la ubicación actual"""
+        LocationUpdate.objects.create(route=self.route, driver=self.driver, latitude=18.50, longitude=-69.905)
+        new_delivery = self.add_delivery(18.50, -69.885)
+
+        result = reoptimize_in_progress(self.batch, time_limit=1)
+
+        self.assertEqual(result['rescheduled'], 4)
+        self.assertEqual(result['unassigned'], [])
+        sequence = list(self.route.stops.order_by('stop_order').values_list('delivery_id', 'stop_order'))
+        self.assertEqual([order for _, order in sequence], [1, 2, 3, 4, 5, 6])
+        self.assertEqual([delivery for delivery, _ in sequence[:2]],
+                         [self.stops[0].delivery_id, self.stops[1].delivery_id])
+        # Hacia el este desde la posición actual y regreso al depósito
+        self.assertEqual([delivery for delivery, _ in sequence[2:]], [
+            self.stops[3].delivery_id, new_delivery.id, self.stops[4].delivery_id, self.stops[2].delivery_id,
+        ])
+        etas = list(self.route.stops.filter(stop_order__gt=2).order_by('stop_order')
+                    .values_list('estimated_arrival_time', flat=True))
+        self.assertTrue(all(etas))
+        self.assertEqual(etas, sorted(etas))
+
+    def test_drops_deliveries_beyond_remaining_capacity(self):
+        """Test las entregas que ya no caben en el vehículo quedan sin asignar"""
+        Vehicle.objects.filter(id=self.route.vehicle_id).update(max_stops=5)
+        new_delivery = self.add_delivery(18.60, -69.70)
+
+        result = reoptimize_in_progress(self.batch, time_limit=1)
+
+        self.assertEqual(result['unassigned'], [str(new_delivery.id)])
+        self.assertEqual(self.route.stops.count(), 5)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.unassigned_deliveries, [str(new_delivery.id)])
+
+    def test_dropped_delivery_is_planned_again(self):
+        """Test una entrega descartada vuelve a pendiente y se planifica al liberarse capacidad"""
+        Delivery.objects.filter(batch=self.batch).update(status='assigned')
+        Vehicle.objects.filter(id=self.route.vehicle_id).update(max_stops=4)
+
+        result = reoptimize_in_progress(self.batch, time_limit=1)
+
+        self.assertEqual(len(result['unassigned']), 1)
+        dropped = Delivery.objects.get(id=result['unassigned'][0])
+        self.assertEqual(dropped.status, 'pending')
+        self.assertFalse(Stop.objects.filter(delivery=dropped).exists())
+
+        Vehicle.objects.filter(id=self.route.vehicle_id).update(max_stops=5)
+        result = reoptimize_in_progress(self.batch, time_limit=1)
+
+        self.assertEqual(result['unassigned'], [])
+        dropped.refresh_from_db()
+        self.assertEqual(dropped.status, 'assigned')
+        self.assertTrue(Stop.objects.filter(delivery=dropped, route=self.route).exists())
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.unassigned_deliveries, [])
@@ -0,0 +1,129 @@
+import os
+import tempfile
+from datetime import date
+from io import StringIO
+from unittest.mock import patch
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+import numpy as np
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Delivery
+from apps.optimization.tasks import optimize_batch_task
+from apps.optimization.services.snapshots import save_snapshot, load_snapshot, replay_snapshot
+from apps.optimization.services.route_optimizer import RouteOptimizer, build_distance_matrix, build_time_matrix
+from apps.optimization.services.candidate_graph import CANDIDATE_FIRST_SOLUTION, DEFAULT_NEIGHBORS
+
+User = get_user_model()
+
+COORDINATES = [(18.4861, -69.9312), (18.45, -69.90), (18.50, -69.88), (18.47, -69.95)]
+
+
+class SnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        lats, lngs = zip(*COORDINATES)
+        self.distance_matrix = build_distance_matrix(lats, lngs)
+        self.time_matrix = build_time_matrix(self.distance_matrix)
+
+    def test_round_trip(self):
+        """Test la instantánea conserva matrices, ventanas, capacidades y rutas iniciales"""
+        path = save_snapshot(
+            self.directory, self.distance_matrix, self.time_matrix,
+            {'num_vehicles': 2, 'preset': 'fast', 'drop_penalty': None},
+            time_windows=[None, (480, 600), None, (0, 720)],
+            vehicle_capacities=[2, 3],
+            initial_routes=[[1, 2], [3]],
+            label='lote',
+        )
+        snapshot = load_snapshot(path)
+
+        self.assertTrue(os.path.basename(path).startswith('lote-'))
+        np.testing.assert_array_equal(snapshot['distance_matrix'], self.distance_matrix)
+        self.assertEqual(snapshot['time_windows'], [None, (480, 600), None, (0, 720)])
+        self.assertEqual(snapshot['vehicle_capacities'], [2, 3])
+        self.assertEqual(snapshot['initial_routes'], [[1, 2], [3]])
+        self.assertEqual(snapshot['params']['num_vehicles'], 2)
+
+        result, stats = replay_snapshot(snapshot, time_limit=1)
+        self.assertEqual(sorted(node for route in result['routes'] for node in route['stops'][1:-1]), [1, 2, 3])
+        self.assertIn('stop_reason', stats)
+
+    def test_replay_command_profiles(self):
+        """Test el comando reproduce la instantánea bajo cProfile"""
+        path = save_snapshot(self.directory, self.distance_matrix, self.time_matrix,
+                             {'num_vehicles': 1, 'preset': 'balanced'})
+        profile_path = os.path.join(self.directory, 'replay.prof')
+        out = StringIO()
+        call_command('replay_snapshot', path, '--preset', 'fast', '--profile',
+                     '--profile-output', profile_path, stdout=out)
+
+        self.assertIn('objective', out.getvalue())
+        self.assertIn('function calls', out.getvalue())
+        self.assertTrue(os.path.exists(profile_path))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    OPTIMIZATION_MATRIX_DIR=os.path.join(tempfile.gettempdir(), 'test-optimization-matrices'),
+    OPTIMIZATION_SNAPSHOT_DIR=tempfile.mkdtemp(),
+)
+class SnapshotTaskTestCase(TestCase):
+
+    def test_task_dumps_instance_without_pii(self):
+        """Test la tarea guarda la instancia sin coordenadas ni datos de clientes"""
+        cache.clear()
+        user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        Vehicle.objects.create(owner=user, name='Moto 1', vehicle_type='motorcycle')
+        Driver.objects.create(owner=user, name='Juan', phone='8090000000')
+        customer = Customer.objects.create(owner=user, name='Cliente', phone='8091111111')
+        batch = DeliveryBatch.objects.create(owner=user, name='Lote Test', delivery_date=date.today(),
+                                             depot_address='Almacén',
+                                             depot_coordinates={'lat': COORDINATES[0][0], 'lng': COORDINATES[0][1]})
+        for lat, lng in COORDINATES[1:]:
+            Delivery.objects.create(batch=batch, customer=customer, address='Calle Test',
+                                    coordinates={'lat': lat, 'lng': lng})
+
+        self.assertTrue(optimize_batch_task(str(batch.id), preset='fast', snapshot=True))
+
+        files = os.listdir(settings.OPTIMIZATION_SNAPSHOT_DIR)
+        self.assertEqual(len(files), 1)
+        with np.load(os.path.join(settings.OPTIMIZATION_SNAPSHOT_DIR, files[0])) as data:
+            self.assertNotIn('coordinates', data.files)
+            self.assertNotIn('Cliente', str(data['params']))
+            self.assertEqual(data['distance_matrix'].shape, (4, 4))
+
+    def test_replay_reproduces_candidate_arcs_search(self):
+        """Test sobre el umbral la instantánea guarda arcos candidatos y estrategia y la réplica los usa"""
+        cache.clear()
+        user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        Vehicle.objects.create(owner=user, name='Moto 1', vehicle_type='motorcycle')
+        Driver.objects.create(owner=user, name='Juan', phone='8090000000')
+        customer = Customer.objects.create(owner=user, name='Cliente', phone='8091111111')
+        batch = DeliveryBatch.objects.create(owner=user, name='Lote Test', delivery_date=date.today(),
+                                             depot_address='Almacén',
+                                             depot_coordinates={'lat': COORDINATES[0][0], 'lng': COORDINATES[0][1]})
+        for lat, lng in COORDINATES[1:]:
+            Delivery.objects.create(batch=batch, customer=customer, address='Calle Test',
+                                    coordinates={'lat': lat, 'lng': lng})
+
+        directory = tempfile.mkdtemp()
+        with self.settings(OPTIMIZATION_SNAPSHOT_DIR=directory), \
+                patch('apps.optimization.tasks.CANDIDATE_ARCS_THRESHOLD', 2), \
+                patch.object(RouteOptimizer, 'optimize', autospec=True, side_effect=RouteOptimizer.optimize) as solve:
+            self.assertTrue(optimize_batch_task(str(batch.id), preset='fast', snapshot=True))
+        production = solve.call_args.kwargs
+
+        snapshot = load_snapshot(os.path.join(directory, os.listdir(directory)[0]))
+        self.assertEqual(snapshot['params']['first_solution_strategy'], CANDIDATE_FIRST_SOLUTION)
+        self.assertEqual(snapshot['params']['candidate_k'], DEFAULT_NEIGHBORS)
+        self.assertEqual(snapshot['candidate_arcs'], production['candidate_arcs'])
+
+        with patch.object(RouteOptimizer, 'optimize', autospec=True, side_effect=RouteOptimizer.optimize) as solve:
+            result, _ = replay_snapshot(snapshot, time_limit=1)
+        self.assertIsNotNone(result)
+        replayed = solve.call_args.kwargs
+        self.assertEqual(replayed['candidate_arcs'], production['candidate_arcs'])
+        self.assertEqual(replayed['first_solution_strategy'], CANDIDATE_FIRST_SOLUTION)
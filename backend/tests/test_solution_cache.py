@@ -0,0 +1,76 @@
+import threading
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from unittest.mock import patch
+from apps.optimization.services.solution_cache import (
+    INDEX_KEY,
+    INDEX_LOCK_KEY,
+    SolutionCache,
+    problem_key,
+)
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+@override_settings(CACHES=LOCMEM_CACHE, OPTIMIZATION_CACHE_MAX_ENTRIES=2)
+class SolutionCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.coordinates = [(18.4861, -69.9312), (18.45, -69.90), (18.50, -69.88)]
+        self.result = {'routes': [], 'total_distance': 10, 'total_time': 1, 'objective_value': 10}
+
+    def test_key_changes_with_any_input(self):
+        """Test la clave cambia si cambia cualquier dato del problema"""
+        base = problem_key(self.coordinates, 2, [10, 10], None, 'balanced')
+
+        self.assertEqual(base, problem_key(list(self.coordinates), 2, [10, 10], None, 'balanced'))
+        moved = [self.coordinates[0], (18.4501, -69.90), self.coordinates[2]]
+        self.assertNotEqual(base, problem_key(moved, 2, [10, 10], None, 'balanced'))
+        self.assertNotEqual(base, problem_key(self.coordinates, 3, [10, 10, 10], None, 'balanced'))
+        self.assertNotEqual(base, problem_key(self.coordinates, 2, [10, 5], None, 'balanced'))
+        self.assertNotEqual(base, problem_key(self.coordinates, 2, [10, 10], [(0, 600)] * 3, 'balanced'))
+        self.assertNotEqual(base, problem_key(self.coordinates, 2, [10, 10], None, 'fast'))
+        self.assertNotEqual(base, problem_key(self.coordinates, 2, [10, 10], None, 'balanced', departure=600))
+        self.assertNotEqual(base, problem_key(self.coordinates, 2, [10, 10], None, 'balanced', vehicle_type='car'))
+        self.assertNotEqual(base, problem_key(self.coordinates, 2, [10, 10], None, 'balanced', speeds='abc123'))
+
+    def test_hit_and_lru_eviction(self):
+        """Test acierto de caché y desalojo de la entrada menos usada"""
+        SolutionCache.set('a', self.result)
+        SolutionCache.set('b', self.result)
+        self.assertEqual(SolutionCache.get('a'), self.result)  # 'a' pasa a ser la más reciente
+
+        SolutionCache.set('c', self.result)
+
+        self.assertIsNone(SolutionCache.get('b'))
+        self.assertIsNotNone(SolutionCache.get('a'))
+        self.assertIsNotNone(SolutionCache.get('c'))
+
+    @patch('apps.optimization.services.solution_cache.cache.get', side_effect=ConnectionError('redis down'))
+    def test_unavailable_cache_is_a_miss(self, mock_get):
+        """Test caché no disponible se trata como fallo sin romper la optimización"""
+        self.assertIsNone(SolutionCache.get('a'))
+
+    @override_settings(OPTIMIZATION_CACHE_MAX_ENTRIES=100)
+    def test_concurrent_writes_keep_every_key(self):
+        """Test escrituras simultáneas no pierden claves del índice LRU"""
+        threads = [threading.Thread(target=SolutionCache.set, args=(f'key-{i}', self.result)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(cache.get(INDEX_KEY)), sorted(f'key-{i}' for i in range(20)))
+        self.assertIsNone(cache.get(INDEX_LOCK_KEY))
+
+    @patch('apps.optimization.services.solution_cache.INDEX_LOCK_WAIT', 0.05)
+    def test_busy_index_is_left_untouched(self):
+        """Test si otro proceso tiene el candado la solución se guarda sin tocar el índice"""
+        SolutionCache.set('a', self.result)
+        cache.set(INDEX_LOCK_KEY, 'other-worker', 5)
+
+        SolutionCache.set('b', self.result)
+
+        self.assertEqual(SolutionCache.get('b'), self.result)
+        self.assertEqual(cache.get(INDEX_KEY), ['a'])
+        self.assertEqual(cache.get(INDEX_LOCK_KEY), 'other-worker')
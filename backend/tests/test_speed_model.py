@@ -0,0 +1,84 @@
+import os
+import tempfile
+from datetime import date
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+import numpy as np
+from apps.core.models import Vehicle, Driver, Customer, DeliveryBatch, Route, LocationUpdate
+from apps.optimization.services.route_optimizer import build_distance_matrix, build_time_matrix
+from apps.optimization.services.speed_model import (
+    SpeedTable,
+    build_vehicle_time_matrix,
+    geohash_cells,
+    load_speed_table,
+    KMH_TO_M_PER_MIN,
+)
+
+User = get_user_model()
+
+
+class SpeedModelTestCase(TestCase):
+
+    def test_geohash_cells_match_reference(self):
+        """Test las celdas coinciden con el geohash estándar"""
+        base32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+        cell = geohash_cells([18.4861], [-69.9312])[0]
+        self.assertEqual(''.join(base32[(cell >> (5 * i)) & 31] for i in range(4, -1, -1)), 'd7q30')
+
+    def test_lookup_falls_back_by_level(self):
+        """Test sin muestras en la celda se usa la hora, luego el tipo y luego el promedio global"""
+        rng = np.random.default_rng(0)
+        n = 40
+        table = SpeedTable.aggregate(
+            ['motorcycle'] * n + ['van'] * 5,
+            [8] * n + [8] * 5,
+            np.concatenate((18.48 + rng.random(n) * 0.001, np.full(5, 18.48))),
+            np.full(n + 5, -69.93),
+            [30.0] * n + [10.0] * 5,
+        )
+        lats, lngs = [18.4805, 19.45], [-69.93, -70.69]
+
+        np.testing.assert_allclose(table.node_speeds(lats, lngs, 'motorcycle', 8), 30 * KMH_TO_M_PER_MIN)
+        np.testing.assert_allclose(table.node_speeds(lats, lngs, 'motorcycle', 14), 30 * KMH_TO_M_PER_MIN)
+        np.testing.assert_allclose(table.node_speeds(lats, lngs, 'van', 8), table.global_speed)
+        self.assertAlmostEqual(table.global_speed, (30 * n + 50) / (n + 5) * KMH_TO_M_PER_MIN)
+
+    def test_vehicle_time_matrix(self):
+        """Test la matriz de tiempos usa el ritmo de ambos extremos de cada arco"""
+        lats, lngs = [18.4861, 18.45, 18.50], [-69.9312, -69.90, -69.88]
+        distance_matrix = build_distance_matrix(lats, lngs)
+        np.testing.assert_array_equal(build_vehicle_time_matrix(distance_matrix, lats, lngs),
+                                      build_time_matrix(distance_matrix))
+
+        table = SpeedTable(['car'], [], np.zeros((1, 24, 0)), np.full((1, 24), np.nan), [500.0], 250.0)
+        matrix = build_vehicle_time_matrix(distance_matrix, lats, lngs, 'car', 8, table, block_cells=3)
+        np.testing.assert_array_equal(matrix, (distance_matrix / 500).astype(np.int32))
+        self.assertEqual(matrix.dtype, np.int32)
+
+
+@override_settings(OPTIMIZATION_SPEED_TABLE_PATH=os.path.join(tempfile.mkdtemp(), 'speed_table.npz'))
+class BuildSpeedTableCommandTestCase(TestCase):
+
+    def test_command_aggregates_gps_history(self):
+        """Test el comando agrega el historial GPS y la tabla se puede cargar"""
+        user = User.objects.create_user(username='dispatcher', password='testpass123', business_name='Test')
+        vehicle = Vehicle.objects.create(owner=user, name='Moto 1', vehicle_type='motorcycle')
+        driver = Driver.objects.create(owner=user, name='Juan', phone='8090000000')
+        Customer.objects.create(owner=user, name='Cliente', phone='8091111111')
+        batch = DeliveryBatch.objects.create(owner=user, name='Lote', delivery_date=date.today(),
+                                             depot_address='Almacén', depot_coordinates={'lat': 18.48, 'lng': -69.93})
+        route = Route.objects.create(batch=batch, vehicle=vehicle, driver=driver, route_order=1,
+                                     total_distance_km=0, estimated_duration_minutes=0)
+        LocationUpdate.objects.bulk_create([
+            LocationUpdate(route=route, driver=driver, latitude=18.48, longitude=-69.93, speed=speed)
+            for speed in [24.0] * 10 + [0.0, 300.0]
+        ])
+
+        self.assertIsNone(load_speed_table())
+        call_command('build_speed_table', '--min-samples', '5', stdout=open(os.devnull, 'w'))
+
+        table = load_speed_table()
+        self.assertEqual(table.vehicle_types, ['motorcycle'])
+        # Paradas y lecturas imposibles no cuentan
+        self.assertAlmostEqual(table.global_speed, 24 * KMH_TO_M_PER_MIN, places=3)
@@ -3,24 +3,31 @@ import api from '../api/client';
 
 export function useOptimizationStatus(batchId, interval = 3000) {
   const [status, setStatus] = useState('optimizing');
+  const [progress, setProgress] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     const poll = async () => {
       try {
-        const response = await api.get(`/delivery-batches/${batchId}/`);
+        const response = await api.get(`/delivery-batches/${batchId}/optimization/`);
         setStatus(response.data.status);
-        if (['ready', 'failed'].includes(response.data.status)) {
+        // { latest, events }: mejor objetivo, tiempo y rutas usadas en cada mejora
+        setProgress(response.data.progress);
+        // Cualquier estado distinto de 'optimizing' es final (ready, draft si se canceló o falló, ...)
+        if (response.data.status !== 'optimizing') {
+          clearInterval(id);
           setLoading(false);
         }
       } catch (err) {
+        clearInterval(id);
         setLoading(false);
       }
     };
 
+    setLoading(true);
     const id = setInterval(poll, interval);
     return () => clearInterval(id);
-  }, [batchId]);
+  }, [batchId, interval]);
 
-  return { status, loading };
+  return { status, progress, loading };
 }